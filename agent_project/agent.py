@@ -5,13 +5,8 @@ from typing import Optional, List, Dict
 
 import pandas as pd
 
-try:
-    from openai import OpenAI
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    HAS_OPENAI = True
-except Exception:
-    client = None
-    HAS_OPENAI = False
+from llm_gateway import HAS_OPENAI, get_gateway, llm_configured
+from prompt_builder import build_insight_prompt, build_summary_prompt
 
 
 def local_summarize(df: pd.DataFrame, question: str) -> str:
@@ -46,45 +41,95 @@ def local_summarize(df: pd.DataFrame, question: str) -> str:
     return result if result else "Data retrieved successfully."
 
 
-def summarize_dataframe(df: pd.DataFrame, question: str, max_rows: int = 12, context: Optional[str] = None) -> str:
-    """Analyze data and provide intelligent insights about trends, anomalies, and business implications."""
+# Each LLM entry point is written once as a generator "flow": it yields the
+# gateway request, receives the reply (or the call's exception is thrown into it)
+# and returns the final result.  ``_run`` drives a flow with blocking calls and
+# ``_arun`` with awaited ones, so the sync and async variants cannot drift apart.
+def _run(flow):
+    reply, error = None, None
+    while True:
+        try:
+            request = flow.throw(error) if error is not None else flow.send(reply)
+        except StopIteration as done:
+            return done.value
+        try:
+            reply, error = get_gateway().complete(**request), None
+        except Exception as exc:
+            reply, error = None, exc
+
+
+async def _arun(flow):
+    reply, error = None, None
+    while True:
+        try:
+            request = flow.throw(error) if error is not None else flow.send(reply)
+        except StopIteration as done:
+            return done.value
+        try:
+            reply, error = await get_gateway().acomplete(**request), None
+        except Exception as exc:
+            reply, error = None, exc
+
+
+def _summary_flow(df: pd.DataFrame, question: str, max_rows: int, context: Optional[str]):
+    """Returns ``(summary, source)`` with ``source`` ``'llm'`` or ``'fallback'``, as in the stream."""
     if df.empty:
-        return "No data available for analysis."
+        return "No data available for analysis.", 'fallback'
 
-    api_key = os.getenv('OPENAI_API_KEY')
-    if HAS_OPENAI and api_key and api_key.startswith('sk-'):
+    if llm_configured():
         try:
-            sample = df.head(max_rows).to_csv(index=False)
-            stats = df.describe(include='all').to_string()
-            context_block = f"\n\nAdditional business context:\n{context}\n" if context else ""
-            prompt = f"""You are a sales analyst. Analyze this data and answer the question.
-
-Dataset (first {max_rows} rows):
-{sample}
-
-Summary statistics:
-{stats}
-
-Question: {question}
-{context_block}
-
-Provide a concise analysis (4-6 sentences) including:
-- Key trends or patterns
-- Notable changes or anomalies
-- Business implications
-- Specific numbers where relevant"""
-
-            resp = client.chat.completions.create(
-                model=os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=400,
-                timeout=10
-            )
-            return resp.choices[0].message.content.strip()
+            prompt = build_summary_prompt(df, question, max_rows=max_rows, context=context)
+            text = (yield dict(prompt=prompt, max_tokens=400, timeout=10, route='summary')) or ''
+            if text.strip():
+                return text, 'llm'
         except Exception:
             pass
 
-    return analyze_patterns(df, question, context)
+    return analyze_patterns(df, question, context), 'fallback'
+
+
+def summarize_dataframe(df: pd.DataFrame, question: str, max_rows: int = 12, context: Optional[str] = None,
+                        with_source: bool = False):
+    """Analyze data and provide intelligent insights about trends, anomalies, and business implications.
+
+    With ``with_source`` returns ``(summary, source)`` so callers can tell an LLM answer from the fallback.
+    """
+    summary, source = _run(_summary_flow(df, question, max_rows, context))
+    return (summary, source) if with_source else summary
+
+
+async def summarize_dataframe_async(df: pd.DataFrame, question: str, max_rows: int = 12,
+                                    context: Optional[str] = None, with_source: bool = False):
+    """Async ``summarize_dataframe``: awaits the LLM instead of holding a worker thread."""
+    summary, source = await _arun(_summary_flow(df, question, max_rows, context))
+    return (summary, source) if with_source else summary
+
+
+async def summarize_dataframe_stream(df: pd.DataFrame, question: str, max_rows: int = 12,
+                                     context: Optional[str] = None):
+    """Yield ``(event, data)``: the heuristic placeholder, LLM tokens, then the final summary."""
+    if df.empty:
+        text = "No data available for analysis."
+        yield 'placeholder', {'summary': text}
+        yield 'done', {'summary': text, 'source': 'fallback'}
+        return
+
+    placeholder = analyze_patterns(df, question, context)
+    yield 'placeholder', {'summary': placeholder}
+    parts = []
+    if llm_configured():
+        try:
+            prompt = build_summary_prompt(df, question, max_rows=max_rows, context=context)
+            async for chunk in get_gateway().astream(prompt, max_tokens=400, timeout=30, route='summary'):
+                parts.append(chunk)
+                yield 'token', {'text': chunk}
+        except Exception:
+            parts = []
+    text = ''.join(parts).strip()
+    if text:
+        yield 'done', {'summary': text, 'source': 'llm'}
+    else:
+        yield 'done', {'summary': placeholder, 'source': 'fallback'}
 
 
 def analyze_patterns(df: pd.DataFrame, question: str, context: Optional[str] = None) -> str:
@@ -132,14 +177,7 @@ def analyze_patterns(df: pd.DataFrame, question: str, context: Optional[str] = N
     return ". ".join(insights) + "."
 
 
-def forecast_with_llm(history: List[Dict], months_ahead: int = 6, item_name: str = "product") -> Dict:
-    """Use the OpenAI model to generate numeric demand forecasts with explanation."""
-    if not HAS_OPENAI or client is None:
-        raise RuntimeError("LLM forecasting unavailable")
-    if not history:
-        raise ValueError("History is required for forecasting")
-
-    months_ahead = max(1, min(int(months_ahead), 12))
+def _forecast_prompt(history: List[Dict], months_ahead: int, item_name: str) -> str:
     formatted_history = []
     for row in history[-24:]:
         month = row['month']
@@ -147,7 +185,7 @@ def forecast_with_llm(history: List[Dict], months_ahead: int = 6, item_name: str
             month = month.strftime('%Y-%m')
         formatted_history.append(f"{month}: {float(row['units']):.0f}")
 
-    prompt = f"""You are a demand forecasting assistant. Given historical monthly units for a {item_name},
+    return f"""You are a demand forecasting assistant. Given historical monthly units for a {item_name},
 predict the next {months_ahead} months of units sold.
 
 History:
@@ -160,34 +198,59 @@ Return strictly JSON with the structure:
 }}
 Months must be consecutive calendar months immediately following the latest history month."""
 
+
+def _extract_json(text: str, what: str = "JSON object") -> Dict:
+    """Parse the outermost ``{...}`` block of an LLM reply."""
+    start = text.find('{')
+    end = text.rfind('}')
+    if start == -1 or end == -1:
+        raise ValueError(f"LLM response missing {what}")
+    return json.loads(text[start:end+1])
+
+
+def _parse_forecast(text: str, months_ahead: int) -> Dict:
+    parsed = _extract_json(text)
+    forecast_payload = parsed.get('forecast', [])
+    explanation = parsed.get('explanation', '').strip()
+    cleaned = []
+    for entry in forecast_payload[:months_ahead]:
+        month = entry.get('month')
+        units = float(entry.get('units', 0))
+        cleaned.append({'month': month, 'units': units})
+    if len(cleaned) != months_ahead:
+        raise ValueError("LLM returned incorrect number of months")
+    return {'forecast': cleaned, 'explanation': explanation}
+
+
+def _check_forecast_args(history: List[Dict], months_ahead: int) -> int:
+    if not llm_configured():
+        raise RuntimeError("LLM forecasting unavailable")
+    if not history:
+        raise ValueError("History is required for forecasting")
+    return max(1, min(int(months_ahead), 12))
+
+
+def _forecast_flow(history: List[Dict], months_ahead: int, item_name: str):
+    months_ahead = _check_forecast_args(history, months_ahead)
+    prompt = _forecast_prompt(history, months_ahead, item_name)
     try:
-        resp = client.chat.completions.create(
-            model=os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=200,
-            temperature=0.2,
-            timeout=10
-        )
-        text = resp.choices[0].message.content.strip()
-        start = text.find('{')
-        end = text.rfind('}')
-        if start == -1 or end == -1:
-            raise ValueError("LLM response missing JSON object")
-        parsed = json.loads(text[start:end+1])
-        forecast_payload = parsed.get('forecast', [])
-        explanation = parsed.get('explanation', '').strip()
-        cleaned = []
-        for entry in forecast_payload[:months_ahead]:
-            month = entry.get('month')
-            units = float(entry.get('units', 0))
-            cleaned.append({'month': month, 'units': units})
-        if len(cleaned) != months_ahead:
-            raise ValueError("LLM returned incorrect number of months")
-        return {'forecast': cleaned, 'explanation': explanation}
+        text = yield dict(prompt=prompt, max_tokens=200, temperature=0.2, timeout=10, route='forecast',
+                          validate=lambda reply: _parse_forecast(reply, months_ahead))
+        return _parse_forecast(text, months_ahead)
     except Exception as exc:
         raise RuntimeError(f"LLM forecast failed: {exc}")
 
 
+def forecast_with_llm(history: List[Dict], months_ahead: int = 6, item_name: str = "product") -> Dict:
+    """Use the OpenAI model to generate numeric demand forecasts with explanation."""
+    return _run(_forecast_flow(history, months_ahead, item_name))
+
+
+async def forecast_with_llm_async(history: List[Dict], months_ahead: int = 6, item_name: str = "product") -> Dict:
+    """Async ``forecast_with_llm``."""
+    return await _arun(_forecast_flow(history, months_ahead, item_name))
+
+
 def _format_currency(value) -> str:
     if value is None:
         return "$0"
@@ -241,83 +304,75 @@ def _fallback_customer_insight(customer_name: str,
     return {'insight': insight_text, 'highlights': highlights}
 
 
+def _parse_insight(content: str) -> Optional[Dict]:
+    parsed = _extract_json(content, "JSON block")
+    insight = parsed.get('insight', '').strip()
+    highlights = parsed.get('highlights', [])
+    if isinstance(highlights, str):
+        highlights = [highlights]
+    highlights = [h.strip() for h in highlights if h and isinstance(h, str)]
+    return {'insight': insight, 'highlights': highlights} if insight else None
+
+
+def _check_insight(content: str):
+    if not _parse_insight(content):
+        raise ValueError("LLM insight is empty")
+
+
+def _llm_insight_flow(customer_name: str, metrics: Dict, monthly: List[Dict], top_products: List[Dict],
+                      timeout: float = 10):
+    """The parsed LLM insight, or ``None`` when the LLM is unavailable or its reply unusable."""
+    if not llm_configured():
+        return None
+    try:
+        prompt = build_insight_prompt(customer_name, metrics, monthly, top_products)
+        content = yield dict(prompt=prompt, max_tokens=300, temperature=0.2, timeout=timeout, route='insight',
+                             validate=_check_insight)
+        return _parse_insight(content)
+    except Exception:
+        return None
+
+
+def _insight_flow(customer_name: str, metrics: Dict, monthly: List[Dict], top_products: List[Dict]):
+    result = yield from _llm_insight_flow(customer_name, metrics, monthly, top_products)
+    return result or _fallback_customer_insight(customer_name, metrics, monthly, top_products)
+
+
 def customer_insight_with_llm(customer_name: str,
                               metrics: Dict,
                               monthly: List[Dict],
                               top_products: List[Dict]) -> Dict:
     """Ask the LLM to craft a narrative about a single customer's performance."""
-    payload = {
-        'customer_name': customer_name,
-        'metrics': metrics,
-        'monthly': monthly[-12:],
-        'top_products': top_products[:5]
-    }
-    api_key = os.getenv('OPENAI_API_KEY')
-    if HAS_OPENAI and api_key and api_key.startswith('sk-'):
-        try:
-            prompt = f"""You are a senior PepsiCo sales strategist.
-Summarize the customer's performance using the JSON data block.
-Highlight revenue, profit, trends, and product contribution.
-Return strictly JSON with:
-{{
-  "insight": "3 sentences (<=90 words) referencing concrete numbers and months.",
-  "highlights": ["short bullet with a number", "another highlight"]
-}}
+    return _run(_insight_flow(customer_name, metrics, monthly, top_products))
 
-Data:
-{json.dumps(payload, indent=2)}
-"""
-            resp = client.chat.completions.create(
-                model=os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-                temperature=0.2,
-                timeout=10
-            )
-            content = resp.choices[0].message.content.strip()
-            start = content.find('{')
-            end = content.rfind('}')
-            if start == -1 or end == -1:
-                raise ValueError("LLM response missing JSON block")
-            parsed = json.loads(content[start:end+1])
-            insight = parsed.get('insight', '').strip()
-            highlights = parsed.get('highlights', [])
-            if isinstance(highlights, str):
-                highlights = [highlights]
-            highlights = [h.strip() for h in highlights if h and isinstance(h, str)]
-            if insight:
-                return {'insight': insight, 'highlights': highlights}
-        except Exception:
-            pass
-    return _fallback_customer_insight(customer_name, metrics, monthly, top_products)
 
+async def customer_insight_with_llm_async(customer_name: str,
+                                          metrics: Dict,
+                                          monthly: List[Dict],
+                                          top_products: List[Dict]) -> Dict:
+    """Async ``customer_insight_with_llm``."""
+    return await _arun(_insight_flow(customer_name, metrics, monthly, top_products))
 
-def generate_email_draft(
-    email_type: str,
-    recipient_name: str,
-    customer_data: Optional[Dict] = None,
-    additional_context: Optional[str] = None
-) -> Dict:
-    """
-    Generate professional email drafts using OpenAI based on email type and context.
-    
-    Args:
-        email_type: Type of email (payment_reminder, product_recommendation, appreciation, 
-                   follow_up, seasonal_promotion, order_confirmation, welcome, win_back)
-        recipient_name: Name of the recipient
-        customer_data: Dictionary with customer info (spending, products, overdue_amount, etc.)
-        additional_context: Any additional context for the email
-    
-    Returns:
-        Dict with subject, body (HTML), preview_text
+
+async def customer_insight_stream(customer_name: str,
+                                  metrics: Dict,
+                                  monthly: List[Dict],
+                                  top_products: List[Dict]):
+    """Yield ``(event, data)``: the local insight as a placeholder, then the parsed insight.
+
+    The LLM answers in JSON, so its raw tokens are not streamed; ``done`` carries the parsed result.
     """
-    if not HAS_OPENAI or client is None:
-        return generate_fallback_email(email_type, recipient_name, customer_data)
-    
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key or not api_key.startswith('sk-'):
-        return generate_fallback_email(email_type, recipient_name, customer_data)
-    
+    placeholder = _fallback_customer_insight(customer_name, metrics, monthly, top_products)
+    yield 'placeholder', placeholder
+    result = await _arun(_llm_insight_flow(customer_name, metrics, monthly, top_products, timeout=30))
+    if result:
+        yield 'done', {**result, 'source': 'llm'}
+    else:
+        yield 'done', {**placeholder, 'source': 'fallback'}
+
+
+def _email_prompt(email_type: str, recipient_name: str, customer_data: Dict,
+                  additional_context: Optional[str]) -> str:
     customer_data = customer_data or {}
     
     # Build context based on email type
@@ -369,7 +424,7 @@ def generate_email_draft(
     if additional_context:
         context_str += f" Additional context: {additional_context}"
     
-    prompt = f"""You are a professional email copywriter for PepsiCo. Write a compelling business email.
+    return f"""You are a professional email copywriter for PepsiCo. Write a compelling business email.
 
 Email Type: {email_type.replace('_', ' ').title()}
 Recipient: {recipient_name}
@@ -396,35 +451,62 @@ Return strictly JSON:
   "body": "...complete HTML email..."
 }}"""
 
+
+def _parse_email(text: str) -> Dict:
+    result = _extract_json(text, "JSON")
+    return {
+        'subject': result.get('subject', f'Message from PepsiCo'),
+        'preview_text': result.get('preview_text', ''),
+        'body': result.get('body', '<p>Email content</p>'),
+        'generated_by': 'openai'
+    }
+
+
+def _email_flow(email_type: str, recipient_name: str, customer_data: Optional[Dict],
+                additional_context: Optional[str]):
+    if not llm_configured():
+        return generate_fallback_email(email_type, recipient_name, customer_data)
+
+    prompt = _email_prompt(email_type, recipient_name, customer_data or {}, additional_context)
     try:
-        resp = client.chat.completions.create(
-            model=os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1500,
-            temperature=0.7,
-            timeout=15
-        )
-        text = resp.choices[0].message.content.strip()
-        
-        # Extract JSON from response
-        start = text.find('{')
-        end = text.rfind('}')
-        if start == -1 or end == -1:
-            raise ValueError("LLM response missing JSON")
-        
-        result = json.loads(text[start:end+1])
-        
-        return {
-            'subject': result.get('subject', f'Message from PepsiCo'),
-            'preview_text': result.get('preview_text', ''),
-            'body': result.get('body', '<p>Email content</p>'),
-            'generated_by': 'openai'
-        }
+        text = yield dict(prompt=prompt, max_tokens=1500, temperature=0.7, timeout=15, route='email',
+                          validate=_parse_email)
+        return _parse_email(text)
     except Exception as e:
         print(f"Email generation error: {e}")
         return generate_fallback_email(email_type, recipient_name, customer_data)
 
 
+def generate_email_draft(
+    email_type: str,
+    recipient_name: str,
+    customer_data: Optional[Dict] = None,
+    additional_context: Optional[str] = None
+) -> Dict:
+    """
+    Generate professional email drafts using OpenAI based on email type and context.
+    
+    Args:
+        email_type: Type of email (payment_reminder, product_recommendation, appreciation, 
+                   follow_up, seasonal_promotion, order_confirmation, welcome, win_back)
+        recipient_name: Name of the recipient
+        customer_data: Dictionary with customer info (spending, products, overdue_amount, etc.)
+        additional_context: Any additional context for the email
+    
+    Returns:
+        Dict with subject, body (HTML), preview_text
+    """
+    return _run(_email_flow(email_type, recipient_name, customer_data, additional_context))
+
+
+async def generate_email_draft_async(
+    email_type: str,
+    recipient_name: str,
+    customer_data: Optional[Dict] = None,
+    additional_context: Optional[str] = None
+) -> Dict:
+    """Async ``generate_email_draft``."""
+    return await _arun(_email_flow(email_type, recipient_name, customer_data, additional_context))
 
 
 def generate_fallback_email(email_type: str, recipient_name: str, customer_data: Optional[Dict] = None) -> Dict:
@@ -1,4 +1,10 @@
 import os
+import asyncio
+import json
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 from typing import Optional
 import pandas as pd
 import pyodbc
@@ -7,11 +13,27 @@ import plotly.io as pio
 from datetime import datetime
 import numpy as np
 
+from db_pool import ConnectionPool, get_pool
+from result_cache import cached, cached_monthly_series, resolve_series, invalidate as invalidate_cache
+from replica import InvoiceLineReplica
+from cube import SalesCube
+from prefix_index import DailyPrefixIndex
+from chart_cache import render_cached, write_image, defer_chart, deferred_chart_url
+from change_capture import ChangeTracker
+from forecasting import MODEL_DESCRIPTIONS, forecast_matrix, item_month_matrix, recent_mean, resolve_model
+from question_cache import invalidate_answers
+
 pio.kaleido.scope.default_format = "png"
 
+# Historical sales aggregates barely move, so they are cached for an hour by default;
+# name lookups a little less, and receivables (which depend on GETDATE()) only briefly.
+AGGREGATE_CACHE_TTL = float(os.getenv('ANALYTICS_CACHE_AGGREGATE_TTL', '3600'))
+LOOKUP_CACHE_TTL = float(os.getenv('ANALYTICS_CACHE_LOOKUP_TTL', '600'))
+RECEIVABLES_CACHE_TTL = float(os.getenv('ANALYTICS_CACHE_RECEIVABLES_TTL', '60'))
 
-def get_conn():
-    """Create a pyodbc connection using env vars.
+
+def _conn_str() -> str:
+    """Build the ODBC connection string from env vars.
 
     Required env vars: DB_DRIVER, DB_SERVER, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
     """
@@ -25,28 +47,334 @@ def get_conn():
     if not all([server, database, uid, pwd]):
         raise RuntimeError('Missing DB connection environment variables. Set DB_SERVER, DB_NAME, DB_USER, DB_PASSWORD')
 
-    conn_str = (
+    return (
         f"DRIVER={{{driver}}};"
         f"SERVER={server},{port};"
         f"DATABASE={database};"
         f"UID={uid};PWD={pwd};"
         f"Encrypt=yes;TrustServerCertificate=yes;"
     )
-    return pyodbc.connect(conn_str)
+
+
+def get_conn():
+    """Create a standalone (unpooled) pyodbc connection using env vars."""
+    return pyodbc.connect(_conn_str())
+
+
+def get_db_pool() -> ConnectionPool:
+    """Return the shared connection pool used by ``run_sql``.
+
+    Sized by DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE, idle connections are closed
+    after DB_POOL_IDLE_TIMEOUT seconds.
+    """
+    return get_pool(
+        _conn_str(),
+        min_size=int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+        max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+    )
+
+
+def warm_db_pool() -> int:
+    """Open the pool's minimum connections up front (called at app startup)."""
+    return get_db_pool().warm()
 
 
 def run_sql(query: str) -> pd.DataFrame:
-    conn = get_conn()
-    try:
+    with get_db_pool().connection() as conn:
         df = pd.read_sql(query, conn)
-    finally:
-        conn.close()
     return df
 
 
-def monthly_revenue(start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+_db_executor = None
+_db_executor_lock = threading.Lock()
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Bounded thread pool that runs blocking analytics calls for async callers.
+
+    Sized to DB_POOL_MAX_SIZE so every worker can hold a pooled connection
+    without queueing inside the pool itself.
+    """
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                thread_name_prefix='analytics-db',
+            )
+    return _db_executor
+
+
+async def run_db_call(fn, *args, **kwargs):
+    """Await a blocking analytics function without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def run_sql_async(query: str) -> pd.DataFrame:
+    return await run_db_call(run_sql, query)
+
+
+# One worker per concurrently running section: a request fans out up to four
+# sections, so the default serves eight overlapping requests without queueing.
+FANOUT_WORKERS = int(os.getenv('ANALYTICS_FANOUT_WORKERS', '32'))
+
+_fanout_executor = None
+_fanout_executor_lock = threading.Lock()
+_fanout_lock = threading.Lock()
+_fanout_stats = {'in_flight': 0, 'submitted': 0, 'rejected': 0, 'timed_out': 0}
+
+
+class FanOutBusy(RuntimeError):
+    """Every fan-out worker is busy, so the call was not started."""
+
+
+def get_fanout_executor() -> ThreadPoolExecutor:
+    """Worker pool for ``fan_out``; kept separate from the async executor so nested calls cannot deadlock."""
+    global _fanout_executor
+    with _fanout_executor_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(
+                max_workers=FANOUT_WORKERS,
+                thread_name_prefix='analytics-fanout',
+            )
+    return _fanout_executor
+
+
+def _fanout_done(_future):
+    with _fanout_lock:
+        _fanout_stats['in_flight'] -= 1
+
+
+def _fanout_submit(executor: ThreadPoolExecutor, name: str, fn):
+    """Start ``fn`` on a free worker, or return ``FanOutBusy`` rather than queue it behind other requests."""
+    with _fanout_lock:
+        if _fanout_stats['in_flight'] >= FANOUT_WORKERS:
+            _fanout_stats['rejected'] += 1
+            return FanOutBusy(f'{name} not started: all {FANOUT_WORKERS} fan-out workers are busy')
+        _fanout_stats['in_flight'] += 1
+        _fanout_stats['submitted'] += 1
+    try:
+        future = executor.submit(fn)
+    except Exception as exc:
+        _fanout_done(None)
+        return exc
+    future.add_done_callback(_fanout_done)
+    return future
+
+
+def fan_out(calls: dict, timeout: Optional[float] = None) -> dict:
+    """Run independent zero-argument callables concurrently.
+
+    Returns ``{name: result}`` in the order of ``calls``. A call that raised maps
+    to its exception, one that found every worker busy to ``FanOutBusy``, and
+    one still running when ``timeout`` seconds elapse to a ``TimeoutError``, so
+    callers can keep whatever sections did finish.  Calls never wait in a
+    queue, so ``timeout`` only counts running time.  A timed-out call cannot be
+    stopped: it keeps its worker until it returns and is counted in
+    ``fanout_stats()``.
+    """
+    executor = get_fanout_executor()
+    started = {name: _fanout_submit(executor, name, fn) for name, fn in calls.items()}
+    futures = [f for f in started.values() if not isinstance(f, BaseException)]
+    wait_futures(futures, timeout=timeout)
+    results, abandoned = {}, []
+    for name, future in started.items():
+        if isinstance(future, BaseException):
+            results[name] = future
+        elif not future.done():
+            abandoned.append(name)
+            results[name] = TimeoutError(f'{name} did not finish within {timeout}s')
+        else:
+            exc = future.exception()
+            results[name] = exc if exc is not None else future.result()
+    if abandoned:
+        with _fanout_lock:
+            _fanout_stats['timed_out'] += len(abandoned)
+        print(f"[WARN] fan_out gave up on {', '.join(abandoned)} after {timeout}s; still running in the background")
+    return results
+
+
+def fanout_stats() -> dict:
+    with _fanout_lock:
+        return {'workers': FANOUT_WORKERS, **_fanout_stats}
+
+
+def run_sql_batch(queries: list) -> list:
+    """Run several SELECT statements in a single round trip.
+
+    The statements are sent as one batch and each result set is read back by
+    walking ``cursor.nextset()``, so N queries cost one network RTT instead of N.
+    Returns one DataFrame per statement, in order.
+    """
+    if not queries:
+        return []
+    statements = [q.strip().rstrip(';') for q in queries]
+    # NOCOUNT stops row-count messages from showing up as extra (empty) result sets.
+    batch = "SET NOCOUNT ON;\n" + ";\n".join(statements) + ";"
+    frames = []
+    with get_db_pool().connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(batch)
+            while True:
+                if cursor.description is not None:
+                    columns = [col[0] for col in cursor.description]
+                    rows = [tuple(row) for row in cursor.fetchall()]
+                    frames.append(pd.DataFrame.from_records(rows, columns=columns, coerce_float=True))
+                if not cursor.nextset():
+                    break
+        finally:
+            cursor.close()
+    if len(frames) != len(statements):
+        raise RuntimeError(f'Batch returned {len(frames)} result sets for {len(statements)} statements')
+    return frames
+
+
+# =======================
+# Local query engines
+# =======================
+
+# Comma-separated engines tried in order before SQL, e.g. ANALYTICS_ENGINE=cube,prefix.
+# "sql" (the default) keeps every call on the database.
+ANALYTICS_ENGINES = [name.strip() for name in os.getenv('ANALYTICS_ENGINE', 'sql').split(',') if name.strip()]
+# How often change capture polls for new/edited invoices; 0 disables it.
+CHANGE_CAPTURE_INTERVAL = float(os.getenv('CHANGE_CAPTURE_INTERVAL', '300'))
+
+_ENGINE_FACTORIES = {
+    'replica': lambda: InvoiceLineReplica(run_sql),
+    'cube': lambda: SalesCube(run_sql),
+    'prefix': lambda: DailyPrefixIndex(run_sql),
+}
+_engines = {}
+_engines_lock = threading.Lock()
+_change_tracker = None
+_engines_started = False
+
+
+def get_local_engines() -> list:
+    """Configured in-process engines, created on first use (not necessarily loaded yet)."""
+    engines = []
+    with _engines_lock:
+        for name in ANALYTICS_ENGINES:
+            factory = _ENGINE_FACTORIES.get(name)
+            if factory is None:
+                continue
+            if name not in _engines:
+                _engines[name] = factory()
+            engines.append(_engines[name])
+    return engines
+
+
+def warm_local_engines():
+    """Load every configured engine; failures leave that engine on the SQL fallback."""
+    for engine in get_local_engines():
+        if not engine.ready:
+            try:
+                engine.load()
+            except Exception as exc:
+                print(f"[WARN] {type(engine).__name__} load failed: {exc}")
+
+
+def get_change_tracker() -> ChangeTracker:
+    global _change_tracker
+    with _engines_lock:
+        if _change_tracker is None:
+            _change_tracker = ChangeTracker(run_sql)
+    return _change_tracker
+
+
+def _invalidate_on_change(changes: dict):
+    """Change-capture consumer: drop cached results the delta may have made stale."""
+    if 'Sales.Invoices' in changes or 'Sales.InvoiceLines' in changes:
+        invalidate_cache()
+        invalidate_answers()
+    elif 'Sales.CustomerTransactions' in changes:
+        invalidate_cache('get_unpaid_invoices')
+
+
+def _register_change_consumers(tracker: ChangeTracker, engines: list):
+    """Engines first, cache invalidation last.
+
+    Consumers run in registration order, so the caches are only cleared once
+    every engine holds the delta; a request racing the tick cannot re-cache
+    pre-delta results for a full TTL.
+    """
+    for engine in engines:
+        tracker.register(engine)
+    tracker.register(_invalidate_on_change)
+
+
+def start_local_engines(interval: float = None):
+    """Load engines and keep them (and the result cache) in sync via change capture.
+
+    The tracker is primed before the engines load, so rows written during the
+    load are picked up by the first tick rather than lost.
+    """
+    global _engines_started
+    interval = CHANGE_CAPTURE_INTERVAL if interval is None else interval
+    with _engines_lock:
+        if _engines_started:
+            return
+        _engines_started = True
+    engines = get_local_engines()
+    if not engines and not interval:
+        return
+
+    def boot():
+        nonlocal interval
+        tracker = get_change_tracker()
+        _register_change_consumers(tracker, engines)
+        if interval:
+            try:
+                tracker.prime()
+            except Exception as exc:
+                print(f"[WARN] Change capture disabled: {exc}")
+                interval = 0
+        warm_local_engines()
+        if interval:
+            tracker.start(interval)
+
+    threading.Thread(target=boot, name='analytics-engine-boot', daemon=True).start()
+
+
+def local_engine_stats() -> dict:
+    with _engines_lock:
+        stats = {name: engine.stats() for name, engine in _engines.items()}
+        tracker = _change_tracker
+    if tracker is not None:
+        stats['change_capture'] = tracker.stats()
+    return stats
+
+
+def _local_result(name: str, *args, **kwargs):
+    """Try each local engine's ``name`` method; returns ``(found, value)``."""
+    for engine in get_local_engines():
+        method = getattr(engine, name, None)
+        if method is None:
+            continue
+        try:
+            return True, method(*args, **kwargs)
+        except LookupError:
+            continue
+    return False, None
+
+
+def served_locally(fn):
+    """Answer from a local engine when one can, otherwise run the SQL implementation."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        found, value = _local_result(fn.__name__, *args, **kwargs)
+        if found:
+            return value
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def _monthly_revenue_sql(start_date: str = '2023-01-01', end_date: str = None) -> str:
     end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
-    q = f"""
+    return f"""
     SELECT
       DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1) AS [month],
       SUM(il.ExtendedPrice) AS revenue
@@ -56,12 +384,17 @@ def monthly_revenue(start_date: str = '2023-01-01', end_date: str = None) -> pd.
     GROUP BY DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1)
     ORDER BY [month];
     """
-    return run_sql(q)
 
 
-def monthly_cogs(start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+@cached_monthly_series(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
+def monthly_revenue(start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+    return run_sql(_monthly_revenue_sql(start_date, end_date))
+
+
+def _monthly_cogs_sql(start_date: str = '2023-01-01', end_date: str = None) -> str:
     end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
-    q = f"""
+    return f"""
     SELECT
       DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1) AS [month],
       SUM(il.Quantity * COALESCE(s.LastCostPrice, si.UnitPrice)) AS cogs
@@ -73,12 +406,15 @@ def monthly_cogs(start_date: str = '2023-01-01', end_date: str = None) -> pd.Dat
     GROUP BY DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1)
     ORDER BY [month];
     """
-    return run_sql(q)
 
 
-def compute_roi(start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
-    rev = monthly_revenue(start_date, end_date)
-    cogs = monthly_cogs(start_date, end_date)
+@cached_monthly_series(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
+def monthly_cogs(start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+    return run_sql(_monthly_cogs_sql(start_date, end_date))
+
+
+def _roi_frame(rev: pd.DataFrame, cogs: pd.DataFrame) -> pd.DataFrame:
     df = pd.merge(rev, cogs, on='month', how='outer').fillna(0)
     df['gross_margin'] = df['revenue'] - df['cogs']
     # define ROI as gross_margin / cogs (avoid divide by zero)
@@ -88,8 +424,28 @@ def compute_roi(start_date: str = '2023-01-01', end_date: str = None) -> pd.Data
     return df
 
 
-def plot_timeseries(df: pd.DataFrame, y_cols: list, title: str, out_path: str):
-    """Create a line chart with multiple series and export as PNG."""
+@cached(ttl=AGGREGATE_CACHE_TTL)
+def compute_roi(start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+    found_rev, rev = _local_result('monthly_revenue', start_date, end_date)
+    found_cogs, cogs = _local_result('monthly_cogs', start_date, end_date)
+    if found_rev and found_cogs:
+        return _roi_frame(rev, cogs)
+
+    builders = [_monthly_revenue_sql, _monthly_cogs_sql]
+
+    def fetch(spans):
+        # Only the months missing from the series cache are queried, all in one round trip.
+        return run_sql_batch([builders[index](span_start, span_end) for index, span_start, span_end in spans])
+
+    rev, cogs = resolve_series([
+        (('monthly_revenue', ()), start_date, end_date),
+        (('monthly_cogs', ()), start_date, end_date),
+    ], fetch, ttl=AGGREGATE_CACHE_TTL)
+    return _roi_frame(rev, cogs)
+
+
+def timeseries_figure(df: pd.DataFrame, y_cols: list, title: str):
+    """Build the multi-series line chart used for monthly metrics."""
     if df.empty or len(df) == 0:
         # Create empty placeholder plot
         import plotly.graph_objects as go
@@ -113,20 +469,65 @@ def plot_timeseries(df: pd.DataFrame, y_cols: list, title: str, out_path: str):
             height=600,
             template='plotly_white'
         )
-    
-    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
-    pio.write_image(fig, out_path, scale=2, width=1400, height=800)
-    return out_path
+    return fig
+
+
+def export_figure(fig, out_path: str = None) -> str:
+    """Write ``fig`` to ``out_path``, or to the content-addressed chart cache when omitted."""
+    if out_path is None:
+        return render_cached(fig)
+    return write_image(fig, out_path)
+
+
+def deferred_plot(fig, **export) -> str:
+    """Register ``fig`` for rendering on first fetch and return its image URL."""
+    return deferred_chart_url(defer_chart(fig, **export))
+
+
+CHART_FORMATS = ('png', 'svg', 'webp', 'plotly-json')
+
+
+def chart_export_options(fmt: str = 'png', scale: float = None, width: int = None, height: int = None) -> dict:
+    """Validate the chart output options of a request. Raises ValueError on bad input."""
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(CHART_FORMATS)}")
+    options = {'format': fmt}
+    if scale is not None:
+        if not 0.25 <= scale <= 4:
+            raise ValueError('scale must be between 0.25 and 4')
+        options['scale'] = scale
+    for name, value in (('width', width), ('height', height)):
+        if value is not None:
+            if not 100 <= value <= 4000:
+                raise ValueError(f'{name} must be between 100 and 4000')
+            options[name] = int(value)
+    return options
+
+
+def chart_output(fig, options: dict = None) -> dict:
+    """Chart part of an endpoint response.
+
+    ``{'figure': ...}`` (serialized Plotly figure for the browser to draw) for
+    ``plotly-json``, otherwise ``{'plot': url}`` of a lazily rendered image.
+    """
+    options = options or {}
+    if options.get('format') == 'plotly-json':
+        return {'figure': json.loads(fig.to_json())}
+    return {'plot': deferred_plot(fig, **options)}
+
+
+def plot_timeseries(df: pd.DataFrame, y_cols: list, title: str, out_path: str = None):
+    """Create a line chart with multiple series and export as PNG. Returns the image path."""
+    return export_figure(timeseries_figure(df, y_cols, title), out_path)
 
 
 # =======================
 # New Analytics Features
 # =======================
 
-def top_customers(start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> pd.DataFrame:
-    """Get top customers by total revenue."""
+def _top_customers_sql(start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> str:
     end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
-    q = f"""
+    return f"""
     SELECT TOP {limit}
       c.CustomerID, c.CustomerName,
       SUM(il.ExtendedPrice) as total_revenue,
@@ -140,13 +541,18 @@ def top_customers(start_date: str = '2023-01-01', end_date: str = None, limit: i
     GROUP BY c.CustomerID, c.CustomerName
     ORDER BY total_revenue DESC
     """
-    return run_sql(q)
 
 
-def top_products(start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> pd.DataFrame:
-    """Get top products by units sold."""
+@cached(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
+def top_customers(start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> pd.DataFrame:
+    """Get top customers by total revenue."""
+    return run_sql(_top_customers_sql(start_date, end_date, limit))
+
+
+def _top_products_sql(start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> str:
     end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
-    q = f"""
+    return f"""
     SELECT TOP {limit}
       si.StockItemID, si.StockItemName, si.Brand,
       SUM(il.Quantity) as total_units,
@@ -160,13 +566,18 @@ def top_products(start_date: str = '2023-01-01', end_date: str = None, limit: in
     GROUP BY si.StockItemID, si.StockItemName, si.Brand
     ORDER BY total_units DESC
     """
-    return run_sql(q)
 
 
-def salesperson_performance(start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
-    """Get salesperson performance metrics."""
+@cached(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
+def top_products(start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> pd.DataFrame:
+    """Get top products by units sold."""
+    return run_sql(_top_products_sql(start_date, end_date, limit))
+
+
+def _salesperson_performance_sql(start_date: str = '2023-01-01', end_date: str = None) -> str:
     end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
-    q = f"""
+    return f"""
     SELECT
       COALESCE(p.FullName, 'Unknown') as salesperson,
       COUNT(DISTINCT i.InvoiceID) as total_invoices,
@@ -181,9 +592,17 @@ def salesperson_performance(start_date: str = '2023-01-01', end_date: str = None
     GROUP BY p.PersonID, p.FullName
     ORDER BY total_revenue DESC
     """
-    return run_sql(q)
 
 
+@cached(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
+def salesperson_performance(start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+    """Get salesperson performance metrics."""
+    return run_sql(_salesperson_performance_sql(start_date, end_date))
+
+
+@cached(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
 def customer_segmentation(start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
     """Segment customers by purchase value and frequency."""
     end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
@@ -219,6 +638,7 @@ def customer_segmentation(start_date: str = '2023-01-01', end_date: str = None)
     return run_sql(q)
 
 
+@cached(ttl=AGGREGATE_CACHE_TTL)
 def sales_by_location(start_date: str = '2023-01-01', end_date: str = None, limit: int = 100) -> pd.DataFrame:
     """Aggregate revenue by customer delivery city/state/country with lat/long if available."""
     end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
@@ -246,8 +666,8 @@ def sales_by_location(start_date: str = '2023-01-01', end_date: str = None, limi
     return run_sql(q)
 
 
-def plot_bar_chart(df: pd.DataFrame, x: str, y: str, title: str, out_path: str, color: str = None):
-    """Create a bar chart and export as PNG."""
+def bar_chart_figure(df: pd.DataFrame, x: str, y: str, title: str, color: str = None):
+    """Build a bar chart figure."""
     if df.empty:
         import plotly.graph_objects as go
         fig = go.Figure()
@@ -259,12 +679,16 @@ def plot_bar_chart(df: pd.DataFrame, x: str, y: str, title: str, out_path: str,
                     labels={x: x.replace('_', ' ').title(), y: y.replace('_', ' ').title()},
                     template='plotly_white')
         fig.update_layout(height=600, showlegend=False)
-    
-    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
-    pio.write_image(fig, out_path, scale=2, width=1400, height=800)
-    return out_path
+    return fig
+
+
+def plot_bar_chart(df: pd.DataFrame, x: str, y: str, title: str, out_path: str = None, color: str = None):
+    """Create a bar chart and export as PNG. Returns the image path."""
+    return export_figure(bar_chart_figure(df, x, y, title, color=color), out_path)
 
 
+@cached_monthly_series(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
 def product_monthly_units(stock_item_id: int, start_date: str, end_date: str) -> pd.DataFrame:
     """Get monthly units sold for a specific stock item."""
     q = f"""
@@ -284,9 +708,44 @@ def product_monthly_units(stock_item_id: int, start_date: str, end_date: str) ->
     return run_sql(q)
 
 
-def forecast_product_demand(stock_item_id: int = None, start_date: str = '2015-01-01',
-                            end_date: str = None, months_ahead: int = 6) -> dict:
-    """Forecast future product demand using simple linear trend."""
+@cached(ttl=AGGREGATE_CACHE_TTL)
+def item_monthly_units(start_date: str, end_date: str) -> pd.DataFrame:
+    """Monthly units sold for every stock item, in one query (input of the batch forecaster)."""
+    q = f"""
+    SELECT
+      DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1) AS [month],
+      si.StockItemID,
+      si.StockItemName,
+      SUM(il.Quantity) AS total_units
+    FROM [Sales].[InvoiceLines] il
+    JOIN [Sales].[Invoices] i ON i.InvoiceID = il.InvoiceID
+    JOIN [Warehouse].[StockItems] si ON si.StockItemID = il.StockItemID
+    WHERE i.InvoiceDate BETWEEN '{start_date}' AND '{end_date}'
+    GROUP BY DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1), si.StockItemID, si.StockItemName
+    """
+    return run_sql(q)
+
+
+@cached(ttl=LOOKUP_CACHE_TTL)
+def stock_item_holdings() -> pd.DataFrame:
+    """Quantity on hand, reorder level and supplier lead time for every stock item."""
+    q = """
+    SELECT
+      si.StockItemID,
+      si.StockItemName,
+      h.QuantityOnHand,
+      h.ReorderLevel,
+      h.TargetStockLevel,
+      si.LeadTimeDays
+    FROM [Warehouse].[StockItemHoldings] h
+    JOIN [Warehouse].[StockItems] si ON si.StockItemID = h.StockItemID
+    """
+    return run_sql(q)
+
+
+def product_demand_history(stock_item_id: int = None, start_date: str = '2015-01-01',
+                           end_date: str = None) -> tuple:
+    """``(stock_item_id, end_date, history)`` a demand forecast works from; the top seller if no item is given."""
     end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
 
     if not stock_item_id:
@@ -300,42 +759,50 @@ def forecast_product_demand(stock_item_id: int = None, start_date: str = '2015-0
         raise RuntimeError('No historical data for selected product')
 
     history_df['month'] = pd.to_datetime(history_df['month'])
-    history_df = history_df.sort_values('month')
-    stock_item_name = history_df.iloc[0]['StockItemName']
+    return int(stock_item_id), end_date, history_df.sort_values('month')
 
-    x = np.arange(len(history_df))
-    y = history_df['total_units'].values.astype(float)
-    if len(x) >= 2:
-        slope, intercept = np.polyfit(x, y, 1)
-    else:
-        slope, intercept = 0.0, y[0]
-
-    recent_window = min(6, len(history_df))
-    recent_avg = history_df['total_units'].tail(recent_window).mean()
-    min_floor = recent_avg * 0.6
-
-    last_month = history_df['month'].iloc[-1]
-    forecast = []
-    for step in range(1, months_ahead + 1):
-        future_month = (last_month + pd.offsets.MonthBegin(step)).normalize()
-        future_index = len(history_df) + (step - 1)
-        trend_value = slope * future_index + intercept
-        blended = 0.7 * trend_value + 0.3 * recent_avg
-        value = max(min_floor, blended)
-        forecast.append({'month': future_month, 'units': float(value)})
 
+@cached(ttl=AGGREGATE_CACHE_TTL)
+def forecast_product_demand(stock_item_id: int = None, start_date: str = '2015-01-01',
+                            end_date: str = None, months_ahead: int = 6, model: str = None) -> dict:
+    """Forecast future product demand with ``model`` (default ``FORECAST_DEFAULT_MODEL``)."""
+    model = resolve_model(model)
+    stock_item_id, end_date, history_df = product_demand_history(stock_item_id, start_date, end_date)
+
+    # Same vectorized model as the batch forecaster, on a one-item matrix.
+    item = forecast_matrix(item_month_matrix(history_df), months_ahead, model)[0]
     history = [{'month': row['month'], 'units': float(row['total_units'])} for _, row in history_df.iterrows()]
 
     return {
-        'stock_item': {'id': int(stock_item_id), 'name': stock_item_name},
+        'stock_item': {'id': int(stock_item_id), 'name': history_df.iloc[0]['StockItemName']},
         'history': history,
-        'forecast': forecast,
+        'forecast': item['forecast'],
         'start_date': start_date,
         'end_date': end_date,
-        'explanation': 'Baseline linear trend forecast blended with recent performance.'
+        'model': model,
+        'explanation': MODEL_DESCRIPTIONS[model]
     }
 
 
+@cached(ttl=AGGREGATE_CACHE_TTL)
+def forecast_demand_batch(start_date: str = '2015-01-01', end_date: str = None, months_ahead: int = 6,
+                          stock_item_ids: tuple = None, model: str = None) -> list:
+    """``model`` forecasts for every stock item (or only ``stock_item_ids``) from a single query.
+
+    Items are ordered by units sold in their most recent six months of sales.
+    """
+    end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
+    df = item_monthly_units(start_date, end_date)
+    if stock_item_ids:
+        df = df[df['StockItemID'].isin([int(i) for i in stock_item_ids])]
+    matrix = item_month_matrix(df)
+    results = forecast_matrix(matrix, months_ahead, model)
+    recent = dict(zip(matrix['ids'].tolist(), np.nan_to_num(recent_mean(matrix['units'])).tolist()))
+    results.sort(key=lambda item: -recent.get(item['stock_item']['id'], 0.0))
+    return results
+
+
+@cached(ttl=LOOKUP_CACHE_TTL)
 def find_products_by_name(term: str, limit: int = 5) -> pd.DataFrame:
     term = term.replace("'", "''")
     q = f"""
@@ -349,6 +816,7 @@ def find_products_by_name(term: str, limit: int = 5) -> pd.DataFrame:
     return run_sql(q)
 
 
+@cached(ttl=LOOKUP_CACHE_TTL)
 def find_customer_by_name(term: str, limit: int = 5) -> pd.DataFrame:
     term = term.replace("'", "''")
     q = f"""
@@ -374,8 +842,8 @@ def find_customer_by_name(term: str, limit: int = 5) -> pd.DataFrame:
     return run_sql(q)
 
 
-def customer_metrics(customer_id: int, start_date: str, end_date: str) -> dict:
-    q = f"""
+def _customer_metrics_sql(customer_id: int, start_date: str, end_date: str) -> str:
+    return f"""
     SELECT
       SUM(il.ExtendedPrice) AS revenue,
       SUM(il.LineProfit) AS profit,
@@ -389,14 +857,22 @@ def customer_metrics(customer_id: int, start_date: str, end_date: str) -> dict:
     WHERE i.CustomerID = {customer_id}
       AND i.InvoiceDate BETWEEN '{start_date}' AND '{end_date}'
     """
-    df = run_sql(q)
+
+
+def _metrics_dict(df: pd.DataFrame) -> dict:
     if df.empty:
         return {}
     return df.fillna(0).iloc[0].to_dict()
 
 
-def customer_monthly_sales(customer_id: int, start_date: str, end_date: str) -> pd.DataFrame:
-    q = f"""
+@cached(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
+def customer_metrics(customer_id: int, start_date: str, end_date: str) -> dict:
+    return _metrics_dict(run_sql(_customer_metrics_sql(customer_id, start_date, end_date)))
+
+
+def _customer_monthly_sales_sql(customer_id: int, start_date: str, end_date: str) -> str:
+    return f"""
     SELECT
       DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1) AS [month],
       SUM(il.ExtendedPrice) AS revenue,
@@ -408,11 +884,16 @@ def customer_monthly_sales(customer_id: int, start_date: str, end_date: str) ->
     GROUP BY DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1)
     ORDER BY [month]
     """
-    return run_sql(q)
 
 
-def customer_top_products(customer_id: int, start_date: str, end_date: str, limit: int = 5) -> pd.DataFrame:
-    q = f"""
+@cached_monthly_series(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
+def customer_monthly_sales(customer_id: int, start_date: str, end_date: str) -> pd.DataFrame:
+    return run_sql(_customer_monthly_sales_sql(customer_id, start_date, end_date))
+
+
+def _customer_top_products_sql(customer_id: int, start_date: str, end_date: str, limit: int = 5) -> str:
+    return f"""
     SELECT TOP {limit}
       si.StockItemName,
       SUM(il.Quantity) AS total_units,
@@ -426,9 +907,30 @@ def customer_top_products(customer_id: int, start_date: str, end_date: str, limi
     GROUP BY si.StockItemName
     ORDER BY revenue DESC
     """
-    return run_sql(q)
 
 
+@cached(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
+def customer_top_products(customer_id: int, start_date: str, end_date: str, limit: int = 5) -> pd.DataFrame:
+    return run_sql(_customer_top_products_sql(customer_id, start_date, end_date, limit))
+
+
+@cached(ttl=AGGREGATE_CACHE_TTL)
+@served_locally
+def customer_profile(customer_id: int, start_date: str, end_date: str, limit: int = 5) -> tuple:
+    """Fetch metrics, monthly sales and top products for a customer in one round trip.
+
+    Returns ``(metrics_dict, monthly_df, top_products_df)``.
+    """
+    metrics_df, monthly_df, top_df = run_sql_batch([
+        _customer_metrics_sql(customer_id, start_date, end_date),
+        _customer_monthly_sales_sql(customer_id, start_date, end_date),
+        _customer_top_products_sql(customer_id, start_date, end_date, limit),
+    ])
+    return _metrics_dict(metrics_df), monthly_df, top_df
+
+
+@cached(ttl=RECEIVABLES_CACHE_TTL)
 def get_unpaid_invoices(days_overdue: int = 0, limit: int = 100) -> pd.DataFrame:
     """
     Retrieve customers with unpaid invoices including contact info and salesperson details.
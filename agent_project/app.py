@@ -1,9 +1,11 @@
-from fastapi import FastAPI, Request, HTTPException, APIRouter, Body
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, Request, HTTPException, APIRouter, Body, Query
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional
 import os
+import asyncio
 from datetime import datetime, date
 import re
 from numbers import Number
@@ -15,13 +17,26 @@ import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from analytics import (
-    compute_roi, plot_timeseries, plot_bar_chart,
+    compute_roi, timeseries_figure, bar_chart_figure, chart_export_options, chart_output,
     top_customers, top_products, salesperson_performance, customer_segmentation,
-    sales_by_location, forecast_product_demand, get_unpaid_invoices,
-    find_products_by_name, find_customer_by_name, customer_metrics,
-    customer_monthly_sales, customer_top_products
+    sales_by_location, product_demand_history, forecast_product_demand, forecast_demand_batch,
+    get_unpaid_invoices, find_products_by_name, find_customer_by_name, customer_metrics,
+    customer_monthly_sales, customer_top_products, customer_profile,
+    warm_db_pool, run_db_call, fan_out, fanout_stats, start_local_engines, local_engine_stats
 )
-from agent import summarize_dataframe, forecast_with_llm, customer_insight_with_llm, generate_email_draft
+from db_pool import all_pool_stats, close_all as close_db_pools
+from result_cache import TTLCache, cache_stats, invalidate as invalidate_cache
+from chart_cache import chart_cache_stats, materialize_chart, render_cached
+from llm_cache import llm_cache_stats
+from forecasting import MODELS, resolve_model
+from stock_risk import risk_records, stockout_risk
+from question_cache import invalidate_answers, lookup_answer, question_cache_stats, store_answer
+from chart_renderer import start_renderer, stop_renderer, renderer_stats
+from agent import (
+    summarize_dataframe_async, summarize_dataframe_stream, forecast_with_llm_async,
+    customer_insight_with_llm_async, customer_insight_stream, generate_email_draft_async
+)
+from llm_gateway import close_gateway, llm_gateway_stats, llm_status
 import pandas as pd
 
 app = FastAPI(title='Sales Agent')
@@ -29,6 +44,35 @@ app = FastAPI(title='Sales Agent')
 # Create outputs directory
 os.makedirs('agent_outputs', exist_ok=True)
 
+
+@app.on_event('startup')
+def warm_connections():
+    """Open the minimum pool connections so the first requests skip the TLS/login handshake."""
+    try:
+        opened = warm_db_pool()
+        print(f"[INFO] Database pool warmed with {opened} connection(s)")
+    except Exception as exc:
+        print(f"[WARN] Database pool warm-up failed: {exc}")
+    # Loads the in-process replica (if ANALYTICS_ENGINE enables it) without blocking startup.
+    start_local_engines()
+    # Render workers start Kaleido in the background so the first chart skips its startup cost.
+    try:
+        start_renderer()
+    except Exception as exc:
+        print(f"[WARN] Chart render pool failed to start, rendering in-process: {exc}")
+
+
+@app.on_event('shutdown')
+def close_connections():
+    close_db_pools()
+    stop_renderer()
+
+
+@app.on_event('shutdown')
+async def close_llm_clients():
+    await close_gateway()
+
+
 # Create API router FIRST (before static mounts)
 api_router = APIRouter()
 
@@ -41,10 +85,25 @@ if RAW_APP_PASSWORD:
     if compact and compact not in DEFAULT_SMTP_APP_PASSWORDS:
         DEFAULT_SMTP_APP_PASSWORDS.append(compact)
 
+# Overall deadline for the concurrent metric queries that brief the LLM.
+CONTEXT_DEADLINE_SECONDS = float(os.getenv('CONTEXT_DEADLINE_SECONDS', '8'))
+# How long /api/demand-forecast?model=llm waits for the LLM before serving the statistical forecast.
+FORECAST_LLM_BUDGET_SECONDS = float(os.getenv('FORECAST_LLM_BUDGET_SECONDS', '1.5'))
+FORECAST_LLM_CACHE_TTL = float(os.getenv('FORECAST_LLM_CACHE_TTL', '3600'))
+
+# LLM forecasts per (item, start, end, months ahead), and the ones still running.
+_llm_forecasts = TTLCache(maxsize=256)
+_llm_forecast_tasks = {}
+
+
 class AskRequest(BaseModel):
     question: str
     start_date: Optional[str] = '2015-01-01'
     end_date: Optional[str] = '2016-12-31'
+    format: Optional[str] = 'png'
+    scale: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
 
 
 class EmailDraftRequest(BaseModel):
@@ -115,10 +174,19 @@ def build_customer_name_variants(name: str) -> list[str]:
 
 
 def build_context_summary(start_date: str, end_date: str) -> str:
+    # Sections are independent: run them side by side and keep whatever finishes in time.
+    snapshot = fan_out({
+        'roi': lambda: compute_roi(start_date, end_date),
+        'customers': lambda: top_customers(start_date, end_date, limit=3),
+        'products': lambda: top_products(start_date, end_date, limit=3),
+        'salespeople': lambda: salesperson_performance(start_date, end_date).head(3),
+    }, timeout=CONTEXT_DEADLINE_SECONDS)
+    snapshot = {key: value for key, value in snapshot.items() if not isinstance(value, Exception)}
+
     parts = []
     try:
-        roi_df = compute_roi(start_date, end_date)
-        if not roi_df.empty:
+        roi_df = snapshot.get('roi')
+        if roi_df is not None and not roi_df.empty:
             revenue = roi_df['revenue'].sum()
             cogs = roi_df['cogs'].sum()
             margin = roi_df['gross_margin'].sum()
@@ -127,22 +195,22 @@ def build_context_summary(start_date: str, end_date: str) -> str:
     except Exception:
         pass
     try:
-        customers = top_customers(start_date, end_date, limit=3)
-        if not customers.empty:
+        customers = snapshot.get('customers')
+        if customers is not None and not customers.empty:
             formatted = ", ".join(f"{row.CustomerName} ({row.total_revenue:,.0f})" for _, row in customers.iterrows())
             parts.append(f"Top customers: {formatted}.")
     except Exception:
         pass
     try:
-        products = top_products(start_date, end_date, limit=3)
-        if not products.empty:
+        products = snapshot.get('products')
+        if products is not None and not products.empty:
             formatted = ", ".join(f"{row.StockItemName} ({row.total_units:,.0f} units)" for _, row in products.iterrows())
             parts.append(f"Top products: {formatted}.")
     except Exception:
         pass
     try:
-        perf = salesperson_performance(start_date, end_date).head(3)
-        if not perf.empty:
+        perf = snapshot.get('salespeople')
+        if perf is not None and not perf.empty:
             formatted = ", ".join(f"{row.salesperson or 'Unknown'} ({row.total_revenue:,.0f})" for _, row in perf.iterrows())
             parts.append(f"Sales leaders: {formatted}.")
     except Exception:
@@ -231,20 +299,42 @@ def describe_forecast_rows(rows):
     )
 
 
+def chart_options(fmt: str = 'png', scale: Optional[float] = None,
+                  width: Optional[int] = None, height: Optional[int] = None) -> dict:
+    """Validated chart output options (format=png|svg|webp|plotly-json plus raster size/scale)."""
+    try:
+        return chart_export_options(fmt, scale, width, height)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
 @api_router.get('/roi')
-def api_roi(start_date: str = '2015-01-01', end_date: str = '2016-12-31'):
-    """Generate and return ROI plot as PNG."""
+def api_roi(start_date: str = '2015-01-01', end_date: str = '2016-12-31',
+            fmt: str = Query('png', alias='format'), scale: Optional[float] = None,
+            width: Optional[int] = None, height: Optional[int] = None):
+    """Generate and return the ROI plot as an image, or as Plotly JSON with format=plotly-json."""
+    options = chart_options(fmt, scale, width, height)
     try:
         df = compute_roi(start_date, end_date)
         if df.empty:
             raise HTTPException(status_code=400, detail="No data for the requested date range")
-        out_path = os.path.join('agent_outputs', 'roi.png')
-        plot_timeseries(df, ['revenue', 'cogs', 'gross_margin'], 'Monthly Revenue / COGS / Gross Margin', out_path)
-        return FileResponse(out_path, media_type='image/png')
+        fig = timeseries_figure(df, ['revenue', 'cogs', 'gross_margin'], 'Monthly Revenue / COGS / Gross Margin')
+        if fmt == 'plotly-json':
+            return JSONResponse(chart_output(fig, options)['figure'])
+        return FileResponse(render_cached(fig, **options))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.get('/charts/{name}')
+async def api_chart(name: str):
+    """Serve a chart image, rendering it now (or waiting on the in-flight render) if needed."""
+    path = await run_in_threadpool(materialize_chart, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail='Unknown or expired chart')
+    return FileResponse(path)
+
+
 @api_router.get('/roi-data')
 def api_roi_data(start_date: str = '2015-01-01', end_date: str = '2016-12-31'):
     """Return ROI timeseries data with summary metrics for interactive charts."""
@@ -282,99 +372,182 @@ def api_roi_data(start_date: str = '2015-01-01', end_date: str = '2016-12-31'):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@api_router.post('/ask')
-async def api_ask(req: AskRequest):
-    # compute ROI table and summarize
-    df = compute_roi(req.start_date, req.end_date)
-    # create a small plot and save
-    os.makedirs('agent_outputs', exist_ok=True)
-    plot_path = os.path.join('agent_outputs', 'roi.png')
-    plot_timeseries(df, ['revenue', 'cogs', 'gross_margin'], 'Monthly Revenue / COGS / Gross Margin', plot_path)
-
-    # Summarize via LLM
+def ask_scope(req: AskRequest, options: dict) -> tuple:
+    """Question-cache scope of an ask request: date range plus chart options."""
+    return (req.start_date, req.end_date, tuple(sorted(options.items())))
+
+
+async def ask_inputs(req: AskRequest, options: dict):
+    """ROI table, its figure, chart and LLM context for an ask request, queried concurrently."""
+    results = await run_db_call(fan_out, {
+        'roi': lambda: compute_roi(req.start_date, req.end_date),
+        'customers': lambda: top_customers(req.start_date, req.end_date, limit=5),
+        'products': lambda: top_products(req.start_date, req.end_date, limit=5),
+    }, timeout=CONTEXT_DEADLINE_SECONDS)
+    df = results['roi']
+    if isinstance(df, Exception):
+        raise HTTPException(status_code=500, detail=str(df))
+    # The plot is only rendered when its URL is first fetched.
+    fig = timeseries_figure(df, ['revenue', 'cogs', 'gross_margin'], 'Monthly Revenue / COGS / Gross Margin')
+    chart = chart_output(fig, options)
+
     context_parts = []
     try:
-        tc = top_customers(req.start_date, req.end_date, limit=5)
-        if not tc.empty:
+        tc = results['customers']
+        if isinstance(tc, pd.DataFrame) and not tc.empty:
             context_parts.append("Top customers by revenue:\n" + ", ".join(f"{row.CustomerName} (${row.total_revenue:,.0f})" for _, row in tc.iterrows()))
-        tp = top_products(req.start_date, req.end_date, limit=5)
-        if not tp.empty:
+        tp = results['products']
+        if isinstance(tp, pd.DataFrame) and not tp.empty:
             context_parts.append("Top products:\n" + ", ".join(f"{row.StockItemName} ({row.total_units} units)" for _, row in tp.iterrows()))
     except Exception:
         pass
     extra_context = "\\n\\n".join(context_parts) if context_parts else None
+    return df, fig, chart, extra_context
+
+
+def store_ask_answer(question: str, scope: tuple, summary: str, chart: dict, fig, options: dict):
+    # The figure is kept so a reused answer can register its chart again.
+    store_answer(question, scope, {'summary': summary, **chart, '_chart': (fig, options)})
+
+
+def reuse_ask_answer(answer: dict) -> dict:
+    """A stored answer with a fresh chart: the deferred render may have been evicted since."""
+    fig, options = answer['_chart']
+    reused = {key: value for key, value in answer.items() if key != '_chart'}
+    reused.update(chart_output(fig, options))
+    return reused
+
+
+def sse_event(event: str, data) -> str:
+    """One Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=to_serializable)}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    # X-Accel-Buffering stops nginx-style proxies from holding the stream back.
+    return StreamingResponse(events, media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api_router.post('/ask')
+async def api_ask(req: AskRequest):
+    options = chart_options(req.format, req.scale, req.width, req.height)
+    # A recent answer to an equivalent question over the same range is reused as is.
+    scope = ask_scope(req, options)
+    hit = lookup_answer(req.question, scope)
+    if hit is not None:
+        answer, matched = hit
+        answer = await run_in_threadpool(reuse_ask_answer, answer)
+        return JSONResponse({**answer, 'cached_question': matched})
+
+    df, fig, chart, extra_context = await ask_inputs(req, options)
 
     try:
-        summary = summarize_dataframe(df, req.question, context=extra_context)
+        summary, source = await summarize_dataframe_async(df, req.question, context=extra_context, with_source=True)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    return JSONResponse({
-        'summary': summary,
-        'plot': '/agent_outputs/roi.png'
-    })
+    # The heuristic fallback is not worth reusing once the LLM is back, as in /ask/stream.
+    if source == 'llm':
+        store_ask_answer(req.question, scope, summary, chart, fig, options)
+    return JSONResponse({'summary': summary, **chart})
+
+
+@api_router.post('/ask/stream')
+async def api_ask_stream(req: AskRequest):
+    """``/api/ask`` as Server-Sent Events: ``metrics``, ``placeholder``, ``token``..., ``done``."""
+    options = chart_options(req.format, req.scale, req.width, req.height)
+    scope = ask_scope(req, options)
+    hit = lookup_answer(req.question, scope)
+    if hit is not None:
+        answer, matched = hit
+        answer = await run_in_threadpool(reuse_ask_answer, answer)
+
+        async def cached_events():
+            yield sse_event('metrics', {key: value for key, value in answer.items() if key != 'summary'})
+            yield sse_event('done', {'summary': answer['summary'], 'source': 'cache', 'cached_question': matched})
+        return sse_response(cached_events())
+
+    df, fig, chart, extra_context = await ask_inputs(req, options)
+
+    async def events():
+        yield sse_event('metrics', {'data': json.loads(df.to_json(orient='records', date_format='iso')), **chart})
+        async for event, data in summarize_dataframe_stream(df, req.question, context=extra_context):
+            if event == 'done' and data['source'] == 'llm':
+                store_ask_answer(req.question, scope, data['summary'], chart, fig, options)
+            yield sse_event(event, data)
+    return sse_response(events())
 
 
 @api_router.get('/top-customers')
-def api_top_customers(start_date: str = '2015-01-01', end_date: str = '2016-12-31', limit: int = 10):
+def api_top_customers(start_date: str = '2015-01-01', end_date: str = '2016-12-31', limit: int = 10,
+                      fmt: str = Query('png', alias='format'), scale: Optional[float] = None,
+                      width: Optional[int] = None, height: Optional[int] = None):
     """Get top customers by revenue with visualization."""
+    options = chart_options(fmt, scale, width, height)
     try:
         df = top_customers(start_date, end_date, limit)
         if df.empty:
             raise HTTPException(status_code=400, detail="No data for the requested date range")
 
-        out_path = os.path.join('agent_outputs', 'top_customers.png')
-        plot_bar_chart(df, 'CustomerName', 'total_revenue', f'Top {limit} Customers by Revenue', out_path)
+        chart = chart_output(bar_chart_figure(df, 'CustomerName', 'total_revenue', f'Top {limit} Customers by Revenue'), options)
 
         return JSONResponse({
             'data': df.to_dict(orient='records'),
-            'plot': '/agent_outputs/top_customers.png'
+            **chart
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @api_router.get('/top-products')
-def api_top_products(start_date: str = '2015-01-01', end_date: str = '2016-12-31', limit: int = 10):
+def api_top_products(start_date: str = '2015-01-01', end_date: str = '2016-12-31', limit: int = 10,
+                     fmt: str = Query('png', alias='format'), scale: Optional[float] = None,
+                     width: Optional[int] = None, height: Optional[int] = None):
     """Get top products by units sold with visualization."""
+    options = chart_options(fmt, scale, width, height)
     try:
         df = top_products(start_date, end_date, limit)
         if df.empty:
             raise HTTPException(status_code=400, detail="No data for the requested date range")
 
-        out_path = os.path.join('agent_outputs', 'top_products.png')
-        plot_bar_chart(df, 'StockItemName', 'total_units', f'Top {limit} Products by Units Sold', out_path)
+        chart = chart_output(bar_chart_figure(df, 'StockItemName', 'total_units', f'Top {limit} Products by Units Sold'), options)
 
         return JSONResponse({
             'data': df.to_dict(orient='records'),
-            'plot': '/agent_outputs/top_products.png'
+            **chart
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @api_router.get('/salesperson-performance')
-def api_salesperson_performance(start_date: str = '2015-01-01', end_date: str = '2016-12-31'):
+def api_salesperson_performance(start_date: str = '2015-01-01', end_date: str = '2016-12-31',
+                                fmt: str = Query('png', alias='format'), scale: Optional[float] = None,
+                                width: Optional[int] = None, height: Optional[int] = None):
     """Get salesperson performance metrics with visualization."""
+    options = chart_options(fmt, scale, width, height)
     try:
         df = salesperson_performance(start_date, end_date)
         if df.empty:
             raise HTTPException(status_code=400, detail="No data for the requested date range")
 
-        out_path = os.path.join('agent_outputs', 'salesperson_perf.png')
-        plot_bar_chart(df, 'salesperson', 'total_revenue', 'Salesperson Performance by Revenue', out_path)
+        chart = chart_output(bar_chart_figure(df, 'salesperson', 'total_revenue', 'Salesperson Performance by Revenue'), options)
 
         return JSONResponse({
             'data': df.to_dict(orient='records'),
-            'plot': '/agent_outputs/salesperson_perf.png'
+            **chart
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @api_router.get('/customer-segmentation')
-def api_customer_segmentation(start_date: str = '2015-01-01', end_date: str = '2016-12-31'):
+def api_customer_segmentation(start_date: str = '2015-01-01', end_date: str = '2016-12-31',
+                              fmt: str = Query('png', alias='format'), scale: Optional[float] = None,
+                              width: Optional[int] = None, height: Optional[int] = None):
     """Get customer segmentation analysis."""
+    options = chart_options(fmt, scale, width, height)
     try:
         df = customer_segmentation(start_date, end_date)
         if df.empty:
@@ -384,8 +557,7 @@ def api_customer_segmentation(start_date: str = '2015-01-01', end_date: str = '2
         segment_counts = df['segment'].value_counts().reset_index()
         segment_counts.columns = ['segment', 'count']
         
-        out_path = os.path.join('agent_outputs', 'customer_segments.png')
-        plot_bar_chart(segment_counts, 'segment', 'count', 'Customer Segmentation Distribution', out_path, color='segment')
+        chart = chart_output(bar_chart_figure(segment_counts, 'segment', 'count', 'Customer Segmentation Distribution', color='segment'), options)
         
         # Group data by segment
         segments = {}
@@ -399,7 +571,7 @@ def api_customer_segmentation(start_date: str = '2015-01-01', end_date: str = '2
                 'segments': {seg: len(data) for seg, data in segments.items()}
             },
             'data': segments,
-            'plot': '/agent_outputs/customer_segments.png'
+            **chart
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -421,29 +593,77 @@ def api_geo_sales(start_date: str = '2015-01-01', end_date: str = '2016-12-31',
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def hedged_llm_forecast(key: tuple, history: list, months_ahead: int, item_name: str, budget: float):
+    """LLM forecast for ``key`` if cached or ready within ``budget`` seconds, else ``None``.
+
+    A late LLM answer keeps running in the background and is cached, so the
+    next request for the same item and range gets it without waiting.
+    """
+    found, value = _llm_forecasts.get(('llm_forecast',) + key)
+    if found:
+        return value
+    task = _llm_forecast_tasks.get(key)
+    if task is None:
+        task = asyncio.create_task(forecast_with_llm_async(history, months_ahead, item_name))
+        _llm_forecast_tasks[key] = task
+        task.add_done_callback(lambda done: _finish_llm_forecast(key, done))
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), max(0.0, budget))
+    except Exception:
+        return None
+
+
+def _finish_llm_forecast(key: tuple, task):
+    _llm_forecast_tasks.pop(key, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    _llm_forecasts.set(('llm_forecast',) + key, task.result(), FORECAST_LLM_CACHE_TTL)
+
+
+def forecast_model_param(model: Optional[str], *also_allowed: str) -> str:
+    """Validated statistical model name for a ``model`` query parameter (400 if unknown)."""
+    try:
+        return resolve_model(model)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"model must be one of: {', '.join([*MODELS, *also_allowed])}")
+
+
 @api_router.get('/demand-forecast')
-def api_demand_forecast(stock_item_id: Optional[int] = None,
-                        months_ahead: int = 6,
-                        start_date: str = '2015-01-01',
-                        end_date: str = '2016-12-31'):
-    """Return demand forecast data for a product."""
+async def api_demand_forecast(stock_item_id: Optional[int] = None,
+                              months_ahead: int = 6,
+                              start_date: str = '2015-01-01',
+                              end_date: str = '2016-12-31',
+                              model: Optional[str] = None):
+    """Return demand forecast data for a product.
+
+    ``model`` picks the forecaster (``FORECAST_DEFAULT_MODEL`` when omitted).
+    ``model=llm`` starts the LLM forecast as soon as the history is loaded, computes
+    the default model meanwhile, and serves the LLM forecast only if it arrives
+    within ``FORECAST_LLM_BUDGET_SECONDS`` (or was cached by an earlier request).
+    """
+    use_llm = model == 'llm'
+    model = forecast_model_param(None if use_llm else model, 'llm')
+    llm_task = None
     try:
         months_ahead = max(1, min(months_ahead, 12))
-        result = forecast_product_demand(stock_item_id, start_date, end_date, months_ahead)
-        history_for_llm = []
-        for row in result['history']:
-            month = row['month']
-            if hasattr(month, 'isoformat'):
-                month = month.date().isoformat()
-            history_for_llm.append({'month': month, 'units': row['units']})
-
+        if use_llm:
+            # Start the LLM on the history first so its budget overlaps the baseline forecast.
+            stock_item_id, end_date, history_df = await run_db_call(
+                product_demand_history, stock_item_id, start_date, end_date)
+            history_for_llm = [{'month': row['month'].date().isoformat(), 'units': float(row['total_units'])}
+                               for _, row in history_df.iterrows()]
+            key = (stock_item_id, start_date, end_date, months_ahead)
+            llm_task = asyncio.ensure_future(hedged_llm_forecast(
+                key, history_for_llm, months_ahead, history_df.iloc[0]['StockItemName'], FORECAST_LLM_BUDGET_SECONDS))
+        result = await run_db_call(forecast_product_demand, stock_item_id, start_date, end_date, months_ahead, model)
         explanation = result.get('explanation', '')
-        try:
-            llm_output = forecast_with_llm(history_for_llm, months_ahead, result['stock_item']['name'])
-            result['forecast'] = [{'month': f['month'], 'units': f['units']} for f in llm_output.get('forecast', [])]
-            explanation = llm_output.get('explanation', explanation)
-        except Exception:
-            pass
+        source = model
+        if llm_task is not None:
+            llm_output = await llm_task
+            if llm_output:
+                result['forecast'] = [{'month': f['month'], 'units': f['units']} for f in llm_output.get('forecast', [])]
+                explanation = llm_output.get('explanation', explanation)
+                source = 'llm'
 
         for section in ('history', 'forecast'):
             for row in result[section]:
@@ -452,11 +672,78 @@ def api_demand_forecast(stock_item_id: Optional[int] = None,
         if not explanation:
             explanation = describe_forecast_rows(result['forecast'])
         result['explanation'] = explanation
+        result['forecast_source'] = source
         return JSONResponse(result)
     except RuntimeError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # The LLM call itself is shielded and still lands in the cache.
+        if llm_task is not None and not llm_task.done():
+            llm_task.cancel()
+
+
+@api_router.get('/demand-forecast/batch')
+async def api_demand_forecast_batch(months_ahead: int = 6,
+                                    start_date: str = '2015-01-01',
+                                    end_date: str = '2016-12-31',
+                                    stock_item_ids: Optional[str] = None,
+                                    limit: Optional[int] = None,
+                                    model: Optional[str] = None):
+    """``model`` forecasts for many items (comma-separated ``stock_item_ids``) or the whole catalog."""
+    model = forecast_model_param(model)
+    try:
+        ids = tuple(int(part) for part in stock_item_ids.split(',') if part.strip()) if stock_item_ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="stock_item_ids must be comma-separated integers")
+    try:
+        months_ahead = max(1, min(months_ahead, 12))
+        items = await run_db_call(forecast_demand_batch, start_date, end_date, months_ahead, ids, model)
+        if limit:
+            items = items[:limit]
+        for item in items:
+            item['last_month'] = item['last_month'].date().isoformat()
+            for row in item['forecast']:
+                row['month'] = row['month'].date().isoformat()
+        return JSONResponse({
+            'count': len(items),
+            'model': model,
+            'months_ahead': months_ahead,
+            'start_date': start_date,
+            'end_date': end_date,
+            'items': items
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.get('/stockout-risk')
+async def api_stockout_risk(months_ahead: int = 6,
+                            start_date: str = '2015-01-01',
+                            end_date: str = '2016-12-31',
+                            model: Optional[str] = None,
+                            limit: Optional[int] = None):
+    """Projected stock-out and reorder dates for every stock item, most urgent first."""
+    model = forecast_model_param(model)
+    try:
+        months_ahead = max(1, min(months_ahead, 12))
+        frame, as_of = await run_db_call(stockout_risk, start_date, end_date, months_ahead, model)
+        at_risk = int((frame['status'] != 'ok').sum())
+        if limit:
+            frame = frame.head(limit)
+        return JSONResponse({
+            'as_of': as_of.date().isoformat(),
+            'model': model,
+            'months_ahead': months_ahead,
+            'start_date': start_date,
+            'end_date': end_date,
+            'at_risk': at_risk,
+            'count': len(frame),
+            'items': risk_records(frame)
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @api_router.get('/customers-list')
@@ -501,7 +788,7 @@ def api_customers_list(limit: int = 100, search: Optional[str] = None):
 
 
 @api_router.post('/generate-email-draft')
-def api_generate_email_draft(request: EmailDraftRequest):
+async def api_generate_email_draft(request: EmailDraftRequest):
     """Generate an AI-powered email draft using OpenAI."""
     try:
         customer_data = request.customer_data or {}
@@ -527,7 +814,7 @@ def api_generate_email_draft(request: EmailDraftRequest):
             WHERE c.CustomerID = {request.customer_id}
             """
             from analytics import run_sql
-            df = run_sql(query)
+            df = await run_db_call(run_sql, query)
             if not df.empty:
                 row = df.iloc[0]
                 customer_data = {
@@ -537,7 +824,7 @@ def api_generate_email_draft(request: EmailDraftRequest):
                     'payment_terms_days': int(row['PaymentDays']) if row['PaymentDays'] else 30
                 }
 
-        draft = generate_email_draft(
+        draft = await generate_email_draft_async(
             email_type=request.email_type,
             recipient_name=request.recipient_name,
             customer_data=customer_data,
@@ -652,8 +939,57 @@ def api_unpaid_invoices(days_overdue: int = 0, limit: int = 100):
         raise HTTPException(status_code=500, detail=str(exc))
 
 
-@api_router.post('/customer-intent')
-async def api_customer_intent(req: CustomerIntentRequest):
+@api_router.get('/db-pool-stats')
+def api_db_pool_stats():
+    """Expose connection pool and fan-out worker usage for monitoring."""
+    return JSONResponse({'pools': all_pool_stats(), 'fanout': fanout_stats()})
+
+
+@api_router.get('/engine-stats')
+def api_engine_stats():
+    """Report which local analytics engines are loaded and how fresh they are."""
+    return JSONResponse(local_engine_stats())
+
+
+@api_router.get('/cache-stats')
+def api_cache_stats():
+    """Expose analytics result, chart and LLM cache sizes and hit/miss counters."""
+    stats = cache_stats()
+    stats['charts'] = chart_cache_stats()
+    stats['llm'] = llm_cache_stats()
+    stats['questions'] = question_cache_stats()
+    return JSONResponse(stats)
+
+
+@api_router.get('/llm-status')
+def api_llm_status():
+    """LLM circuit breaker state: closed, open (local fallbacks only) or half_open (probing)."""
+    return JSONResponse(llm_status())
+
+
+@api_router.get('/llm-stats')
+def api_llm_stats():
+    """Expose LLM gateway limits and per-route call, timeout and rejection counters."""
+    return JSONResponse(llm_gateway_stats())
+
+
+@api_router.get('/renderer-stats')
+def api_renderer_stats():
+    """Expose chart render worker pool state (jobs, timeouts, restarts)."""
+    return JSONResponse(renderer_stats())
+
+
+@api_router.post('/cache/invalidate')
+def api_cache_invalidate(function: Optional[str] = None):
+    """Drop cached analytics results, optionally for a single function."""
+    removed = invalidate_cache(function)
+    if function is None:
+        removed += invalidate_answers() + _llm_forecasts.invalidate()
+    return JSONResponse({'removed': removed, 'function': function})
+
+
+async def customer_intent_inputs(req: CustomerIntentRequest):
+    """Resolve the customer and load its profile: ``(customer, metrics, monthly, top_products)``."""
     customer_name = (req.customer_name or '').strip()
     if not customer_name:
         raise HTTPException(status_code=400, detail="customer_name is required")
@@ -662,7 +998,7 @@ async def api_customer_intent(req: CustomerIntentRequest):
         matches = pd.DataFrame()
         tried_variants = build_customer_name_variants(customer_name)
         for variant in tried_variants:
-            matches = find_customer_by_name(variant, limit=5)
+            matches = await run_db_call(find_customer_by_name, variant, limit=5)
             if not matches.empty:
                 customer_name = variant
                 break
@@ -677,7 +1013,7 @@ async def api_customer_intent(req: CustomerIntentRequest):
     row = exact_rows.iloc[0] if not exact_rows.empty else matches.iloc[0]
 
     customer_id = int(row.CustomerID)
-    metrics_raw = customer_metrics(customer_id, req.start_date, req.end_date)
+    metrics_raw, monthly_df, top_df = await run_db_call(customer_profile, customer_id, req.start_date, req.end_date, limit=5)
     if not metrics_raw:
         raise HTTPException(status_code=404, detail="No sales data in the selected range for this customer")
     metrics = {k: to_serializable(v) for k, v in metrics_raw.items()}
@@ -685,7 +1021,6 @@ async def api_customer_intent(req: CustomerIntentRequest):
     def safe_field(value):
         return None if pd.isna(value) else value
 
-    monthly_df = customer_monthly_sales(customer_id, req.start_date, req.end_date)
     monthly_records = []
     for _, r in monthly_df.iterrows():
         month_value = r['month']
@@ -697,7 +1032,6 @@ async def api_customer_intent(req: CustomerIntentRequest):
             'profit': float(r['profit']) if pd.notna(r['profit']) else 0.0
         })
 
-    top_df = customer_top_products(customer_id, req.start_date, req.end_date, limit=5)
     top_records = []
     for _, r in top_df.iterrows():
         top_records.append({
@@ -721,8 +1055,14 @@ async def api_customer_intent(req: CustomerIntentRequest):
         }
     }
 
+    return customer_payload, metrics, monthly_records, top_records
+
+
+@api_router.post('/customer-intent')
+async def api_customer_intent(req: CustomerIntentRequest):
+    customer_payload, metrics, monthly_records, top_records = await customer_intent_inputs(req)
     try:
-        narrative = customer_insight_with_llm(customer_payload['name'], metrics, monthly_records, top_records)
+        narrative = await customer_insight_with_llm_async(customer_payload['name'], metrics, monthly_records, top_records)
     except Exception:
         narrative = {'insight': 'Unable to generate AI analysis at this time.', 'highlights': []}
 
@@ -737,6 +1077,23 @@ async def api_customer_intent(req: CustomerIntentRequest):
     return JSONResponse(response)
 
 
+@api_router.post('/customer-intent/stream')
+async def api_customer_intent_stream(req: CustomerIntentRequest):
+    """``/api/customer-intent`` as Server-Sent Events: ``metrics``, ``placeholder``, ``done``."""
+    customer_payload, metrics, monthly_records, top_records = await customer_intent_inputs(req)
+
+    async def events():
+        yield sse_event('metrics', {
+            'customer': customer_payload,
+            'metrics': metrics,
+            'monthly': monthly_records,
+            'top_products': top_records,
+        })
+        async for event, data in customer_insight_stream(customer_payload['name'], metrics, monthly_records, top_records):
+            yield sse_event(event, data)
+    return sse_response(events())
+
+
 @app.get('/')
 async def root():
     """Serve the main HTML UI."""
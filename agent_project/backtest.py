@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Rolling-origin backtest of the demand forecasters.
+
+For each cutoff month the item x month matrix is truncated (later months set
+to NaN) and every strategy forecasts the next ``horizon`` months for every
+item.  All cutoffs are stacked into one ``(cutoffs * items, months)`` matrix,
+so a vectorized strategy scores the whole catalog at every origin in a single
+call.  Months without sales count as zero actual demand.
+
+Forecast step ``s`` is scored against calendar month ``cutoff + s``.  The
+production forecasters label step ``s`` as the month after the item's last
+sale, which is the same month for any item that sold in the month before the
+cutoff.
+
+Every strategy is scored on the same cells: those all strategies forecast.
+
+Usage:
+    python backtest.py --start 2013-01-01 --end 2016-04-30 --horizon 3 --cutoffs 12
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from forecasting import MODELS, item_month_matrix, last_observed, recent_mean
+
+
+def naive_last(units: np.ndarray, horizon: int) -> np.ndarray:
+    """Repeat each item's last observed month."""
+    values = units[np.arange(len(units)), last_observed(units)]
+    return np.repeat(values[:, None], horizon, axis=1)
+
+
+def flat_recent_mean(units: np.ndarray, horizon: int) -> np.ndarray:
+    """Mean of the last six observed months, held flat."""
+    return np.repeat(recent_mean(units)[:, None], horizon, axis=1)
+
+
+# Strategy name -> fn(units, horizon) returning an (items, horizon) array; NaN = no forecast.
+STRATEGIES = {
+    **MODELS,
+    'naive_last': naive_last,
+    'recent_mean': flat_recent_mean,
+}
+
+
+def llm_strategy(months: pd.DatetimeIndex):
+    """Wrap ``forecast_with_llm`` as a strategy (one call per row); failed rows stay NaN."""
+    from agent import forecast_with_llm
+
+    def forecast(units: np.ndarray, horizon: int) -> np.ndarray:
+        out = np.full((len(units), horizon), np.nan)
+        for row in range(len(units)):
+            observed = np.flatnonzero(~np.isnan(units[row]))
+            history = [{'month': months[col], 'units': units[row, col]} for col in observed]
+            try:
+                result = forecast_with_llm(history, horizon, 'product')
+            except Exception as exc:
+                print(f"[WARN] LLM forecast failed for row {row}: {exc}")
+                continue
+            out[row] = [entry['units'] for entry in result['forecast']]
+        return out
+
+    return forecast
+
+
+def cutoff_indices(n_months: int, horizon: int, cutoffs: int, min_history: int) -> np.ndarray:
+    """The last ``cutoffs`` origins that leave ``horizon`` months of actuals."""
+    last = n_months - horizon
+    return np.arange(max(min_history, last - cutoffs + 1), last + 1)
+
+
+def stack_origins(units: np.ndarray, cutoffs: np.ndarray, horizon: int, min_history: int):
+    """Histories truncated at each cutoff, their actuals, and which rows have enough history.
+
+    Returns ``history`` ``(C*I, T)``, ``actual`` ``(C*I, horizon)`` and ``eligible`` ``(C*I,)``.
+    """
+    n_items, n_months = units.shape
+    cols = np.arange(n_months)
+    history = np.where(cols[None, None, :] < cutoffs[:, None, None], units[None, :, :], np.nan)
+    history = history.reshape(len(cutoffs) * n_items, n_months)
+    target = cutoffs[:, None] + np.arange(horizon)[None, :]
+    actual = np.nan_to_num(units[:, target]).transpose(1, 0, 2).reshape(len(cutoffs) * n_items, horizon)
+    eligible = (~np.isnan(history)).sum(axis=1) >= min_history
+    return history, actual, eligible
+
+
+def busiest_items(matrix: dict, count: int) -> dict:
+    """``matrix`` restricted to the ``count`` items with the highest recent mean demand."""
+    volume = np.nan_to_num(recent_mean(matrix['units']))
+    keep = np.sort(np.argsort(-volume, kind='stable')[:count])
+    return {**matrix, 'ids': matrix['ids'][keep], 'units': matrix['units'][keep]}
+
+
+def score(forecast: np.ndarray, actual: np.ndarray) -> dict:
+    """MAE, MAPE (over months with demand) and bias (forecast - actual) over the finite cells."""
+    valid = np.isfinite(forecast)
+    error = forecast[valid] - actual[valid]
+    positive = actual[valid] > 0
+    return {
+        'mae': float(np.abs(error).mean()) if error.size else np.nan,
+        'mape': float((np.abs(error[positive]) / actual[valid][positive]).mean() * 100) if positive.any() else np.nan,
+        'bias': float(error.mean()) if error.size else np.nan,
+        'cells': int(error.size),
+    }
+
+
+def run_backtest(matrix: dict, horizon: int = 3, cutoffs: int = 12, min_history: int = 6,
+                 strategies: dict = None) -> pd.DataFrame:
+    """Leaderboard of ``strategies`` (default ``STRATEGIES``) over rolling origins, best MAE first.
+
+    Cells a strategy leaves NaN are dropped for every strategy, so all rows of
+    the leaderboard cover the same item/month cells.
+    """
+    strategies = STRATEGIES if strategies is None else strategies
+    units = matrix['units']
+    origins = cutoff_indices(units.shape[1], horizon, cutoffs, min_history)
+    if units.size == 0 or len(origins) == 0:
+        raise ValueError('Not enough months for the requested horizon, cutoffs and minimum history')
+    history, actual, eligible = stack_origins(units, origins, horizon, min_history)
+    history, actual = history[eligible], actual[eligible]
+
+    forecasts, seconds = {}, {}
+    for name, strategy in strategies.items():
+        started = time.perf_counter()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            forecasts[name] = np.asarray(strategy(history, horizon), dtype=float)
+        seconds[name] = round(time.perf_counter() - started, 3)
+    shared = np.logical_and.reduce([np.isfinite(f) for f in forecasts.values()])
+    rows = [{'strategy': name, **score(np.where(shared, forecast, np.nan), actual), 'seconds': seconds[name]}
+            for name, forecast in forecasts.items()]
+    board = pd.DataFrame(rows).sort_values('mae', kind='stable').reset_index(drop=True)
+    board.attrs.update({'origins': [matrix['months'][c].date().isoformat() for c in origins],
+                        'series': int(eligible.sum())})
+    return board
+
+
+def main():
+    p = argparse.ArgumentParser(description='Rolling-origin backtest of the demand forecasters.')
+    p.add_argument('--start', default='2013-01-01')
+    p.add_argument('--end', default='2016-04-30', help='Last day of data; use a month end so no partial month is scored.')
+    p.add_argument('--horizon', type=int, default=3, help='Months forecast from each cutoff.')
+    p.add_argument('--cutoffs', type=int, default=12, help='Number of rolling origins.')
+    p.add_argument('--min-history', type=int, default=6, help='Months with sales an item needs before a cutoff.')
+    p.add_argument('--llm-items', type=int, default=0,
+                   help='Also score forecast_with_llm against the other strategies on this many of the busiest '
+                        'items (one API call per item and cutoff).')
+    args = p.parse_args()
+
+    from analytics import item_monthly_units
+
+    started = time.perf_counter()
+    matrix = item_month_matrix(item_monthly_units(args.start, args.end))
+    print(f"Loaded {len(matrix['ids'])} items x {len(matrix['months'])} months in {time.perf_counter() - started:.1f}s")
+
+    board = run_backtest(matrix, args.horizon, args.cutoffs, args.min_history)
+    origins = board.attrs['origins']
+    print(f"{board.attrs['series']} item/cutoff series, origins {origins[0]} .. {origins[-1]}, horizon {args.horizon}")
+    print(board.to_string(index=False, float_format=lambda v: f'{v:,.2f}'))
+    if args.llm_items > 0:
+        busiest = busiest_items(matrix, args.llm_items)
+        board = run_backtest(busiest, args.horizon, args.cutoffs, args.min_history,
+                             {**STRATEGIES, 'llm': llm_strategy(matrix['months'])})
+        print(f"\nWith forecast_with_llm on the {len(busiest['ids'])} busiest items "
+              f"({board.attrs['series']} item/cutoff series):")
+        print(board.to_string(index=False, float_format=lambda v: f'{v:,.2f}'))
+
+
+if __name__ == '__main__':
+    main()
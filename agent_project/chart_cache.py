@@ -0,0 +1,206 @@
+"""Content-addressed cache of rendered chart images.
+
+A chart's file name is the hash of its full Plotly figure (spec + data) and the
+export options, so identical charts are rendered once and reused, and
+requests for different date ranges never overwrite each other's image.  The
+directory is kept under a byte quota by deleting the least recently used
+renders; a hit refreshes the file's mtime, which is what the LRU order uses.
+
+Endpoints that return data usually ``defer_chart()`` instead: the figure is
+registered under its content hash and only rendered when its URL is first
+fetched, so the JSON response never waits on Kaleido.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+from chart_renderer import get_renderer
+
+
+OUTPUTS_DIR = 'agent_outputs'
+CHART_DIR = os.path.join(OUTPUTS_DIR, 'charts')
+CHART_CACHE_MAX_BYTES = int(os.getenv('CHART_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+
+DEFAULT_EXPORT = {'format': 'png', 'scale': 2, 'width': 1400, 'height': 800}
+# Figures registered for lazy rendering; the oldest are forgotten past this count.
+CHART_DEFERRED_MAX = int(os.getenv('CHART_DEFERRED_MAX', '512'))
+
+_CHART_NAME = re.compile(r'^([0-9a-f]{32})\.(png|jpg|jpeg|webp|svg|pdf)$')
+_deferred = OrderedDict()
+_deferred_lock = threading.Lock()
+
+# Striped per-key locks: concurrent requests for the same chart render it once.
+_key_locks = [threading.Lock() for _ in range(64)]
+_quota_lock = threading.Lock()
+# Counters are bumped under different stripe locks, so they get a lock of their own.
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'renders': 0, 'evicted': 0}
+
+
+def chart_key(fig_json: str, **export) -> str:
+    """Stable hash of the figure JSON plus the export options."""
+    options = {**DEFAULT_EXPORT, **export}
+    digest = hashlib.sha256()
+    digest.update(fig_json.encode('utf-8'))
+    digest.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+def chart_path(key: str, fmt: str = 'png') -> str:
+    return os.path.join(CHART_DIR, f'{key}.{fmt}')
+
+
+def chart_url(path: str) -> str:
+    """Public URL of a file under ``agent_outputs`` (served by the static mount)."""
+    rel = os.path.relpath(path, OUTPUTS_DIR).replace(os.sep, '/')
+    return f'/{OUTPUTS_DIR}/{rel}'
+
+
+def _lock_for(key: str) -> threading.Lock:
+    return _key_locks[int(key[:8], 16) % len(_key_locks)]
+
+
+def _count(field: str, n: int = 1):
+    with _stats_lock:
+        _stats[field] += n
+
+
+def write_image(fig, path: str, fig_json: str = None, **export):
+    """Export ``fig`` to ``path`` atomically, so readers never see a half-written file.
+
+    Uses the warm render pool when it is running, otherwise Kaleido in-process.
+    """
+    options = {**DEFAULT_EXPORT, **export}
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    renderer = get_renderer()
+    try:
+        if renderer is not None:
+            renderer.render(fig_json or fig.to_json(), tmp_path, **options)
+        else:
+            pio.write_image(fig if fig is not None else pio.from_json(fig_json), tmp_path, **options)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def _materialize(key: str, path: str, fig, fig_json: str, options: dict) -> str:
+    """Render ``path`` unless it already exists; concurrent callers for one key wait on the same render."""
+    with _lock_for(key):
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            _count('hits')
+            return path
+        write_image(fig, path, fig_json=fig_json, **options)
+        _count('renders')
+    enforce_quota(keep=path)
+    return path
+
+
+def render_cached(fig, **export) -> str:
+    """Return the cached image for ``fig``, rendering it only on a miss."""
+    options = {**DEFAULT_EXPORT, **export}
+    fig_json = fig.to_json()
+    key = chart_key(fig_json, **options)
+    return _materialize(key, chart_path(key, options['format']), fig, fig_json, options)
+
+
+def defer_chart(fig, **export) -> str:
+    """Register ``fig`` for rendering on first fetch. Returns the chart file name."""
+    options = {**DEFAULT_EXPORT, **export}
+    fig_json = fig.to_json()
+    key = chart_key(fig_json, **options)
+    name = f"{key}.{options['format']}"
+    if not os.path.exists(chart_path(key, options['format'])):
+        with _deferred_lock:
+            _deferred[name] = (fig_json, options)
+            _deferred.move_to_end(name)
+            while len(_deferred) > CHART_DEFERRED_MAX:
+                _deferred.popitem(last=False)
+    return name
+
+
+def deferred_chart_url(name: str) -> str:
+    return f'/api/charts/{name}'
+
+
+def materialize_chart(name: str):
+    """Path of chart ``name``, rendering a deferred figure if needed; ``None`` if unknown."""
+    match = _CHART_NAME.match(name)
+    if not match:
+        return None
+    key, fmt = match.groups()
+    path = chart_path(key, fmt)
+    with _deferred_lock:
+        job = _deferred.get(name)
+    if job is None:
+        # Already rendered (or forgotten): serve it if the file is still there.
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+    fig_json, options = job
+    _materialize(key, path, None, fig_json, options)
+    with _deferred_lock:
+        _deferred.pop(name, None)
+    return path
+
+
+def enforce_quota(max_bytes: int = None, keep: str = None) -> int:
+    """Delete least recently used renders until the directory fits ``max_bytes``. Returns files removed."""
+    max_bytes = CHART_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with _quota_lock:
+        try:
+            entries = [entry for entry in os.scandir(CHART_DIR)
+                       if entry.is_file() and not entry.name.endswith('.tmp')]
+        except FileNotFoundError:
+            return 0
+        files = []
+        for entry in entries:
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            if keep and os.path.abspath(path) == os.path.abspath(keep):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        _count('evicted', removed)
+        return removed
+
+
+def chart_cache_stats() -> dict:
+    files, size = 0, 0
+    if os.path.isdir(CHART_DIR):
+        for entry in os.scandir(CHART_DIR):
+            if entry.is_file():
+                files += 1
+                size += entry.stat().st_size
+    with _deferred_lock:
+        pending = len(_deferred)
+    with _stats_lock:
+        counters = dict(_stats)
+    return {'files': files, 'bytes': size, 'max_bytes': CHART_CACHE_MAX_BYTES, 'deferred': pending, **counters}
@@ -0,0 +1,228 @@
+"""Pool of warm Kaleido render worker processes.
+
+The first ``pio.write_image`` in a process pays for starting Kaleido's
+headless Chromium, and every later export still runs on the request thread.
+The pool keeps a few worker processes alive, each with Kaleido already warmed
+up by a throwaway render at start.  Jobs wait for a free worker, are bounded by
+a per-job timeout, and a worker that hangs or dies is replaced.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+
+class RenderError(RuntimeError):
+    """The render worker failed, crashed or timed out."""
+
+
+RENDER_WORKERS = int(os.getenv('CHART_RENDER_WORKERS', '2'))
+RENDER_TIMEOUT = float(os.getenv('CHART_RENDER_TIMEOUT', '30'))
+RENDER_QUEUE_TIMEOUT = float(os.getenv('CHART_RENDER_QUEUE_TIMEOUT', '30'))
+
+
+def _worker_main(conn):
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    # Warm-up: starts Kaleido's Chromium before the first real job arrives.
+    try:
+        pio.to_image(go.Figure(), format='png', width=10, height=10)
+    except Exception:
+        pass
+    conn.send(('ready', None))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        fig_json, path, options = job
+        try:
+            fig = pio.from_json(fig_json, skip_invalid=True)
+            pio.write_image(fig, path, **options)
+            conn.send(('ok', None))
+        except Exception as exc:
+            conn.send(('error', f'{type(exc).__name__}: {exc}'))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child,), name='chart-render', daemon=True)
+        self.process.start()
+        child.close()
+        self.ready = False
+
+    def wait_ready(self, timeout: float) -> bool:
+        if not self.ready and self.conn.poll(timeout):
+            self.ready = self.conn.recv()[0] == 'ready'
+        return self.ready
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class RenderPool:
+    """Fixed-size pool of render processes.
+
+    Args:
+        workers: Number of worker processes.
+        job_timeout: Seconds a single render may take before its worker is killed.
+        queue_timeout: Seconds a job may wait for a free worker.
+    """
+
+    def __init__(self, workers: int = 2, job_timeout: float = 30.0, queue_timeout: float = 30.0):
+        self.size = max(1, workers)
+        self.job_timeout = job_timeout
+        self.queue_timeout = queue_timeout
+        # spawn: forking a process that holds DB connections and threads is unsafe.
+        self._ctx = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._started = False
+        self._stats = {'jobs': 0, 'failed': 0, 'timeouts': 0, 'restarts': 0, 'queue_waits': 0}
+
+    def start(self):
+        """Spawn the workers; they warm up in the background."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._idle.put(_Worker(self._ctx))
+
+    def _replace(self, worker: _Worker):
+        worker.kill()
+        with self._lock:
+            self._stats['restarts'] += 1
+            closed = self._closed
+        if not closed:
+            self._idle.put(_Worker(self._ctx))
+
+    def _checkout(self) -> _Worker:
+        """Take an idle worker, waiting up to ``queue_timeout``; dead idle workers are replaced."""
+        deadline = time.monotonic() + self.queue_timeout
+        waited = False
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                if not waited:
+                    waited = True
+                    with self._lock:
+                        self._stats['queue_waits'] += 1
+                try:
+                    worker = self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    raise RenderError(f'No render worker free within {self.queue_timeout:g}s')
+            if worker.process.is_alive():
+                return worker
+            self._replace(worker)
+
+    def render(self, fig_json: str, path: str, **options):
+        """Render a figure (as Plotly JSON) to ``path`` on a warm worker."""
+        if not self._started or self._closed:
+            raise RenderError('Render pool is not running')
+        worker = self._checkout()
+        deadline = time.monotonic() + self.job_timeout
+        try:
+            if not worker.wait_ready(self.job_timeout):
+                raise TimeoutError('worker did not start')
+            worker.conn.send((fig_json, path, options))
+            if not worker.conn.poll(max(0.0, deadline - time.monotonic())):
+                raise TimeoutError(f'render exceeded {self.job_timeout:g}s')
+            status, detail = worker.conn.recv()
+        except TimeoutError as exc:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            self._replace(worker)
+            raise RenderError(str(exc))
+        except (EOFError, OSError) as exc:
+            # The worker process died mid-job.
+            with self._lock:
+                self._stats['failed'] += 1
+            self._replace(worker)
+            raise RenderError(f'render worker crashed: {exc}')
+
+        with self._lock:
+            closed = self._closed
+            self._stats['jobs'] += 1
+            if status != 'ok':
+                self._stats['failed'] += 1
+        if closed:
+            worker.kill()
+        else:
+            self._idle.put(worker)
+        if status != 'ok':
+            raise RenderError(detail)
+        return path
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except Exception:
+                pass
+            worker.kill()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.size,
+                'idle': self._idle.qsize(),
+                'running': self._started and not self._closed,
+                'job_timeout': self.job_timeout,
+                **self._stats,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_renderer(workers: int = None) -> RenderPool:
+    """Start the process-wide render pool (called at app startup). ``workers=0`` disables it."""
+    global _pool
+    workers = RENDER_WORKERS if workers is None else workers
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = RenderPool(workers, RENDER_TIMEOUT, RENDER_QUEUE_TIMEOUT)
+            _pool.start()
+    return _pool
+
+
+def get_renderer():
+    return _pool
+
+
+def stop_renderer():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+def renderer_stats() -> dict:
+    pool = _pool
+    return pool.stats() if pool is not None else {'running': False}
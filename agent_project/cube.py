@@ -0,0 +1,356 @@
+"""Pre-aggregated monthly sales cube.
+
+Almost every analytics query is a GROUP BY over Invoices ⋈ InvoiceLines at
+month grain keeping a different subset of dimensions.  The cube materializes
+that join once at (month, customer, stock item, salesperson) with revenue,
+profit, quantity and line counts, and a smaller invoice-grain table at
+(month, customer, salesperson) with invoice/order counts and first/last
+invoice day, which the distinct counts need.  ``rollup()`` sums either table
+over a month range grouped by one dimension; the analytics equivalents are
+built on it.
+
+Only ranges made of whole months can be answered (a month cell cannot be cut
+down to a few days); anything else raises ``CubeMiss`` so the caller falls
+back to the next engine or SQL.
+"""
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from engine_frames import (
+    load_dimensions, has_unknown_ids, group_sums, months_to_dates,
+    top_customers_frame, top_products_frame, salesperson_frame, segmentation_frame,
+    product_monthly_units_frame, customer_top_products_frame, empty_customer_metrics,
+)
+
+
+class CubeMiss(LookupError):
+    """The cube cannot answer this call; use the next engine or SQL instead."""
+
+
+CELLS_SQL = """
+SELECT
+  DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1) AS [month],
+  i.CustomerID AS customer_id,
+  il.StockItemID AS stock_item_id,
+  COALESCE(i.SalespersonPersonID, -1) AS salesperson_id,
+  SUM(il.ExtendedPrice) AS revenue,
+  SUM(il.LineProfit) AS profit,
+  SUM(il.Quantity) AS quantity,
+  COUNT(*) AS line_count
+FROM [Sales].[InvoiceLines] il
+JOIN [Sales].[Invoices] i ON i.InvoiceID = il.InvoiceID
+WHERE {where}
+GROUP BY DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1),
+         i.CustomerID, il.StockItemID, i.SalespersonPersonID
+"""
+
+# Invoices without lines are left out, matching the joins in analytics.py.
+INVOICE_CELLS_SQL = """
+SELECT
+  DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1) AS [month],
+  i.CustomerID AS customer_id,
+  COALESCE(i.SalespersonPersonID, -1) AS salesperson_id,
+  COUNT(*) AS invoices,
+  COUNT(DISTINCT i.OrderID) AS orders,
+  MIN(i.InvoiceDate) AS first_day,
+  MAX(i.InvoiceDate) AS last_day
+FROM [Sales].[Invoices] i
+WHERE EXISTS (SELECT 1 FROM [Sales].[InvoiceLines] il WHERE il.InvoiceID = i.InvoiceID)
+  AND {where}
+GROUP BY DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1),
+         i.CustomerID, i.SalespersonPersonID
+"""
+
+# Month of every invoice, kept so an invoice moved to another month also
+# refreshes the month it left.
+INVOICE_MONTHS_SQL = """
+SELECT i.InvoiceID AS invoice_id,
+       DATEFROMPARTS(YEAR(i.InvoiceDate), MONTH(i.InvoiceDate), 1) AS [month]
+FROM [Sales].[Invoices] i
+WHERE {where}
+"""
+
+INVOICE_CHUNK = 1000
+
+LINE_MEASURES = ('revenue', 'profit', 'quantity', 'line_count')
+INVOICE_MEASURES = ('invoices', 'orders')
+
+
+def _cells_to_columns(df: pd.DataFrame) -> dict:
+    if df.empty:
+        cols = {name: np.empty(0, dtype=np.int64) for name in ('customer_id', 'stock_item_id', 'salesperson_id')}
+        cols.update({name: np.empty(0, dtype=np.float64) for name in LINE_MEASURES})
+        cols['month'] = np.empty(0, dtype='datetime64[M]')
+        return cols
+    return {
+        'month': pd.to_datetime(df['month']).to_numpy().astype('datetime64[M]'),
+        'customer_id': df['customer_id'].to_numpy(dtype=np.int64),
+        'stock_item_id': df['stock_item_id'].to_numpy(dtype=np.int64),
+        'salesperson_id': df['salesperson_id'].to_numpy(dtype=np.int64),
+        **{name: df[name].to_numpy(dtype=np.float64) for name in LINE_MEASURES},
+    }
+
+
+def _invoice_cells_to_columns(df: pd.DataFrame) -> dict:
+    if df.empty:
+        cols = {name: np.empty(0, dtype=np.int64) for name in ('customer_id', 'salesperson_id')}
+        cols.update({name: np.empty(0, dtype=np.float64) for name in INVOICE_MEASURES})
+        cols['month'] = np.empty(0, dtype='datetime64[M]')
+        cols['first_day'] = cols['last_day'] = np.empty(0, dtype='datetime64[D]')
+        return cols
+    return {
+        'month': pd.to_datetime(df['month']).to_numpy().astype('datetime64[M]'),
+        'customer_id': df['customer_id'].to_numpy(dtype=np.int64),
+        'salesperson_id': df['salesperson_id'].to_numpy(dtype=np.int64),
+        **{name: df[name].to_numpy(dtype=np.float64) for name in INVOICE_MEASURES},
+        'first_day': pd.to_datetime(df['first_day']).to_numpy().astype('datetime64[D]'),
+        'last_day': pd.to_datetime(df['last_day']).to_numpy().astype('datetime64[D]'),
+    }
+
+
+def _invoice_months(df: pd.DataFrame) -> dict:
+    months = pd.to_datetime(df['month']).to_numpy().astype('datetime64[M]')
+    return dict(zip(df['invoice_id'].astype(int).tolist(), months.tolist()))
+
+
+def _months_where(months) -> str:
+    clauses = []
+    for month in sorted(months):
+        start = np.datetime64(month, 'M')
+        clauses.append(f"(i.InvoiceDate >= '{start.astype('datetime64[D]')}' "
+                       f"AND i.InvoiceDate < '{(start + 1).astype('datetime64[D]')}')")
+    return "(" + " OR ".join(clauses) + ")"
+
+
+class SalesCube:
+    """Month-grain cube over the invoice-line fact table.
+
+    Args:
+        run_sql: Callable executing a query and returning a DataFrame.
+    """
+
+    def __init__(self, run_sql):
+        self._run_sql = run_sql
+        self._state = None
+        self._load_lock = threading.Lock()
+        self.loaded_at = None
+        self.refreshed_at = None
+
+    # ------------------------------------------------------------------
+    # loading
+    # ------------------------------------------------------------------
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    def _build_state(self, cells: dict, invoices: dict, dims: dict, invoice_month: dict) -> dict:
+        # Data span, used to decide whether an unaligned range edge still covers whole cells.
+        span = (invoices['first_day'].min(), invoices['last_day'].max()) if len(invoices['first_day']) else None
+        return {'cells': cells, 'invoices': invoices, 'dims': dims, 'span': span, 'invoice_month': invoice_month}
+
+    def load(self) -> int:
+        """(Re)build the whole cube. Returns the number of line cells."""
+        with self._load_lock:
+            dims = load_dimensions(self._run_sql)
+            cells = _cells_to_columns(self._run_sql(CELLS_SQL.format(where='1 = 1')))
+            invoices = _invoice_cells_to_columns(self._run_sql(INVOICE_CELLS_SQL.format(where='1 = 1')))
+            invoice_month = _invoice_months(self._run_sql(INVOICE_MONTHS_SQL.format(where='1 = 1')))
+            self._state = self._build_state(cells, invoices, dims, invoice_month)
+            self.loaded_at = self.refreshed_at = datetime.utcnow()
+            return len(cells['month'])
+
+    def apply_changes(self, changes: dict) -> int:
+        """Rebuild the months touched by a change-capture delta. Returns the number of months rebuilt.
+
+        Both the current month of each changed invoice and the month the cube
+        last saw it in are rebuilt, so re-dated and deleted invoices leave no
+        stale cells behind.
+        """
+        invoice_ids = set()
+        for table in ('Sales.Invoices', 'Sales.InvoiceLines'):
+            df = changes.get(table)
+            if df is not None and not df.empty:
+                invoice_ids.update(int(i) for i in df['InvoiceID'].dropna())
+        if not invoice_ids or not self.ready:
+            return 0
+        ids = sorted(invoice_ids)
+        current = {}
+        for pos in range(0, len(ids), INVOICE_CHUNK):
+            chunk = ",".join(str(i) for i in ids[pos:pos + INVOICE_CHUNK])
+            found = self._run_sql(INVOICE_MONTHS_SQL.format(where=f'i.InvoiceID IN ({chunk})'))
+            current.update(_invoice_months(found))
+        previous = self._state['invoice_month']
+        months = set(current.values()) | {previous[i] for i in ids if i in previous}
+        if not months:
+            return 0
+        where = _months_where(months)
+        fresh_cells = _cells_to_columns(self._run_sql(CELLS_SQL.format(where=where)))
+        fresh_invoices = _invoice_cells_to_columns(self._run_sql(INVOICE_CELLS_SQL.format(where=where)))
+        rebuilt = np.array(sorted(months), dtype='datetime64[M]')
+        with self._load_lock:
+            state = self._state
+            dims = state['dims']
+            if has_unknown_ids(dims, fresh_cells['customer_id'], fresh_cells['stock_item_id']):
+                dims = load_dimensions(self._run_sql)
+            merged = []
+            for old, new in ((state['cells'], fresh_cells), (state['invoices'], fresh_invoices)):
+                keep = ~np.isin(old['month'], rebuilt)
+                merged.append({name: np.concatenate([old[name][keep], new[name]]) for name in old})
+            invoice_month = {i: m for i, m in state['invoice_month'].items() if i not in invoice_ids}
+            invoice_month.update(current)
+            self._state = self._build_state(merged[0], merged[1], dims, invoice_month)
+            self.refreshed_at = datetime.utcnow()
+        return len(months)
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            'ready': self.ready,
+            'cells': int(len(state['cells']['month'])) if state else 0,
+            'invoice_cells': int(len(state['invoices']['month'])) if state else 0,
+            'loaded_at': self.loaded_at.isoformat() if self.loaded_at else None,
+            'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None,
+        }
+
+    # ------------------------------------------------------------------
+    # rollups
+    # ------------------------------------------------------------------
+    def _snapshot(self) -> dict:
+        state = self._state
+        if state is None:
+            raise CubeMiss('Cube not built yet')
+        return state
+
+    @staticmethod
+    def _month_range(state: dict, start_date: str, end_date: str = None):
+        """Month bounds for [start, end], or ``CubeMiss`` when an edge cuts through a month with data."""
+        start = np.datetime64(start_date, 'D')
+        end = np.datetime64(end_date or datetime.utcnow().strftime('%Y-%m-%d'), 'D')
+        first_month, last_month = start.astype('datetime64[M]'), end.astype('datetime64[M]')
+        span = state['span']
+        if span is None:
+            return first_month, last_month
+        if start != first_month.astype('datetime64[D]') and start > span[0]:
+            raise CubeMiss(f'{start} is not the first day of a month')
+        if end != (last_month + 1).astype('datetime64[D]') - 1 and end < span[1]:
+            raise CubeMiss(f'{end} is not the last day of a month')
+        return first_month, last_month
+
+    def _cells(self, grain: str, start_date: str, end_date: str = None, **equals):
+        state = self._snapshot()
+        first_month, last_month = self._month_range(state, start_date, end_date)
+        table = state['cells' if grain == 'lines' else 'invoices']
+        mask = (table['month'] >= first_month) & (table['month'] <= last_month)
+        for name, value in equals.items():
+            mask &= table[name] == int(value)
+        return {name: arr[mask] for name, arr in table.items()}, state['dims']
+
+    def rollup(self, by: str, start_date: str = '2023-01-01', end_date: str = None,
+               grain: str = 'lines', **equals):
+        """Sum the cube over a whole-month range, grouped by one dimension.
+
+        Args:
+            by: Dimension to keep: ``month``, ``customer_id``, ``stock_item_id`` or ``salesperson_id``.
+            grain: ``lines`` for revenue/profit/quantity/line_count, ``invoices`` for invoice/order counts.
+            equals: Optional dimension filters, e.g. ``customer_id=42``.
+
+        Returns:
+            ``(keys, {measure: sums})`` with ``keys`` sorted ascending.
+        """
+        sel, _ = self._cells(grain, start_date, end_date, **equals)
+        measures = LINE_MEASURES if grain == 'lines' else INVOICE_MEASURES
+        keys, _, sums = group_sums(sel[by], *(sel[name] for name in measures))
+        return keys, dict(zip(measures, sums))
+
+    @staticmethod
+    def _align(keys: np.ndarray, other_keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """Re-index ``values`` (keyed by ``other_keys``) onto ``keys``; missing keys get 0."""
+        out = np.zeros(len(keys), dtype=np.float64)
+        if len(other_keys):
+            pos = np.clip(np.searchsorted(other_keys, keys), 0, len(other_keys) - 1)
+            hit = other_keys[pos] == keys
+            out[hit] = values[pos[hit]]
+        return out
+
+    def _with_invoices(self, by: str, start_date: str, end_date: str = None, **equals):
+        keys, sums = self.rollup(by, start_date, end_date, **equals)
+        inv_keys, inv_sums = self.rollup(by, start_date, end_date, grain='invoices', **equals)
+        sums['invoices'] = self._align(keys, inv_keys, inv_sums['invoices']).astype(np.int64)
+        sums['orders'] = self._align(keys, inv_keys, inv_sums['orders']).astype(np.int64)
+        return keys, sums
+
+    # ------------------------------------------------------------------
+    # analytics equivalents
+    # ------------------------------------------------------------------
+    def monthly_revenue(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        months, sums = self.rollup('month', start_date, end_date)
+        return pd.DataFrame({'month': months_to_dates(months), 'revenue': sums['revenue']})
+
+    def monthly_cogs(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        sel, dims = self._cells('lines', start_date, end_date)
+        item_ids, item_index = np.unique(sel['stock_item_id'], return_inverse=True)
+        cost = np.array([dims['item_cost'].get(int(i), 0.0) for i in item_ids], dtype=np.float64)
+        months, _, (cogs,) = group_sums(sel['month'], sel['quantity'] * cost[item_index])
+        return pd.DataFrame({'month': months_to_dates(months), 'cogs': cogs})
+
+    def top_customers(self, start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> pd.DataFrame:
+        ids, sums = self._with_invoices('customer_id', start_date, end_date)
+        return top_customers_frame(self._snapshot()['dims'], ids, sums['revenue'], sums['profit'],
+                                   sums['line_count'], sums['invoices'], limit)
+
+    def top_products(self, start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> pd.DataFrame:
+        ids, sums = self.rollup('stock_item_id', start_date, end_date)
+        return top_products_frame(self._snapshot()['dims'], ids, sums['quantity'], sums['revenue'],
+                                  sums['profit'], limit)
+
+    def salesperson_performance(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        ids, sums = self._with_invoices('salesperson_id', start_date, end_date)
+        return salesperson_frame(self._snapshot()['dims'], ids, sums['revenue'], sums['profit'],
+                                 sums['line_count'], sums['invoices'])
+
+    def customer_segmentation(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        ids, sums = self._with_invoices('customer_id', start_date, end_date)
+        return segmentation_frame(self._snapshot()['dims'], ids, sums['revenue'], sums['line_count'],
+                                  sums['invoices'])
+
+    def product_monthly_units(self, stock_item_id: int, start_date: str, end_date: str) -> pd.DataFrame:
+        months, sums = self.rollup('month', start_date, end_date, stock_item_id=stock_item_id)
+        return product_monthly_units_frame(self._snapshot()['dims'], stock_item_id, months, sums['quantity'])
+
+    def customer_metrics(self, customer_id: int, start_date: str, end_date: str) -> dict:
+        lines, _ = self._cells('lines', start_date, end_date, customer_id=customer_id)
+        invoices, _ = self._cells('invoices', start_date, end_date, customer_id=customer_id)
+        line_count = lines['line_count'].sum()
+        if line_count == 0:
+            return empty_customer_metrics()
+        revenue = float(lines['revenue'].sum())
+        # An order is only ever invoiced once in WideWorldImporters, so summing
+        # per-cell distinct orders equals the distinct count over the range.
+        return {
+            'revenue': revenue,
+            'profit': float(lines['profit'].sum()),
+            'invoices': int(invoices['invoices'].sum()),
+            'orders': int(invoices['orders'].sum()),
+            'avg_line_value': revenue / float(line_count),
+            'first_purchase': pd.Timestamp(invoices['first_day'].min()).date(),
+            'last_purchase': pd.Timestamp(invoices['last_day'].max()).date(),
+        }
+
+    def customer_monthly_sales(self, customer_id: int, start_date: str, end_date: str) -> pd.DataFrame:
+        months, sums = self.rollup('month', start_date, end_date, customer_id=customer_id)
+        return pd.DataFrame({'month': months_to_dates(months), 'revenue': sums['revenue'], 'profit': sums['profit']})
+
+    def customer_top_products(self, customer_id: int, start_date: str, end_date: str, limit: int = 5) -> pd.DataFrame:
+        item_ids, sums = self.rollup('stock_item_id', start_date, end_date, customer_id=customer_id)
+        return customer_top_products_frame(self._snapshot()['dims'], item_ids, sums['quantity'],
+                                           sums['revenue'], sums['profit'], limit)
+
+    def customer_profile(self, customer_id: int, start_date: str, end_date: str, limit: int = 5) -> tuple:
+        return (
+            self.customer_metrics(customer_id, start_date, end_date),
+            self.customer_monthly_sales(customer_id, start_date, end_date),
+            self.customer_top_products(customer_id, start_date, end_date, limit),
+        )
@@ -0,0 +1,325 @@
+"""Bounded, pre-warmed pyodbc connection pool.
+
+Opening a SQL Server connection costs a TCP + TLS + login handshake, which
+dominates the latency of the small analytics queries.  The pool keeps a
+bounded set of open connections, hands them out one request at a time and
+validates them on checkout so a dropped connection never reaches a caller.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import pyodbc
+
+
+class PoolExhausted(RuntimeError):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """Thread-safe pool of pyodbc connections.
+
+    Args:
+        conn_str: ODBC connection string.
+        min_size: Connections opened by ``warm()`` and kept through idle reaping.
+        max_size: Upper bound on open connections (idle + checked out).
+        idle_timeout: Seconds an idle connection may sit in the pool before it is closed.
+        max_lifetime: Seconds after which a connection is recycled regardless of use.
+        checkout_timeout: Seconds ``acquire()`` waits for a free slot before raising.
+        health_check_after: Connections idle for longer than this are pinged on checkout.
+        connect_kwargs: Extra keyword arguments passed to ``pyodbc.connect``.
+    """
+
+    def __init__(self, conn_str: str, min_size: int = 1, max_size: int = 10,
+                 idle_timeout: float = 300.0, max_lifetime: float = 3600.0,
+                 checkout_timeout: float = 30.0, health_check_after: float = 30.0,
+                 **connect_kwargs):
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        self.conn_str = conn_str
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.connect_kwargs = connect_kwargs
+
+        self._idle = []
+        self._in_use = 0
+        self._lock = threading.Condition()
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'discarded': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'reaped': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # connection lifecycle
+    # ------------------------------------------------------------------
+    def _open(self) -> _PooledConnection:
+        conn = pyodbc.connect(self.conn_str, **self.connect_kwargs)
+        with self._lock:
+            self._stats['created'] += 1
+        return _PooledConnection(conn)
+
+    def _discard(self, entry: _PooledConnection):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._stats['discarded'] += 1
+
+    def _is_healthy(self, entry: _PooledConnection) -> bool:
+        now = time.monotonic()
+        if now - entry.created_at > self.max_lifetime:
+            return False
+        if now - entry.last_used < self.health_check_after:
+            return True
+        try:
+            cursor = entry.conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+            return False
+
+    def warm(self) -> int:
+        """Open connections until ``min_size`` are idle. Returns the number opened."""
+        opened = 0
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) + self._in_use >= self.min_size:
+                    break
+                # Reserve the slot so concurrent warmers do not overshoot.
+                self._in_use += 1
+            try:
+                entry = self._open()
+            except Exception:
+                with self._lock:
+                    self._in_use -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._in_use -= 1
+                self._idle.append(entry)
+                self._lock.notify()
+            opened += 1
+        return opened
+
+    def acquire(self):
+        """Check out a healthy connection, opening one if the pool has capacity."""
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError('Connection pool is closed')
+                entry = None
+                if self._idle:
+                    entry = self._idle.pop()
+                    self._in_use += 1
+                elif self._in_use < self.max_size:
+                    self._in_use += 1
+                else:
+                    self._stats['waits'] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._lock.wait(remaining):
+                        if not self._idle and self._in_use >= self.max_size:
+                            self._stats['timeouts'] += 1
+                            raise PoolExhausted(
+                                f'No database connection available within {self.checkout_timeout:g}s '
+                                f'(max_size={self.max_size})'
+                            )
+                    continue
+                self._stats['checkouts'] += 1
+
+            if entry is not None and not self._is_healthy(entry):
+                self._discard(entry)
+                entry = None
+            if entry is None:
+                try:
+                    entry = self._open()
+                except Exception:
+                    with self._lock:
+                        self._in_use -= 1
+                        self._lock.notify()
+                    raise
+            return entry
+
+    def release(self, entry: _PooledConnection, broken: bool = False):
+        """Return a connection to the pool; broken connections are closed instead."""
+        if not broken:
+            try:
+                # Never hand a connection with an open transaction to the next caller.
+                entry.conn.rollback()
+            except Exception:
+                broken = True
+        with self._lock:
+            self._in_use -= 1
+            keep = not broken and not self._closed
+            if keep:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._lock.notify()
+        if not keep:
+            self._discard(entry)
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a raw pyodbc connection from the pool."""
+        entry = self.acquire()
+        broken = False
+        try:
+            yield entry.conn
+        except pyodbc.Error:
+            # Driver-level failures may leave the connection unusable; do not reuse it.
+            broken = True
+            raise
+        finally:
+            self.release(entry, broken=broken)
+
+    def reap_idle(self) -> int:
+        """Close idle connections past ``idle_timeout``/``max_lifetime`` while keeping ``min_size``."""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            keep = []
+            # Most recently used connections live at the end of the list.
+            for entry in reversed(self._idle):
+                total = len(keep) + self._in_use
+                stale = (now - entry.last_used > self.idle_timeout and total >= self.min_size)
+                if stale or now - entry.created_at > self.max_lifetime:
+                    expired.append(entry)
+                else:
+                    keep.append(entry)
+            self._idle = list(reversed(keep))
+            self._stats['reaped'] += len(expired)
+        for entry in expired:
+            self._discard(entry)
+        return len(expired)
+
+    def close(self):
+        """Close every idle connection and refuse new checkouts."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._lock.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'pool_closed': self._closed,
+                **self._stats,
+            }
+
+
+class _Reaper(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name='db-pool-reaper', daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            for pool in list(_POOLS.values()):
+                try:
+                    pool.reap_idle()
+                except Exception:
+                    pass
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+_reaper = None
+
+
+def get_pool(conn_str: str, reap_interval: float = 60.0, **pool_kwargs) -> ConnectionPool:
+    """Return the process-wide pool for ``conn_str``, creating it on first use.
+
+    Pools are keyed on the connection string plus any ``pyodbc.connect`` keyword
+    arguments (e.g. ``autocommit``), so callers with different session settings
+    never share connections.
+    """
+    global _reaper
+    connect_keys = {k: v for k, v in pool_kwargs.items() if k not in _POOL_OPTIONS}
+    key = (conn_str, tuple(sorted(connect_keys.items())))
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None or pool.closed:
+            pool = ConnectionPool(conn_str, **pool_kwargs)
+            _POOLS[key] = pool
+        if _reaper is None and reap_interval:
+            _reaper = _Reaper(reap_interval)
+            _reaper.start()
+    return pool
+
+
+def all_pool_stats() -> list:
+    """Stats for every pool in this process, with credentials stripped."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    result = []
+    for pool in pools:
+        stats = pool.stats()
+        stats['target'] = _describe_target(pool.conn_str)
+        result.append(stats)
+    return result
+
+
+def close_all():
+    global _reaper
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+        reaper, _reaper = _reaper, None
+    if reaper is not None:
+        reaper.stop()
+    for pool in pools:
+        pool.close()
+
+
+_POOL_OPTIONS = {
+    'min_size', 'max_size', 'idle_timeout', 'max_lifetime',
+    'checkout_timeout', 'health_check_after',
+}
+
+
+def _describe_target(conn_str: str) -> str:
+    parts = {}
+    for chunk in conn_str.split(';'):
+        if '=' in chunk:
+            k, v = chunk.split('=', 1)
+            parts[k.strip().upper()] = v.strip()
+    return f"{parts.get('SERVER', '?')}/{parts.get('DATABASE', '?')}"
@@ -0,0 +1,164 @@
+"""Shared pieces of the in-process analytics engines.
+
+Each engine (replica, cube, prefix index) computes per-group sums its own way
+and hands them to the builders below, so every engine returns exactly the
+columns, ordering and rounding of the SQL functions in ``analytics.py``.
+"""
+import numpy as np
+import pandas as pd
+
+
+CUSTOMERS_SQL = "SELECT CustomerID, CustomerName FROM [Sales].[Customers]"
+
+ITEMS_SQL = """
+SELECT
+  si.StockItemID, si.StockItemName, si.Brand,
+  COALESCE(s.LastCostPrice, si.UnitPrice) AS unit_cost
+FROM [Warehouse].[StockItems] si
+LEFT JOIN [Warehouse].[StockItemHoldings] s ON s.StockItemID = si.StockItemID
+"""
+
+PEOPLE_SQL = "SELECT PersonID, FullName FROM [Application].[People]"
+
+
+def load_dimensions(run_sql) -> dict:
+    """Id -> name/brand/cost lookups used to label engine results."""
+    customers = run_sql(CUSTOMERS_SQL)
+    items = run_sql(ITEMS_SQL)
+    people = run_sql(PEOPLE_SQL)
+    return {
+        'customer_name': dict(zip(customers['CustomerID'].astype(int), customers['CustomerName'])),
+        'item_name': dict(zip(items['StockItemID'].astype(int), items['StockItemName'])),
+        'item_brand': dict(zip(items['StockItemID'].astype(int), items['Brand'])),
+        'item_cost': dict(zip(items['StockItemID'].astype(int), items['unit_cost'].astype(float))),
+        'person_name': dict(zip(people['PersonID'].astype(int), people['FullName'])),
+    }
+
+
+def has_unknown_ids(dims: dict, customer_ids, item_ids) -> bool:
+    """True when new rows reference customers or items the lookups have not seen."""
+    return bool(set(np.asarray(customer_ids).tolist()) - set(dims['customer_name'])
+                or set(np.asarray(item_ids).tolist()) - set(dims['item_name']))
+
+
+# ----------------------------------------------------------------------
+# array helpers
+# ----------------------------------------------------------------------
+def group_sums(keys: np.ndarray, *weights):
+    """Unique keys plus the per-key sum of each weight array."""
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    sums = [np.bincount(inverse, weights=w, minlength=len(uniq)) for w in weights]
+    return uniq, inverse, sums
+
+
+def distinct_per_group(inverse: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """COUNT(DISTINCT values) for every group index in ``inverse``."""
+    if len(values) == 0:
+        return np.zeros(n_groups, dtype=np.int64)
+    offset = values - values.min()
+    span = int(offset.max()) + 1
+    pairs = np.unique(inverse.astype(np.int64) * span + offset)
+    return np.bincount(pairs // span, minlength=n_groups)
+
+
+def order_desc(values: np.ndarray) -> np.ndarray:
+    return np.argsort(-values, kind='stable')
+
+
+def months_to_dates(months: np.ndarray) -> list:
+    return [m.date() for m in pd.to_datetime(np.asarray(months).astype('datetime64[D]'))]
+
+
+def round2(values, digits: int = 2):
+    return np.round(np.asarray(values, dtype=np.float64), digits)
+
+
+def _margin(profit: np.ndarray, revenue: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(revenue != 0, profit / revenue * 100, np.nan)
+
+
+# ----------------------------------------------------------------------
+# result frames
+# ----------------------------------------------------------------------
+def top_customers_frame(dims: dict, ids, revenue, profit, lines, invoices, limit: int) -> pd.DataFrame:
+    top = order_desc(revenue)[:limit]
+    return pd.DataFrame({
+        'CustomerID': ids[top],
+        'CustomerName': [dims['customer_name'].get(int(i)) for i in ids[top]],
+        'total_revenue': revenue[top],
+        'order_count': np.asarray(invoices, dtype=np.int64)[top],
+        'avg_order_value': round2(revenue[top] / lines[top]),
+        'total_profit': round2(profit[top]),
+    })
+
+
+def top_products_frame(dims: dict, ids, units, revenue, profit, limit: int) -> pd.DataFrame:
+    top = order_desc(units)[:limit]
+    return pd.DataFrame({
+        'StockItemID': ids[top],
+        'StockItemName': [dims['item_name'].get(int(i)) for i in ids[top]],
+        'Brand': [dims['item_brand'].get(int(i)) for i in ids[top]],
+        'total_units': units[top],
+        'total_revenue': round2(revenue[top]),
+        'total_profit': round2(profit[top]),
+        'profit_margin_pct': round2(_margin(profit[top], revenue[top])),
+    })
+
+
+def salesperson_frame(dims: dict, ids, revenue, profit, lines, invoices) -> pd.DataFrame:
+    order = order_desc(revenue)
+    return pd.DataFrame({
+        'salesperson': [dims['person_name'].get(int(i)) or 'Unknown' for i in ids[order]],
+        'total_invoices': np.asarray(invoices, dtype=np.int64)[order],
+        'total_revenue': round2(revenue[order]),
+        'total_profit': round2(profit[order]),
+        'avg_line_value': round2(revenue[order] / lines[order]),
+        'profit_margin_pct': round2(_margin(profit[order], revenue[order])),
+    })
+
+
+def segmentation_frame(dims: dict, ids, spent, lines, purchases) -> pd.DataFrame:
+    purchases = np.asarray(purchases, dtype=np.int64)
+    segment = np.select(
+        [(spent > 500000) & (purchases > 50), (spent > 250000) & (purchases > 25), spent > 50000],
+        ['VIP', 'High Value', 'Regular'],
+        default='At Risk',
+    )
+    order = order_desc(spent)
+    return pd.DataFrame({
+        'CustomerID': ids[order],
+        'CustomerName': [dims['customer_name'].get(int(i)) for i in ids[order]],
+        'total_spent': spent[order],
+        'purchase_count': purchases[order],
+        'avg_order_value': round2(spent[order] / lines[order]),
+        'segment': segment[order],
+    })
+
+
+def product_monthly_units_frame(dims: dict, stock_item_id: int, months, units) -> pd.DataFrame:
+    return pd.DataFrame({
+        'month': months_to_dates(months),
+        'StockItemID': np.full(len(months), int(stock_item_id)),
+        'StockItemName': [dims['item_name'].get(int(stock_item_id))] * len(months),
+        'total_units': units,
+    })
+
+
+def customer_top_products_frame(dims: dict, item_ids, units, revenue, profit, limit: int) -> pd.DataFrame:
+    # The SQL version groups by item name, not id.
+    names = np.array([dims['item_name'].get(int(i)) or '' for i in item_ids], dtype=object)
+    uniq, _, (units, revenue, profit) = group_sums(names, units, revenue, profit)
+    top = order_desc(revenue)[:limit]
+    return pd.DataFrame({
+        'StockItemName': uniq[top],
+        'total_units': units[top],
+        'revenue': revenue[top],
+        'profit': profit[top],
+    })
+
+
+def empty_customer_metrics() -> dict:
+    """Mirrors the SQL aggregate over zero rows after fillna(0)."""
+    return {'revenue': 0, 'profit': 0, 'invoices': 0, 'orders': 0,
+            'avg_line_value': 0, 'first_purchase': 0, 'last_purchase': 0}
@@ -0,0 +1,238 @@
+"""Vectorized demand forecasting over an item x month matrix.
+
+Monthly units for many items are laid out as one ``(items, months)`` array
+with NaN where an item sold nothing that month (the SQL only returns months
+with sales).  Every model here works on the whole matrix at once, and a
+single item is just a one-row matrix, so ``forecast_product_demand`` and the
+batch endpoint share the same code and return the same numbers.
+
+The linear blend mirrors the original per-item logic: a least-squares line
+over the item's months with sales (indexed 0..n-1, gaps ignored), blended
+70/30 with the mean of its last six such months, floored at 60% of that mean.
+
+The seasonal models work on calendar months instead: each row is shifted to
+end at its last month with sales, and months without sales inside that span
+count as zero.  Seasonal naive repeats the same month of the previous year;
+additive Holt-Winters fits level, trend and monthly offsets, choosing its
+smoothing constants per item from a small grid by one-step-ahead error.  Rows
+with too little history fall back to the next simpler model.
+"""
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+
+RECENT_WINDOW = 6
+SEASON_LENGTH = 12
+# Smoothing constants tried for every item; the grid is evaluated in one batch.
+HW_ALPHAS = (0.1, 0.3, 0.5)
+HW_BETAS = (0.0, 0.1)
+HW_GAMMAS = (0.1, 0.3)
+
+
+def item_month_matrix(df: pd.DataFrame) -> dict:
+    """Pivot ``month, StockItemID, StockItemName, total_units`` rows into a dense matrix.
+
+    Returns ``ids``, ``names`` (aligned with the rows), ``months`` (a month-start
+    ``DatetimeIndex`` covering every column) and ``units`` (float, NaN = no sales).
+    """
+    if df.empty:
+        return {'ids': np.array([], dtype=np.int64), 'names': [],
+                'months': pd.DatetimeIndex([]), 'units': np.empty((0, 0))}
+    frame = df.assign(month=pd.to_datetime(df['month']))
+    months = pd.date_range(frame['month'].min(), frame['month'].max(), freq='MS')
+    ids, rows = np.unique(frame['StockItemID'].to_numpy(dtype=np.int64), return_inverse=True)
+    cols = ((frame['month'].dt.year - months[0].year) * 12 + frame['month'].dt.month - months[0].month).to_numpy()
+    units = np.zeros((len(ids), len(months)))
+    np.add.at(units, (rows, cols), frame['total_units'].to_numpy(dtype=float))
+    observed = np.zeros(units.shape, dtype=bool)
+    observed[rows, cols] = True
+    units[~observed] = np.nan
+    names = frame.drop_duplicates('StockItemID').set_index('StockItemID')['StockItemName']
+    return {'ids': ids, 'names': [names.get(int(i)) for i in ids], 'months': months, 'units': units}
+
+
+def _observed_positions(units: np.ndarray):
+    """Mask of observed cells, each cell's index among its row's observed months, and per-row counts."""
+    mask = ~np.isnan(units)
+    position = np.cumsum(mask, axis=1) - 1
+    return mask, position, mask.sum(axis=1)
+
+
+def linear_trend(units: np.ndarray):
+    """Per-row least-squares ``(slope, intercept)`` over observed months (slope 0 below two points)."""
+    mask, position, n = _observed_positions(units)
+    x = np.where(mask, position, 0).astype(float)
+    y = np.where(mask, units, 0.0)
+    sx, sy = x.sum(axis=1), y.sum(axis=1)
+    sxx, sxy = (x * x).sum(axis=1), (x * y).sum(axis=1)
+    denom = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where((n >= 2) & (denom != 0), (n * sxy - sx * sy) / denom, 0.0)
+        intercept = np.where(n > 0, (sy - slope * sx) / n, np.nan)
+    return slope, intercept
+
+
+def recent_mean(units: np.ndarray, window: int = RECENT_WINDOW) -> np.ndarray:
+    """Mean of each row's last ``window`` observed months."""
+    mask, position, n = _observed_positions(units)
+    recent = mask & (position >= (n - window)[:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(recent, units, 0.0).sum(axis=1) / recent.sum(axis=1)
+
+
+def last_observed(units: np.ndarray) -> np.ndarray:
+    """Column index of each row's last observed month (-1 when the row is empty)."""
+    mask = ~np.isnan(units)
+    last = units.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+    return np.where(mask.any(axis=1), last, -1)
+
+
+def linear_blend(units: np.ndarray, months_ahead: int) -> np.ndarray:
+    """``(items, months_ahead)`` forecasts: 0.7 x trend + 0.3 x recent mean, floored at 0.6 x recent mean.
+
+    Step ``s`` continues the trend at observed-month index ``n + s - 1``.
+    """
+    slope, intercept = linear_trend(units)
+    recent = recent_mean(units)
+    n = (~np.isnan(units)).sum(axis=1)
+    future_index = n[:, None] + np.arange(months_ahead)[None, :]
+    trend = slope[:, None] * future_index + intercept[:, None]
+    blended = 0.7 * trend + 0.3 * recent[:, None]
+    return np.maximum(0.6 * recent[:, None], blended)
+
+
+def calendar_series(units: np.ndarray):
+    """Rows shifted to end at their last observed month, with gaps inside the span filled with 0.
+
+    Returns ``(series, span)``: cells before an item's first sale stay NaN and
+    ``span`` is the number of months from its first to its last sale.
+    """
+    n_rows, n_cols = units.shape
+    mask = ~np.isnan(units)
+    first = np.argmax(mask, axis=1)
+    last = last_observed(units)
+    span = np.where(last >= 0, last - first + 1, 0)
+    source = np.arange(n_cols)[None, :] - (n_cols - 1 - last)[:, None]
+    inside = (source >= first[:, None]) & (source <= last[:, None])
+    values = np.nan_to_num(units[np.arange(n_rows)[:, None], np.clip(source, 0, n_cols - 1)])
+    return np.where(inside, values, np.nan), span
+
+
+def seasonal_naive(units: np.ndarray, months_ahead: int) -> np.ndarray:
+    """Same calendar month a year earlier; rows with under a year of history use ``linear_blend``."""
+    fallback = linear_blend(units, months_ahead)
+    series, span = calendar_series(units)
+    n_cols = series.shape[1]
+    if n_cols < SEASON_LENGTH:
+        return fallback
+    cols = n_cols - SEASON_LENGTH + np.arange(months_ahead) % SEASON_LENGTH
+    return np.where((span >= SEASON_LENGTH)[:, None], series[:, cols], fallback)
+
+
+def holt_winters(units: np.ndarray, months_ahead: int) -> np.ndarray:
+    """Additive Holt-Winters; rows with under two years of history use ``seasonal_naive``.
+
+    Level, trend and offsets start from the first two seasons and are updated
+    month by month for all items and every grid point at once; each item keeps
+    the ``(alpha, beta, gamma)`` with the lowest one-step-ahead squared error.
+    """
+    m = SEASON_LENGTH
+    out = seasonal_naive(units, months_ahead)
+    series, span = calendar_series(units)
+    ok = span >= 2 * m
+    if not ok.any():
+        return out
+    y, start = series[ok], series.shape[1] - span[ok]
+    n_cols = y.shape[1]
+    rows = np.arange(len(y))
+    first = y[rows[:, None], start[:, None] + np.arange(m)]
+    second = y[rows[:, None], start[:, None] + m + np.arange(m)]
+
+    grid = np.array(list(itertools.product(HW_ALPHAS, HW_BETAS, HW_GAMMAS)))
+    alpha, beta, gamma = (grid[:, i, None] for i in range(3))
+    level = np.repeat(first.mean(axis=1)[None], len(grid), axis=0)
+    trend = np.repeat(((second.mean(axis=1) - first.mean(axis=1)) / m)[None], len(grid), axis=0)
+    season = np.repeat((first - first.mean(axis=1)[:, None])[None], len(grid), axis=0)
+    sse = np.zeros(level.shape)
+
+    for t in range(int(start.min()) + m, n_cols):
+        active = t >= start + m
+        phase = (t - start) % m
+        observed = y[:, t]
+        previous = season[:, rows, phase]
+        error = observed - (level + trend + previous)
+        new_level = alpha * (observed - previous) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        season[:, rows, phase] = np.where(active, gamma * (observed - new_level) + (1 - gamma) * previous, previous)
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+        sse += np.where(active, error * error, 0.0)
+
+    best = sse.argmin(axis=0)
+    steps = np.arange(1, months_ahead + 1)
+    phase = (n_cols - 1 + steps[None, :] - start[:, None]) % m
+    offsets = season[best, rows]
+    forecast = (level[best, rows][:, None] + steps[None, :] * trend[best, rows][:, None]
+                + offsets[rows[:, None], phase])
+    out[ok] = np.maximum(forecast, 0.0)
+    return out
+
+
+# Model name -> fn(units, months_ahead) returning an (items, months_ahead) array.
+MODELS = {
+    'linear_blend': linear_blend,
+    'seasonal_naive': seasonal_naive,
+    'holt_winters': holt_winters,
+}
+
+MODEL_DESCRIPTIONS = {
+    'linear_blend': 'Baseline linear trend forecast blended with recent performance.',
+    'seasonal_naive': 'Seasonal naive forecast: each month repeats the same month of the previous year.',
+    'holt_winters': 'Additive Holt-Winters forecast with level, trend and monthly seasonality.',
+}
+
+FORECAST_DEFAULT_MODEL = os.getenv('FORECAST_DEFAULT_MODEL', 'holt_winters')
+if FORECAST_DEFAULT_MODEL not in MODELS:
+    print(f"[WARN] Unknown FORECAST_DEFAULT_MODEL '{FORECAST_DEFAULT_MODEL}', using holt_winters")
+    FORECAST_DEFAULT_MODEL = 'holt_winters'
+
+
+def resolve_model(model: str = None) -> str:
+    """``model`` or the configured default; raises ``ValueError`` for unknown names."""
+    name = model or FORECAST_DEFAULT_MODEL
+    if name not in MODELS:
+        raise ValueError(f"Unknown forecast model '{name}'. Choose one of: {', '.join(MODELS)}")
+    return name
+
+
+def forecast_months(months: pd.DatetimeIndex, last: np.ndarray, months_ahead: int) -> list:
+    """Per row, the ``months_ahead`` month starts following its last observed month."""
+    return [[(months[idx] + pd.offsets.MonthBegin(step)).normalize() for step in range(1, months_ahead + 1)]
+            for idx in last]
+
+
+def forecast_matrix(matrix: dict, months_ahead: int, model: str = None) -> list:
+    """Forecast every row of an ``item_month_matrix`` with ``model``; items without history are skipped.
+
+    Returns one dict per item with ``stock_item``, ``forecast`` and ``last_month``.
+    """
+    forecaster = MODELS[resolve_model(model)]
+    units = matrix['units']
+    if units.size == 0:
+        return []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = forecaster(units, months_ahead)
+    last = last_observed(units)
+    keep = np.flatnonzero(last >= 0)
+    future = forecast_months(matrix['months'], last[keep], months_ahead)
+    results = []
+    for row, months in zip(keep, future):
+        results.append({
+            'stock_item': {'id': int(matrix['ids'][row]), 'name': matrix['names'][row]},
+            'last_month': matrix['months'][last[row]],
+            'forecast': [{'month': month, 'units': float(value)} for month, value in zip(months, values[row])],
+        })
+    return results
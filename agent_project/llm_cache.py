@@ -0,0 +1,174 @@
+"""Persistent cache of LLM completions.
+
+Summaries, forecasts, customer insights and email drafts are often requested
+again with exactly the same prompt (same date range, same customer), and each
+call costs seconds and money.  Completions are stored in a SQLite file in WAL
+mode, so every worker process of the server reads and writes the same cache.
+Entries are keyed on (model, prompt hash, temperature, max_tokens), expire
+after ``LLM_CACHE_TTL`` seconds and the least recently used are evicted once
+the stored responses exceed ``LLM_CACHE_MAX_BYTES``.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'llm_cache.db')
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', str(6 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+# Eviction scans the table, so it runs once every this many writes.
+EVICT_EVERY = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+  key TEXT PRIMARY KEY,
+  model TEXT NOT NULL,
+  response TEXT NOT NULL,
+  bytes INTEGER NOT NULL,
+  created REAL NOT NULL,
+  accessed REAL NOT NULL
+)
+"""
+
+
+def completion_key(model: str, prompt: str, temperature=None, max_tokens=None) -> str:
+    """Stable key for one request; the prompt is hashed so keys stay short."""
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    raw = json.dumps([model, prompt_hash, temperature, max_tokens])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """SQLite-backed TTL + LRU store of completion text.
+
+    Args:
+        path: Database file, shared by every process that opens it.
+        ttl: Seconds an entry stays valid.
+        max_bytes: Upper bound on the stored response text.
+    """
+
+    def __init__(self, path: str, ttl: float = 21600.0, max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evicted': 0, 'errors': 0}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(_SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed)')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, field: str, n: int = 1):
+        with self._lock:
+            self._stats[field] += n
+
+    def get(self, key: str):
+        """Cached completion for ``key``, or ``None`` on a miss or expiry."""
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute('SELECT response FROM completions WHERE key = ? AND created > ?',
+                               (key, now - self.ttl)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE completions SET accessed = ? WHERE key = ?', (now, key))
+        except sqlite3.Error as exc:
+            print(f"[WARN] LLM cache read failed: {exc}")
+            self._count('errors')
+            return None
+        self._count('hits' if row is not None else 'misses')
+        return row[0] if row is not None else None
+
+    def set(self, key: str, model: str, response: str):
+        now = time.time()
+        try:
+            self._conn().execute(
+                'INSERT OR REPLACE INTO completions (key, model, response, bytes, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model, response, len(response.encode('utf-8')), now, now))
+        except sqlite3.Error as exc:
+            print(f"[WARN] LLM cache write failed: {exc}")
+            self._count('errors')
+            return
+        with self._lock:
+            self._stats['writes'] += 1
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 1
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones past ``max_bytes``. Returns rows removed."""
+        try:
+            conn = self._conn()
+            removed = conn.execute('DELETE FROM completions WHERE created <= ?',
+                                   (time.time() - self.ttl,)).rowcount
+            total = conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM completions').fetchone()[0]
+            if total > self.max_bytes:
+                stale = []
+                for key, size in conn.execute('SELECT key, bytes FROM completions ORDER BY accessed'):
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                conn.executemany('DELETE FROM completions WHERE key = ?', stale)
+                removed += len(stale)
+        except sqlite3.Error as exc:
+            print(f"[WARN] LLM cache eviction failed: {exc}")
+            self._count('errors')
+            return 0
+        self._count('evicted', removed)
+        return removed
+
+    def clear(self) -> int:
+        try:
+            return self._conn().execute('DELETE FROM completions').rowcount
+        except sqlite3.Error as exc:
+            print(f"[WARN] LLM cache clear failed: {exc}")
+            return 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._stats)
+        total = counters['hits'] + counters['misses']
+        counters['hit_rate'] = round(counters['hits'] / total, 4) if total else 0.0
+        try:
+            entries, size = self._conn().execute(
+                'SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM completions').fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        return {'path': self.path, 'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes,
+                'ttl': self.ttl, **counters}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Process-wide cache, or ``None`` when ``LLM_CACHE_ENABLED=0``."""
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES)
+    return _cache
+
+
+def llm_cache_stats() -> dict:
+    cache = get_llm_cache()
+    return cache.stats() if cache is not None else {'enabled': False}
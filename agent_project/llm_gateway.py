@@ -0,0 +1,521 @@
+"""Shared gateway for LLM calls.
+
+One sync and one async OpenAI client are created per process, each on a pooled
+HTTP connection set (``LLM_MAX_CONNECTIONS``), instead of a bare module-level
+client per caller.  Every call is bounded twice: a global concurrency limit
+(``LLM_MAX_CONCURRENCY``) and a per-route limit (``LLM_ROUTE_CONCURRENCY``,
+e.g. ``summary=4,email=2``), so a burst of one kind of request cannot take
+every slot.  The ``timeout`` of a call is a deadline covering both the wait for
+a slot and the request itself.  Sync and async callers are limited separately.
+
+Completions go through the persistent cache in ``llm_cache.py``.  A reply is
+only cached when it was not cut off at ``max_tokens`` and, if the caller passes
+``validate``, once that accepts it, so a malformed reply is never replayed.
+"""
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from typing import Optional
+
+from llm_cache import completion_key, get_llm_cache
+
+try:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+    HAS_OPENAI = True
+except Exception:
+    HAS_OPENAI = False
+
+
+class LLMUnavailable(RuntimeError):
+    """No LLM call was made: no client, no free slot before the deadline, or the deadline passed."""
+
+
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '20'))
+DEFAULT_ROUTE_LIMIT = 4
+
+
+def _parse_route_limits(raw: str) -> dict:
+    limits = {}
+    for part in (raw or '').split(','):
+        name, _, value = part.partition('=')
+        if name.strip() and value.strip():
+            try:
+                limits[name.strip()] = max(1, int(value))
+            except ValueError:
+                print(f"[WARN] Ignoring bad LLM_ROUTE_CONCURRENCY entry: {part!r}")
+    return limits
+
+
+LLM_ROUTE_CONCURRENCY = _parse_route_limits(
+    os.getenv('LLM_ROUTE_CONCURRENCY', 'summary=4,forecast=4,insight=4,email=2'))
+
+
+def llm_configured() -> bool:
+    """True when the OpenAI package is installed and an API key is set."""
+    api_key = os.getenv('OPENAI_API_KEY')
+    return HAS_OPENAI and bool(api_key) and api_key.startswith('sk-')
+
+
+def default_model() -> str:
+    return os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+
+
+class CircuitOpenError(LLMUnavailable):
+    """The circuit breaker is open: the provider is failing, so no call is attempted."""
+
+
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '3'))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker around the LLM provider.
+
+    ``failures`` consecutive failed or timed-out calls open the circuit; while
+    open every call fails fast with ``CircuitOpenError``.  After ``cooldown``
+    seconds one probe call is let through (half-open): success closes the
+    circuit, failure opens it for another cooldown.  Only the probe's own
+    outcome decides; a late answer to a call sent before the circuit opened
+    is ignored.
+    """
+
+    def __init__(self, failures: int = 3, cooldown: float = 30.0):
+        self.failures = max(1, failures)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self._stats = {'trips': 0, 'short_circuited': 0, 'probes': 0}
+
+    def allow(self) -> bool:
+        """Raise ``CircuitOpenError`` unless a call may go out now; ``True`` if that call is the probe."""
+        with self._lock:
+            if self._state == 'closed':
+                return False
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state = 'half_open'
+            if self._state == 'half_open' and not self._probing:
+                self._probing = True
+                self._stats['probes'] += 1
+                return True
+            self._stats['short_circuited'] += 1
+            retry_in = max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+            raise CircuitOpenError(f'LLM circuit open, next probe in {retry_in:.0f}s')
+
+    def record(self, outcome: Optional[str], probe: bool = False):
+        """Report an allowed call: ``'success'``, ``'failure'`` or ``None`` (no request was made).
+
+        ``probe`` is what ``allow`` returned for the call.
+        """
+        with self._lock:
+            if probe:
+                self._probing = False
+            elif self._state != 'closed':
+                return
+            if outcome == 'success':
+                self._state = 'closed'
+                self._consecutive = 0
+                self._opened_at = None
+            elif outcome == 'failure':
+                self._consecutive += 1
+                if probe or self._consecutive >= self.failures:
+                    if self._state != 'open':
+                        self._stats['trips'] += 1
+                    self._state = 'open'
+                    self._opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.cooldown:
+                return 'half_open'
+            return self._state
+
+    def stats(self) -> dict:
+        state = self.state
+        with self._lock:
+            retry_in = None
+            if self._state == 'open':
+                retry_in = round(max(0.0, self.cooldown - (time.monotonic() - self._opened_at)), 1)
+            return {
+                'state': state,
+                'consecutive_failures': self._consecutive,
+                'failure_threshold': self.failures,
+                'cooldown': self.cooldown,
+                'retry_in': retry_in,
+                **self._stats,
+            }
+
+
+class LLMGateway:
+    """Pooled OpenAI clients behind global and per-route concurrency limits.
+
+    Args:
+        max_concurrency: Calls in flight across all routes.
+        route_limits: Calls in flight per route name; unknown routes get ``DEFAULT_ROUTE_LIMIT``.
+        max_connections: Size of each HTTP connection pool.
+        breaker: Circuit breaker shared by all routes.
+    """
+
+    def __init__(self, max_concurrency: int = 8, route_limits: dict = None, max_connections: int = 20,
+                 breaker: CircuitBreaker = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.breaker = breaker or CircuitBreaker()
+        self.route_limits = dict(route_limits or {})
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._sync_limits = {}
+        self._async_limits = {}
+        self._async_loop = None
+        self._stats = {}
+
+    # ------------------------------------------------------------------
+    # clients and limits
+    # ------------------------------------------------------------------
+    def _http_limits(self):
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections)
+
+    def _sync_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0,
+                                      http_client=httpx.Client(limits=self._http_limits()))
+            return self._client
+
+    def _async_openai(self):
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0,
+                                                 http_client=httpx.AsyncClient(limits=self._http_limits()))
+            return self._async_client
+
+    def _route_limit(self, route: str) -> int:
+        return self.route_limits.get(route, DEFAULT_ROUTE_LIMIT)
+
+    def _sync_semaphores(self, route: str):
+        with self._lock:
+            if '*' not in self._sync_limits:
+                self._sync_limits['*'] = threading.BoundedSemaphore(self.max_concurrency)
+            if route not in self._sync_limits:
+                self._sync_limits[route] = threading.BoundedSemaphore(self._route_limit(route))
+            return self._sync_limits['*'], self._sync_limits[route]
+
+    def _async_semaphores(self, route: str):
+        # asyncio primitives belong to one loop; start over if the loop changed.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._async_loop is not loop:
+                self._async_loop = loop
+                self._async_limits = {'*': asyncio.Semaphore(self.max_concurrency)}
+            if route not in self._async_limits:
+                self._async_limits[route] = asyncio.Semaphore(self._route_limit(route))
+            return self._async_limits['*'], self._async_limits[route]
+
+    def _count(self, route: str, field: str):
+        with self._lock:
+            counters = self._stats.setdefault(route, {
+                'calls': 0, 'cache_hits': 0, 'in_flight': 0, 'timeouts': 0, 'rejected': 0, 'errors': 0,
+                'short_circuited': 0})
+            counters[field] += 1
+
+    def _in_flight(self, route: str, delta: int):
+        with self._lock:
+            self._stats[route]['in_flight'] += delta
+
+    # ------------------------------------------------------------------
+    # calls
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _request(prompt: str, model: str, max_tokens: int, temperature, timeout: float) -> dict:
+        params = {
+            'model': model,
+            'messages': [{"role": "user", "content": prompt}],
+            'max_tokens': max_tokens,
+            'timeout': timeout,
+        }
+        if temperature is not None:
+            params['temperature'] = temperature
+        return params
+
+    def _prepare(self, route: str, prompt: str, max_tokens: int, temperature, validate=None):
+        """Model, cache key and cached text (``None`` on a miss or if ``validate`` rejects it) for a call."""
+        if not llm_configured():
+            raise LLMUnavailable('OpenAI is not configured')
+        model = default_model()
+        key = completion_key(model, prompt, temperature, max_tokens)
+        cache = get_llm_cache()
+        text = cache.get(key) if cache is not None else None
+        self._count(route, 'calls')
+        if text is not None and validate is not None:
+            try:
+                validate(text)
+            except Exception:
+                text = None
+        if text is not None:
+            self._count(route, 'cache_hits')
+        return model, key, text
+
+    @staticmethod
+    def _keep(key: str, model: str, text: str, finish_reason: Optional[str], validate=None):
+        """Cache ``text`` unless it is empty, was cut off at ``max_tokens`` or ``validate`` rejects it."""
+        cache = get_llm_cache()
+        if cache is None or not text or finish_reason == 'length':
+            return
+        if validate is not None:
+            try:
+                validate(text)
+            except Exception:
+                return
+        cache.set(key, model, text)
+
+    def _failed(self, route: str, exc: Exception):
+        self._count(route, 'timeouts' if 'timeout' in type(exc).__name__.lower() else 'errors')
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMUnavailable('LLM deadline passed')
+        return remaining
+
+    @contextlib.contextmanager
+    def _slot(self, route: str, deadline: float):
+        """Hold a global and a route slot, waiting no later than ``deadline``."""
+        global_slot, route_slot = self._sync_semaphores(route)
+        if not global_slot.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._count(route, 'rejected')
+            raise LLMUnavailable('No LLM slot free before the deadline')
+        try:
+            if not route_slot.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self._count(route, 'rejected')
+                raise LLMUnavailable(f'No {route} LLM slot free before the deadline')
+            self._in_flight(route, 1)
+            try:
+                yield
+            finally:
+                self._in_flight(route, -1)
+                route_slot.release()
+        finally:
+            global_slot.release()
+
+    @contextlib.asynccontextmanager
+    async def _aslot(self, route: str, deadline: float):
+        global_slot, route_slot = self._async_semaphores(route)
+        try:
+            await asyncio.wait_for(global_slot.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._count(route, 'rejected')
+            raise LLMUnavailable('No LLM slot free before the deadline')
+        try:
+            try:
+                await asyncio.wait_for(route_slot.acquire(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self._count(route, 'rejected')
+                raise LLMUnavailable(f'No {route} LLM slot free before the deadline')
+            self._in_flight(route, 1)
+            try:
+                yield
+            finally:
+                self._in_flight(route, -1)
+                route_slot.release()
+        finally:
+            global_slot.release()
+
+    def _allow(self, route: str) -> bool:
+        try:
+            return self.breaker.allow()
+        except CircuitOpenError:
+            self._count(route, 'short_circuited')
+            raise
+
+    def complete(self, prompt: str, max_tokens: int, temperature: float = None,
+                 timeout: float = 10, route: str = 'default', validate=None) -> str:
+        """Blocking single-prompt completion within ``timeout`` seconds overall.
+
+        ``validate(text)`` should raise for a reply the caller cannot use; such a
+        reply is returned uncached, so the caller's parse fails and it falls back.
+        """
+        model, key, text = self._prepare(route, prompt, max_tokens, temperature, validate)
+        if text is not None:
+            return text
+        probe = self._allow(route)
+        deadline = time.monotonic() + timeout
+        outcome = None
+        try:
+            with self._slot(route, deadline):
+                remaining = self._remaining(deadline)
+                try:
+                    resp = self._sync_client().chat.completions.create(
+                        **self._request(prompt, model, max_tokens, temperature, remaining))
+                except Exception as exc:
+                    self._failed(route, exc)
+                    outcome = 'failure'
+                    raise
+            outcome = 'success'
+        finally:
+            self.breaker.record(outcome, probe)
+        choice = resp.choices[0]
+        text = (choice.message.content or '').strip()
+        self._keep(key, model, text, getattr(choice, 'finish_reason', None), validate)
+        return text
+
+    async def acomplete(self, prompt: str, max_tokens: int, temperature: float = None,
+                        timeout: float = 10, route: str = 'default', validate=None) -> str:
+        """Async ``complete``."""
+        # The cache is SQLite: look it up and store to it off the event loop.
+        model, key, text = await asyncio.to_thread(self._prepare, route, prompt, max_tokens, temperature, validate)
+        if text is not None:
+            return text
+        probe = self._allow(route)
+        deadline = time.monotonic() + timeout
+        outcome = None
+        try:
+            async with self._aslot(route, deadline):
+                remaining = self._remaining(deadline)
+                try:
+                    resp = await asyncio.wait_for(
+                        self._async_openai().chat.completions.create(
+                            **self._request(prompt, model, max_tokens, temperature, remaining)),
+                        remaining)
+                except asyncio.TimeoutError:
+                    self._count(route, 'timeouts')
+                    outcome = 'failure'
+                    raise LLMUnavailable(f'LLM call exceeded {timeout:g}s')
+                except Exception as exc:
+                    self._failed(route, exc)
+                    outcome = 'failure'
+                    raise
+            outcome = 'success'
+        finally:
+            self.breaker.record(outcome, probe)
+        choice = resp.choices[0]
+        text = (choice.message.content or '').strip()
+        await asyncio.to_thread(self._keep, key, model, text, getattr(choice, 'finish_reason', None), validate)
+        return text
+
+    async def astream(self, prompt: str, max_tokens: int, temperature: float = None,
+                      timeout: float = 30, route: str = 'default', validate=None):
+        """Yield completion text as it arrives; a cached completion is yielded in one piece.
+
+        ``timeout`` bounds the whole stream.  The completion is cached once it
+        finishes, unless it was truncated or ``validate`` rejects it.
+        """
+        model, key, text = await asyncio.to_thread(self._prepare, route, prompt, max_tokens, temperature, validate)
+        if text is not None:
+            yield text
+            return
+        probe = self._allow(route)
+        deadline = time.monotonic() + timeout
+        parts = []
+        finish_reason = None
+        outcome = None
+        try:
+            async with self._aslot(route, deadline):
+                remaining = self._remaining(deadline)
+                try:
+                    stream = await asyncio.wait_for(
+                        self._async_openai().chat.completions.create(
+                            stream=True, **self._request(prompt, model, max_tokens, temperature, remaining)),
+                        remaining)
+                    chunks = stream.__aiter__()
+                    try:
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), self._remaining(deadline))
+                            except StopAsyncIteration:
+                                break
+                            delta = chunk.choices[0].delta.content if chunk.choices else None
+                            if chunk.choices:
+                                finish_reason = getattr(chunk.choices[0], 'finish_reason', None) or finish_reason
+                            if delta:
+                                # The provider is answering: a closed stream after this is not its fault.
+                                outcome = outcome or 'success'
+                                parts.append(delta)
+                                yield delta
+                    finally:
+                        # Hands the HTTP connection back to the pool when the caller stops early.
+                        close = getattr(stream, 'close', None)
+                        if close is not None:
+                            await close()
+                except (asyncio.TimeoutError, LLMUnavailable):
+                    self._count(route, 'timeouts')
+                    outcome = 'failure'
+                    raise LLMUnavailable(f'LLM stream exceeded {timeout:g}s')
+                except Exception as exc:
+                    self._failed(route, exc)
+                    outcome = 'failure'
+                    raise
+            outcome = 'success'
+        finally:
+            self.breaker.record(outcome, probe)
+        await asyncio.to_thread(self._keep, key, model, ''.join(parts).strip(), finish_reason, validate)
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    async def aclose(self):
+        with self._lock:
+            client, self._async_client = self._async_client, None
+        if client is not None:
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'configured': llm_configured(),
+                'max_concurrency': self.max_concurrency,
+                'route_limits': dict(self.route_limits),
+                'max_connections': self.max_connections,
+                'circuit': self.breaker.stats(),
+                'routes': {route: dict(counters) for route, counters in self._stats.items()},
+            }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway(LLM_MAX_CONCURRENCY, LLM_ROUTE_CONCURRENCY, LLM_MAX_CONNECTIONS,
+                                  CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN))
+        return _gateway
+
+
+async def close_gateway():
+    """Release both HTTP pools (called at app shutdown)."""
+    global _gateway
+    with _gateway_lock:
+        gateway, _gateway = _gateway, None
+    if gateway is not None:
+        gateway.close()
+        await gateway.aclose()
+
+
+def llm_gateway_stats() -> dict:
+    return get_gateway().stats()
+
+
+def llm_status() -> dict:
+    """Circuit breaker state plus whether the provider is configured at all."""
+    return {'configured': llm_configured(), 'circuit': get_gateway().breaker.stats()}
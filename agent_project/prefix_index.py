@@ -0,0 +1,334 @@
+"""Daily prefix-sum index for arbitrary date-range totals.
+
+Sales are aggregated once to day grain and stored as running totals, sorted by
+(entity, day).  The total of any measure over [start, end] is then the running
+total at the end minus the one before the start: two binary searches and a
+subtraction, whatever the range, instead of a scan of InvoiceLines.  Totals
+are kept overall and per customer, stock item and salesperson.
+"""
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from engine_frames import (
+    load_dimensions, has_unknown_ids, months_to_dates,
+    top_customers_frame, top_products_frame, salesperson_frame, segmentation_frame,
+    product_monthly_units_frame, empty_customer_metrics,
+)
+
+
+class PrefixMiss(LookupError):
+    """The index cannot answer this call; use the next engine or SQL instead."""
+
+
+_COST_EXPR = "il.Quantity * COALESCE(s.LastCostPrice, si.UnitPrice)"
+
+# Invoices are attributed to one customer and salesperson, so the distinct
+# counts stay additive across the rows of this grain.
+DAILY_SQL = f"""
+SELECT
+  i.InvoiceDate AS [day],
+  i.CustomerID AS customer_id,
+  COALESCE(i.SalespersonPersonID, -1) AS salesperson_id,
+  SUM(il.ExtendedPrice) AS revenue,
+  SUM(il.LineProfit) AS profit,
+  SUM(il.Quantity) AS units,
+  SUM({_COST_EXPR}) AS cogs,
+  COUNT(*) AS lines,
+  COUNT(DISTINCT i.InvoiceID) AS invoices,
+  COUNT(DISTINCT i.OrderID) AS orders
+FROM [Sales].[InvoiceLines] il
+JOIN [Sales].[Invoices] i ON i.InvoiceID = il.InvoiceID
+JOIN [Warehouse].[StockItems] si ON si.StockItemID = il.StockItemID
+LEFT JOIN [Warehouse].[StockItemHoldings] s ON s.StockItemID = si.StockItemID
+WHERE {{where}}
+GROUP BY i.InvoiceDate, i.CustomerID, i.SalespersonPersonID
+"""
+
+ITEM_DAILY_SQL = f"""
+SELECT
+  i.InvoiceDate AS [day],
+  il.StockItemID AS stock_item_id,
+  SUM(il.ExtendedPrice) AS revenue,
+  SUM(il.LineProfit) AS profit,
+  SUM(il.Quantity) AS units,
+  SUM({_COST_EXPR}) AS cogs,
+  COUNT(*) AS lines
+FROM [Sales].[InvoiceLines] il
+JOIN [Sales].[Invoices] i ON i.InvoiceID = il.InvoiceID
+JOIN [Warehouse].[StockItems] si ON si.StockItemID = il.StockItemID
+LEFT JOIN [Warehouse].[StockItemHoldings] s ON s.StockItemID = si.StockItemID
+WHERE {{where}}
+GROUP BY i.InvoiceDate, il.StockItemID
+"""
+
+# Day of every invoice, kept so an invoice moved to another day also
+# refreshes the day it left.
+INVOICE_DAYS_SQL = """
+SELECT i.InvoiceID AS invoice_id, i.InvoiceDate AS [day]
+FROM [Sales].[Invoices] i
+WHERE {where}
+"""
+
+INVOICE_CHUNK = 1000
+
+LINE_MEASURES = ('revenue', 'profit', 'units', 'cogs', 'lines')
+INVOICE_MEASURES = LINE_MEASURES + ('invoices', 'orders')
+
+# Keys pack (entity, day) into one int64; days since 1970 stay far below this.
+_STRIDE = np.int64(1 << 20)
+
+
+def _days(value) -> np.ndarray:
+    """Dates as int64 days since 1970-01-01."""
+    return np.asarray(value, dtype='datetime64[D]').astype(np.int64)
+
+
+def _frame_to_columns(df: pd.DataFrame, entities: tuple, measures: tuple) -> dict:
+    if df.empty:
+        cols = {name: np.empty(0, dtype=np.int64) for name in ('day',) + entities}
+        cols.update({name: np.empty(0, dtype=np.float64) for name in measures})
+        return cols
+    cols = {'day': _days(pd.to_datetime(df['day']).to_numpy())}
+    cols.update({name: df[name].to_numpy(dtype=np.int64) for name in entities})
+    cols.update({name: df[name].to_numpy(dtype=np.float64) for name in measures})
+    return cols
+
+
+def _invoice_days(df: pd.DataFrame) -> dict:
+    days = _days(pd.to_datetime(df['day']).to_numpy())
+    return dict(zip(df['invoice_id'].astype(int).tolist(), days.tolist()))
+
+
+class _PrefixTable:
+    """Day rows of one dimension sorted by (entity, day), with running totals per measure."""
+
+    def __init__(self, entity: np.ndarray, day: np.ndarray, measures: dict):
+        keys = entity.astype(np.int64) * _STRIDE + day
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.entities = np.unique(entity)
+        self.running = {name: np.concatenate([[0.0], np.cumsum(values[order])])
+                        for name, values in measures.items()}
+
+    def bounds(self, entities, start_day, end_day):
+        """Positions of the first row on/after ``start_day`` and the first row after ``end_day``."""
+        entities = np.asarray(entities, dtype=np.int64) * _STRIDE
+        lo = np.searchsorted(self.keys, entities + start_day, side='left')
+        hi = np.searchsorted(self.keys, entities + end_day + 1, side='left')
+        return lo, hi
+
+    def sums(self, entities, start_day, end_day) -> dict:
+        lo, hi = self.bounds(entities, start_day, end_day)
+        # Every measure is money with two decimals or a count, so rounding
+        # removes the float noise of subtracting two large running totals.
+        return {name: np.round(running[hi] - running[lo], 2) for name, running in self.running.items()}
+
+
+class DailyPrefixIndex:
+    """Running daily totals of revenue, profit, units, COGS and counts.
+
+    Args:
+        run_sql: Callable executing a query and returning a DataFrame.
+    """
+
+    def __init__(self, run_sql):
+        self._run_sql = run_sql
+        self._state = None
+        self._load_lock = threading.Lock()
+        self.loaded_at = None
+        self.refreshed_at = None
+
+    # ------------------------------------------------------------------
+    # loading
+    # ------------------------------------------------------------------
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    @staticmethod
+    def _build_state(daily: dict, items: dict, dims: dict, invoice_day: dict) -> dict:
+        measures = {name: daily[name] for name in INVOICE_MEASURES}
+        return {
+            'daily': daily,
+            'items_daily': items,
+            'dims': dims,
+            'invoice_day': invoice_day,
+            'total': _PrefixTable(np.zeros(len(daily['day']), dtype=np.int64), daily['day'], measures),
+            'customer_id': _PrefixTable(daily['customer_id'], daily['day'], measures),
+            'salesperson_id': _PrefixTable(daily['salesperson_id'], daily['day'], measures),
+            'stock_item_id': _PrefixTable(items['stock_item_id'], items['day'],
+                                          {name: items[name] for name in LINE_MEASURES}),
+        }
+
+    def _fetch(self, where: str):
+        daily = _frame_to_columns(self._run_sql(DAILY_SQL.format(where=where)),
+                                  ('customer_id', 'salesperson_id'), INVOICE_MEASURES)
+        items = _frame_to_columns(self._run_sql(ITEM_DAILY_SQL.format(where=where)),
+                                  ('stock_item_id',), LINE_MEASURES)
+        return daily, items
+
+    def load(self) -> int:
+        """(Re)build the whole index. Returns the number of customer-day rows."""
+        with self._load_lock:
+            dims = load_dimensions(self._run_sql)
+            daily, items = self._fetch('1 = 1')
+            invoice_day = _invoice_days(self._run_sql(INVOICE_DAYS_SQL.format(where='1 = 1')))
+            self._state = self._build_state(daily, items, dims, invoice_day)
+            self.loaded_at = self.refreshed_at = datetime.utcnow()
+            return len(daily['day'])
+
+    def apply_changes(self, changes: dict) -> int:
+        """Re-aggregate the days touched by a change-capture delta. Returns the number of days rebuilt.
+
+        Both the current day of each changed invoice and the day the index last
+        saw it on are rebuilt, so re-dated and deleted invoices leave no stale totals.
+        """
+        invoice_ids = set()
+        for table in ('Sales.Invoices', 'Sales.InvoiceLines'):
+            df = changes.get(table)
+            if df is not None and not df.empty:
+                invoice_ids.update(int(i) for i in df['InvoiceID'].dropna())
+        if not invoice_ids or not self.ready:
+            return 0
+        ids = sorted(invoice_ids)
+        current = {}
+        for pos in range(0, len(ids), INVOICE_CHUNK):
+            chunk = ",".join(str(i) for i in ids[pos:pos + INVOICE_CHUNK])
+            current.update(_invoice_days(self._run_sql(INVOICE_DAYS_SQL.format(where=f'i.InvoiceID IN ({chunk})'))))
+        previous = self._state['invoice_day']
+        days = set(current.values()) | {previous[i] for i in ids if i in previous}
+        if not days:
+            return 0
+        touched = np.array(sorted(days), dtype=np.int64)
+        in_list = ",".join(f"'{np.datetime64(int(d), 'D')}'" for d in touched)
+        fresh_daily, fresh_items = self._fetch(f"i.InvoiceDate IN ({in_list})")
+        with self._load_lock:
+            state = self._state
+            dims = state['dims']
+            if has_unknown_ids(dims, fresh_daily['customer_id'], fresh_items['stock_item_id']):
+                dims = load_dimensions(self._run_sql)
+            merged = []
+            for old, new in ((state['daily'], fresh_daily), (state['items_daily'], fresh_items)):
+                keep = ~np.isin(old['day'], touched)
+                merged.append({name: np.concatenate([old[name][keep], new[name]]) for name in old})
+            invoice_day = {i: d for i, d in state['invoice_day'].items() if i not in invoice_ids}
+            invoice_day.update(current)
+            self._state = self._build_state(merged[0], merged[1], dims, invoice_day)
+            self.refreshed_at = datetime.utcnow()
+        return len(touched)
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            'ready': self.ready,
+            'customer_days': int(len(state['daily']['day'])) if state else 0,
+            'item_days': int(len(state['items_daily']['day'])) if state else 0,
+            'loaded_at': self.loaded_at.isoformat() if self.loaded_at else None,
+            'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None,
+        }
+
+    # ------------------------------------------------------------------
+    # range lookups
+    # ------------------------------------------------------------------
+    def _snapshot(self) -> dict:
+        state = self._state
+        if state is None:
+            raise PrefixMiss('Prefix index not built yet')
+        return state
+
+    @staticmethod
+    def _day_range(start_date: str, end_date: str = None):
+        end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
+        return int(_days(start_date)), int(_days(end_date))
+
+    def totals(self, start_date: str, end_date: str = None, by: str = 'total', entity: int = None) -> dict:
+        """Sums of every measure over [start, end].
+
+        With ``entity`` (or ``by='total'``) returns scalars for that one entity;
+        otherwise returns ``{'ids': ..., measure: array}`` for every entity of
+        ``by`` that has sales in the range.
+        """
+        state = self._snapshot()
+        table = state[by]
+        start, end = self._day_range(start_date, end_date)
+        if by == 'total' or entity is not None:
+            sums = table.sums([0 if entity is None else int(entity)], start, end)
+            return {name: float(values[0]) for name, values in sums.items()}
+        sums = table.sums(table.entities, start, end)
+        active = sums['lines'] > 0
+        return {'ids': table.entities[active], **{name: values[active] for name, values in sums.items()}}
+
+    def _monthly(self, by: str, entity: int, start_date: str, end_date: str = None):
+        """Per-month sums for one entity, keeping only months with sales (like the SQL GROUP BY)."""
+        state = self._snapshot()
+        start, end = self._day_range(start_date, end_date)
+        if start > end:
+            return np.empty(0, dtype='datetime64[M]'), {name: np.empty(0) for name in state[by].running}
+        months = np.arange(np.datetime64(start, 'D').astype('datetime64[M]'),
+                           np.datetime64(end, 'D').astype('datetime64[M]') + 1)
+        month_start = np.maximum(_days(months.astype('datetime64[D]')), start)
+        month_end = np.minimum(_days((months + 1).astype('datetime64[D]')) - 1, end)
+        table = state[by]
+        lo, hi = table.bounds(np.full(len(months), entity), month_start, month_end)
+        sums = {name: np.round(running[hi] - running[lo], 2) for name, running in table.running.items()}
+        active = hi > lo
+        return months[active], {name: values[active] for name, values in sums.items()}
+
+    # ------------------------------------------------------------------
+    # analytics equivalents
+    # ------------------------------------------------------------------
+    def monthly_revenue(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        months, sums = self._monthly('total', 0, start_date, end_date)
+        return pd.DataFrame({'month': months_to_dates(months), 'revenue': sums['revenue']})
+
+    def monthly_cogs(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        months, sums = self._monthly('total', 0, start_date, end_date)
+        return pd.DataFrame({'month': months_to_dates(months), 'cogs': sums['cogs']})
+
+    def top_customers(self, start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> pd.DataFrame:
+        t = self.totals(start_date, end_date, by='customer_id')
+        return top_customers_frame(self._snapshot()['dims'], t['ids'], t['revenue'], t['profit'],
+                                   t['lines'], t['invoices'], limit)
+
+    def top_products(self, start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> pd.DataFrame:
+        t = self.totals(start_date, end_date, by='stock_item_id')
+        return top_products_frame(self._snapshot()['dims'], t['ids'], t['units'], t['revenue'], t['profit'], limit)
+
+    def salesperson_performance(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        t = self.totals(start_date, end_date, by='salesperson_id')
+        return salesperson_frame(self._snapshot()['dims'], t['ids'], t['revenue'], t['profit'],
+                                 t['lines'], t['invoices'])
+
+    def customer_segmentation(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        t = self.totals(start_date, end_date, by='customer_id')
+        return segmentation_frame(self._snapshot()['dims'], t['ids'], t['revenue'], t['lines'], t['invoices'])
+
+    def product_monthly_units(self, stock_item_id: int, start_date: str, end_date: str) -> pd.DataFrame:
+        months, sums = self._monthly('stock_item_id', int(stock_item_id), start_date, end_date)
+        return product_monthly_units_frame(self._snapshot()['dims'], stock_item_id, months, sums['units'])
+
+    def customer_metrics(self, customer_id: int, start_date: str, end_date: str) -> dict:
+        table = self._snapshot()['customer_id']
+        start, end = self._day_range(start_date, end_date)
+        lo, hi = table.bounds([int(customer_id)], start, end)
+        lo, hi = int(lo[0]), int(hi[0])
+        if hi <= lo:
+            return empty_customer_metrics()
+        sums = {name: float(np.round(running[hi] - running[lo], 2)) for name, running in table.running.items()}
+        base = int(customer_id) * int(_STRIDE)
+        return {
+            'revenue': sums['revenue'],
+            'profit': sums['profit'],
+            'invoices': int(sums['invoices']),
+            'orders': int(sums['orders']),
+            'avg_line_value': sums['revenue'] / sums['lines'],
+            'first_purchase': pd.Timestamp(np.datetime64(int(table.keys[lo]) - base, 'D')).date(),
+            'last_purchase': pd.Timestamp(np.datetime64(int(table.keys[hi - 1]) - base, 'D')).date(),
+        }
+
+    def customer_monthly_sales(self, customer_id: int, start_date: str, end_date: str) -> pd.DataFrame:
+        months, sums = self._monthly('customer_id', int(customer_id), start_date, end_date)
+        return pd.DataFrame({'month': months_to_dates(months), 'revenue': sums['revenue'], 'profit': sums['profit']})
@@ -0,0 +1,262 @@
+"""Token-budgeted prompts for the analysis LLM calls.
+
+Raw CSV rows and ``describe()`` tables cost many input tokens and say little the
+model cannot get from a few precomputed facts.  Prompts are built from compact
+statistics (totals, trend, extremes, largest moves) first; low-value columns
+(ids, constants, empty) are dropped; sample rows and context are only added
+while the prompt stays within its token budget.  Tokens are counted with
+``tiktoken`` when it is installed, otherwise estimated at four characters per token.
+"""
+import json
+import math
+import os
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except Exception:
+    HAS_TIKTOKEN = False
+
+
+SUMMARY_PROMPT_TOKEN_BUDGET = int(os.getenv('SUMMARY_PROMPT_TOKEN_BUDGET', '1200'))
+INSIGHT_PROMPT_TOKEN_BUDGET = int(os.getenv('INSIGHT_PROMPT_TOKEN_BUDGET', '900'))
+
+_encoders = {}
+
+
+def _encoder(model: str):
+    if model not in _encoders:
+        try:
+            _encoders[model] = tiktoken.encoding_for_model(model)
+        except Exception:
+            _encoders[model] = tiktoken.get_encoding('cl100k_base')
+    return _encoders[model]
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """Prompt tokens of ``text`` for ``model`` (estimated when tiktoken is missing)."""
+    if not text:
+        return 0
+    if HAS_TIKTOKEN:
+        try:
+            return len(_encoder(model or os.getenv('OPENAI_MODEL', 'gpt-4o-mini')).encode(text))
+        except Exception:
+            pass
+    return math.ceil(len(text) / 4)
+
+
+# ----------------------------------------------------------------------
+# data compaction
+# ----------------------------------------------------------------------
+def _is_id_column(name: str) -> bool:
+    return name.endswith('ID') or name.endswith('Id') or name.lower().endswith('_id') or name.lower() == 'id'
+
+
+def prune_columns(df: pd.DataFrame):
+    """Drop empty, constant and id columns. Returns ``(frame, dropped_names)``."""
+    dropped = []
+    for col in df.columns:
+        series = df[col]
+        if series.isna().all():
+            dropped.append(col)
+        elif len(df) > 1 and series.nunique(dropna=True) <= 1:
+            dropped.append(col)
+        elif _is_id_column(str(col)) and pd.api.types.is_numeric_dtype(series):
+            dropped.append(col)
+    return df.drop(columns=dropped), dropped
+
+
+def _label_column(df: pd.DataFrame) -> Optional[str]:
+    """Column that names each row (a month/date, otherwise the first text column)."""
+    for col in df.columns:
+        if 'month' in str(col).lower() or 'date' in str(col).lower():
+            return col
+    for col in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            return col
+    return None
+
+
+def _fmt(value) -> str:
+    if isinstance(value, (pd.Timestamp,)) or hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, (float, np.floating)):
+        return f"{value:,.2f}" if abs(value) < 100 else f"{value:,.0f}"
+    return str(value)
+
+
+def rank_columns(df: pd.DataFrame, question: str) -> List:
+    """Numeric columns, most useful first: named in the question, then by relative spread (std / |mean|)."""
+    asked = set(re.findall(r'[a-z0-9]+', (question or '').lower()))
+
+    def score(col):
+        words = re.findall(r'[a-z0-9]+', re.sub(r'([a-z])([A-Z])', r'\1 \2', str(col)).lower())
+        mentioned = any(w in asked or w + 's' in asked or w.rstrip('s') in asked for w in words)
+        values = df[col].to_numpy(dtype=float)
+        values = values[~np.isnan(values)]
+        spread = 0.0
+        if len(values) > 1:
+            mean = abs(values.mean())
+            spread = values.std() / mean if mean else float(values.std() > 0)
+        return (not mentioned, -spread)
+
+    return sorted(df.select_dtypes(include=['number']).columns, key=score)
+
+
+def compact_stats(df: pd.DataFrame, columns: List = None) -> List[str]:
+    """A range line, then one line per numeric column (or ``columns``): total, mean, change, extremes, largest step."""
+    label = _label_column(df)
+    frame = df.sort_values(label) if label and 'month' in str(label).lower() else df
+    labels = frame[label].tolist() if label else list(range(1, len(frame) + 1))
+    lines = [f"{len(frame)} rows" + (f", {label} {_fmt(labels[0])} to {_fmt(labels[-1])}" if label and labels else '')]
+    for col in (frame.select_dtypes(include=['number']).columns if columns is None else columns):
+        values = frame[col].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            continue
+        data = values[valid]
+        names = [labels[i] for i in np.flatnonzero(valid)]
+        parts = [f"total {_fmt(data.sum())}", f"mean {_fmt(data.mean())}"]
+        if len(data) > 1:
+            first, last = data[0], data[-1]
+            change = f" ({(last - first) / abs(first) * 100:+.1f}%)" if first else ''
+            parts.append(f"first {_fmt(first)} -> last {_fmt(last)}{change}")
+            parts.append(f"min {_fmt(data.min())} at {_fmt(names[int(data.argmin())])}")
+            parts.append(f"max {_fmt(data.max())} at {_fmt(names[int(data.argmax())])}")
+            steps = np.diff(data)
+            jump = int(np.abs(steps).argmax())
+            parts.append(f"largest step {_fmt(steps[jump])} into {_fmt(names[jump + 1])}")
+        lines.append(f"{col}: " + ", ".join(parts))
+    return lines
+
+
+def _fit_rows(header: str, rows: List[str], budget: int) -> int:
+    """How many leading rows fit in ``budget`` tokens together with ``header``."""
+    lo, hi = 0, len(rows)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(header + '\n'.join(rows[:mid])) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _truncate(text: str, budget: int) -> str:
+    """Cut ``text`` to roughly ``budget`` tokens."""
+    if count_tokens(text) <= budget:
+        return text
+    keep = max(0, budget * 4 - 3)
+    while keep > 0 and count_tokens(text[:keep] + '...') > budget:
+        keep = int(keep * 0.9)
+    return text[:keep] + '...' if keep else ''
+
+
+# ----------------------------------------------------------------------
+# prompts
+# ----------------------------------------------------------------------
+SUMMARY_INSTRUCTIONS = """Provide a concise analysis (4-6 sentences) including:
+- Key trends or patterns
+- Notable changes or anomalies
+- Business implications
+- Specific numbers where relevant"""
+
+
+def build_summary_prompt(df: pd.DataFrame, question: str, max_rows: int = 12,
+                         context: Optional[str] = None, budget: int = None) -> str:
+    """Analysis prompt for ``df`` within ``budget`` tokens: stats first, then context, then sample rows.
+
+    When the statistics alone exceed the budget, the least useful columns
+    (see ``rank_columns``) are left out.
+    """
+    budget = SUMMARY_PROMPT_TOKEN_BUDGET if budget is None else budget
+    frame, dropped = prune_columns(df)
+    head = "You are a sales analyst. Analyze this data and answer the question.\n\n"
+    tail = f"\n\nQuestion: {question}\n\n{SUMMARY_INSTRUCTIONS}"
+    ranked = rank_columns(frame, question)
+    stat_lines = compact_stats(frame, ranked)
+    kept = _fit_rows(f"{head}Key statistics:\n{stat_lines[0]}\n", stat_lines[1:], budget - count_tokens(tail) - 15)
+    if kept < len(stat_lines) - 1:
+        # Keep the surviving columns in table order and say how many were left out.
+        keep = set(ranked[:kept])
+        dropped = dropped + list(ranked[kept:])
+        stat_lines = compact_stats(frame, [col for col in frame.columns if col in keep])
+        stat_lines.append(f"({len(ranked) - kept} less relevant numeric columns omitted)")
+        frame = frame.drop(columns=ranked[kept:])
+    stats = '\n'.join(stat_lines)
+    required = f"{head}Key statistics:\n{stats}{tail}"
+    used = count_tokens(required)
+
+    context_block = ''
+    if context:
+        context_block = _truncate(context, max(0, budget - used - 20))
+        context_block = f"\nAdditional business context:\n{context_block}\n" if context_block else ''
+        used += count_tokens(context_block)
+
+    sample_block, rows_kept = '', 0
+    rows = frame.head(max_rows).to_csv(index=False, float_format='%.2f').strip().split('\n') if not frame.empty else []
+    if len(rows) > 1:
+        header = f"\nSample rows:\n{rows[0]}\n"
+        rows_kept = _fit_rows(header, rows[1:], budget - used)
+        if rows_kept:
+            sample_block = header + '\n'.join(rows[1:1 + rows_kept]) + '\n'
+
+    prompt = (f"{head}Key statistics:\n{stats}\n{sample_block}{context_block}\n"
+              f"Question: {question}\n\n{SUMMARY_INSTRUCTIONS}")
+    tokens = count_tokens(prompt)
+    print(f"[INFO] Summary prompt: {tokens} tokens (budget {budget}), "
+          f"{rows_kept}/{min(max_rows, len(frame))} sample rows, dropped columns: {', '.join(map(str, dropped)) or 'none'}")
+    return prompt
+
+
+def _compact_value(value):
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {k: _compact_value(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_compact_value(v) for v in value]
+    return value
+
+
+def build_insight_prompt(customer_name: str, metrics: Dict, monthly: List[Dict],
+                         top_products: List[Dict], budget: int = None) -> str:
+    """Customer narrative prompt with compact JSON, dropping the oldest months and smallest products to fit."""
+    budget = INSIGHT_PROMPT_TOKEN_BUDGET if budget is None else budget
+    monthly = _compact_value(list(monthly[-12:]))
+    top_products = _compact_value(list(top_products[:5]))
+    metrics = _compact_value(dict(metrics))
+
+    def render() -> str:
+        payload = {'customer_name': customer_name, 'metrics': metrics,
+                   'monthly': monthly, 'top_products': top_products}
+        return f"""You are a senior PepsiCo sales strategist.
+Summarize the customer's performance using the JSON data block.
+Highlight revenue, profit, trends, and product contribution.
+Return strictly JSON with:
+{{
+  "insight": "3 sentences (<=90 words) referencing concrete numbers and months.",
+  "highlights": ["short bullet with a number", "another highlight"]
+}}
+
+Data:
+{json.dumps(payload, separators=(',', ':'), default=str)}
+"""
+
+    prompt = render()
+    tokens = count_tokens(prompt)
+    while tokens > budget and (len(monthly) > 3 or len(top_products) > 1):
+        if len(monthly) > 3:
+            monthly = monthly[1:]
+        else:
+            top_products = top_products[:-1]
+        prompt = render()
+        tokens = count_tokens(prompt)
+    print(f"[INFO] Insight prompt: {tokens} tokens (budget {budget}), "
+          f"{len(monthly)} months, {len(top_products)} products")
+    return prompt
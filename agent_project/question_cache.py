@@ -0,0 +1,172 @@
+"""Near-duplicate question cache for ``/api/ask``.
+
+Users phrase the same request many ways ("how did ROI trend", "ROI trend over
+period?").  Questions are normalized (lowercased, punctuation and filler words
+dropped, simple suffix stemming) and turned into sparse vectors of word and
+character-trigram counts.  A new question reuses a recent answer for the same
+scope (date range and chart options) when its cosine similarity to a cached
+question reaches ``QUESTION_CACHE_THRESHOLD``.  Similar wording is not enough
+when the questions differ in a number ("top 5" / "top 10") or a negation or
+polarity word ("churned" / "did not churn", "best" / "worst"); those never match.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+QUESTION_CACHE_ENABLED = os.getenv('QUESTION_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+QUESTION_CACHE_THRESHOLD = float(os.getenv('QUESTION_CACHE_THRESHOLD', '0.9'))
+QUESTION_CACHE_TTL = float(os.getenv('QUESTION_CACHE_TTL', '900'))
+QUESTION_CACHE_MAXSIZE = int(os.getenv('QUESTION_CACHE_MAXSIZE', '512'))
+
+# Words that carry no meaning for the analysis: the date range is part of the scope.
+STOPWORDS = frozenset("""
+a an the of in on at for to from by with over across during within about and or
+is are was were be been being do does did has have had can could would should will
+how what which when why show me tell give us our my i we you please
+period time range data overall total so far this that these those it its
+""".split())
+
+# Words that flip or narrow the meaning: questions must agree on all of them.
+POLARITY_WORDS = frozenset("""
+not no never none without nor bottom worst least lowest fewest
+""".split())
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def _stem(token: str) -> str:
+    for suffix in ('ing', 'ed', 'es', 's'):
+        if len(token) > len(suffix) + 2 and token.endswith(suffix) and not token.endswith('ss'):
+            return token[:-len(suffix)]
+    return token
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a question: stemmed content words in their original order."""
+    tokens = _TOKEN.findall((question or '').lower().replace("n't", ' not'))
+    return ' '.join(t if t in POLARITY_WORDS else _stem(t) for t in tokens if t not in STOPWORDS)
+
+
+def question_signature(normalized: str) -> tuple:
+    """Numbers and polarity words of a normalized question; near-duplicates must share it."""
+    words = normalized.split()
+    return (tuple(sorted(w for w in words if w.isdigit())),
+            tuple(sorted({w for w in words if w in POLARITY_WORDS})))
+
+
+def question_vector(normalized: str) -> dict:
+    """L2-normalized counts of words and in-word character trigrams."""
+    counts = Counter()
+    for word in normalized.split():
+        counts['w:' + word] += 1
+        padded = f'#{word}#'
+        for i in range(len(padded) - 2):
+            counts['c:' + padded[i:i + 3]] += 0.5
+    norm = math.sqrt(sum(v * v for v in counts.values()))
+    return {k: v / norm for k, v in counts.items()} if norm else {}
+
+
+def cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+class QuestionCache:
+    """Recent answers per scope, matched by exact normal form first, then similarity.
+
+    Args:
+        threshold: Minimum cosine similarity for a near-duplicate hit.
+        ttl: Seconds an answer stays reusable.
+        maxsize: Answers kept across all scopes (least recently used dropped first).
+    """
+
+    def __init__(self, threshold: float = 0.9, ttl: float = 900.0, maxsize: int = 512):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'exact_hits': 0, 'similar_hits': 0, 'misses': 0}
+
+    def lookup(self, question: str, scope: tuple):
+        """Return ``(answer, matched_question)`` for a recent equivalent question, else ``None``."""
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((scope, normalized))
+            if entry is not None and entry['expires_at'] > now:
+                self._entries.move_to_end((scope, normalized))
+                self._stats['exact_hits'] += 1
+                return entry['answer'], entry['question']
+            vector = question_vector(normalized)
+            signature = question_signature(normalized)
+            best_key, best_score = None, self.threshold
+            for key, entry in self._entries.items():
+                if key[0] != scope or entry['expires_at'] <= now or entry['signature'] != signature:
+                    continue
+                score = cosine(vector, entry['vector'])
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._stats['similar_hits'] += 1
+            entry = self._entries[best_key]
+            return entry['answer'], entry['question']
+
+    def store(self, question: str, scope: tuple, answer: dict):
+        normalized = normalize_question(question)
+        if not normalized:
+            return
+        with self._lock:
+            self._entries[(scope, normalized)] = {
+                'question': question,
+                'vector': question_vector(normalized),
+                'signature': question_signature(normalized),
+                'answer': answer,
+                'expires_at': time.monotonic() + self.ttl,
+            }
+            self._entries.move_to_end((scope, normalized))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize,
+                    'threshold': self.threshold, **self._stats}
+
+
+_questions = QuestionCache(QUESTION_CACHE_THRESHOLD, QUESTION_CACHE_TTL, QUESTION_CACHE_MAXSIZE)
+
+
+def lookup_answer(question: str, scope: tuple):
+    if not QUESTION_CACHE_ENABLED:
+        return None
+    return _questions.lookup(question, scope)
+
+
+def store_answer(question: str, scope: tuple, answer: dict):
+    if QUESTION_CACHE_ENABLED:
+        _questions.store(question, scope, answer)
+
+
+def invalidate_answers() -> int:
+    return _questions.invalidate()
+
+
+def question_cache_stats() -> dict:
+    return {'enabled': QUESTION_CACHE_ENABLED, **_questions.stats()}
@@ -0,0 +1,249 @@
+"""In-process columnar replica of the invoice-line fact table.
+
+WideWorldImporters holds ~229k invoice lines, small enough to keep in memory
+as NumPy column arrays.  The replica loads them once, applies change-capture
+deltas (see ``change_capture.py``) through ``apply_changes()`` and answers the
+analytics queries with vectorized group-bys, returning the same columns as the
+SQL versions in ``analytics.py``.
+
+Methods raise ``ReplicaMiss`` (a ``LookupError``) when they cannot answer, e.g.
+before the first load has finished; callers then fall back to SQL.
+"""
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from engine_frames import (
+    load_dimensions, has_unknown_ids, group_sums, distinct_per_group, months_to_dates,
+    top_customers_frame, top_products_frame, salesperson_frame, segmentation_frame,
+    product_monthly_units_frame, customer_top_products_frame, empty_customer_metrics,
+)
+
+
+class ReplicaMiss(LookupError):
+    """The replica cannot answer this call; use the SQL path instead."""
+
+
+FACT_COLUMNS = (
+    'line_id', 'invoice_id', 'order_id', 'invoice_date', 'customer_id',
+    'stock_item_id', 'salesperson_id', 'quantity', 'extended_price', 'line_profit',
+)
+
+LINES_SQL = """
+SELECT
+  il.InvoiceLineID AS line_id,
+  il.InvoiceID AS invoice_id,
+  COALESCE(i.OrderID, -1) AS order_id,
+  i.InvoiceDate AS invoice_date,
+  i.CustomerID AS customer_id,
+  il.StockItemID AS stock_item_id,
+  COALESCE(i.SalespersonPersonID, -1) AS salesperson_id,
+  il.Quantity AS quantity,
+  il.ExtendedPrice AS extended_price,
+  il.LineProfit AS line_profit
+FROM [Sales].[InvoiceLines] il
+JOIN [Sales].[Invoices] i ON i.InvoiceID = il.InvoiceID
+WHERE {where}
+ORDER BY il.InvoiceLineID
+"""
+
+# Invoices re-read per delta query; keeps the IN list well under SQL Server's limits.
+INVOICE_CHUNK = 1000
+
+def _frame_to_columns(df: pd.DataFrame) -> dict:
+    return {
+        'line_id': df['line_id'].to_numpy(dtype=np.int64),
+        'invoice_id': df['invoice_id'].to_numpy(dtype=np.int64),
+        'order_id': df['order_id'].to_numpy(dtype=np.int64),
+        'invoice_date': pd.to_datetime(df['invoice_date']).to_numpy().astype('datetime64[D]'),
+        'customer_id': df['customer_id'].to_numpy(dtype=np.int64),
+        'stock_item_id': df['stock_item_id'].to_numpy(dtype=np.int64),
+        'salesperson_id': df['salesperson_id'].to_numpy(dtype=np.int64),
+        'quantity': df['quantity'].to_numpy(dtype=np.float64),
+        'extended_price': df['extended_price'].to_numpy(dtype=np.float64),
+        'line_profit': df['line_profit'].to_numpy(dtype=np.float64),
+    }
+
+
+def _empty_columns() -> dict:
+    cols = {name: np.empty(0, dtype=np.int64) for name in FACT_COLUMNS}
+    cols['invoice_date'] = np.empty(0, dtype='datetime64[D]')
+    for name in ('quantity', 'extended_price', 'line_profit'):
+        cols[name] = np.empty(0, dtype=np.float64)
+    return cols
+
+
+class InvoiceLineReplica:
+    """Columnar copy of Sales.InvoiceLines joined to Sales.Invoices.
+
+    Args:
+        run_sql: Callable executing a query and returning a DataFrame.
+    """
+
+    def __init__(self, run_sql):
+        self._run_sql = run_sql
+        self._cols = None
+        self._dims = None
+        self._load_lock = threading.Lock()
+        self.loaded_at = None
+        self.refreshed_at = None
+
+    # ------------------------------------------------------------------
+    # loading
+    # ------------------------------------------------------------------
+    @property
+    def ready(self) -> bool:
+        return self._cols is not None
+
+    def load(self) -> int:
+        """(Re)load the whole fact table and dimensions. Returns the number of lines."""
+        with self._load_lock:
+            dims = load_dimensions(self._run_sql)
+            df = self._run_sql(LINES_SQL.format(where='1 = 1'))
+            cols = _frame_to_columns(df) if not df.empty else _empty_columns()
+            # Swap whole references so readers always see a consistent snapshot.
+            self._dims = dims
+            self._cols = cols
+            self.loaded_at = self.refreshed_at = datetime.utcnow()
+            return len(cols['line_id'])
+
+    def apply_changes(self, changes: dict) -> int:
+        """Re-read the lines of every invoice touched by a change-capture delta.
+
+        ``changes`` maps table names to delta frames.  Lines of affected invoices
+        are replaced wholesale, which covers inserts, edits and removed lines.
+        Returns the number of lines written.
+        """
+        invoice_ids = set()
+        for table in ('Sales.Invoices', 'Sales.InvoiceLines'):
+            df = changes.get(table)
+            if df is not None and not df.empty:
+                invoice_ids.update(int(i) for i in df['InvoiceID'].dropna())
+        if not invoice_ids or not self.ready:
+            return 0
+        ids = sorted(invoice_ids)
+        frames = []
+        for pos in range(0, len(ids), INVOICE_CHUNK):
+            chunk = ",".join(str(i) for i in ids[pos:pos + INVOICE_CHUNK])
+            frames.append(self._run_sql(LINES_SQL.format(where=f'il.InvoiceID IN ({chunk})')))
+        fresh = pd.concat(frames, ignore_index=True)
+        with self._load_lock:
+            cols, dims = self._cols, self._dims
+            new = _frame_to_columns(fresh) if not fresh.empty else _empty_columns()
+            keep = ~np.isin(cols['invoice_id'], np.asarray(ids, dtype=np.int64))
+            if has_unknown_ids(dims, new['customer_id'], new['stock_item_id']):
+                self._dims = load_dimensions(self._run_sql)
+            self._cols = {name: np.concatenate([cols[name][keep], new[name]]) for name in FACT_COLUMNS}
+            self.refreshed_at = datetime.utcnow()
+        return len(new['line_id'])
+
+    def stats(self) -> dict:
+        cols = self._cols
+        return {
+            'ready': self.ready,
+            'lines': int(len(cols['line_id'])) if cols else 0,
+            'loaded_at': self.loaded_at.isoformat() if self.loaded_at else None,
+            'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None,
+        }
+
+    # ------------------------------------------------------------------
+    # helpers
+    # ------------------------------------------------------------------
+    def _snapshot(self):
+        cols, dims = self._cols, self._dims
+        if cols is None or dims is None:
+            raise ReplicaMiss('Replica not loaded yet')
+        return cols, dims
+
+    def _select(self, start_date: str, end_date: str = None, **equals):
+        cols, dims = self._snapshot()
+        end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
+        dates = cols['invoice_date']
+        mask = (dates >= np.datetime64(start_date, 'D')) & (dates <= np.datetime64(end_date, 'D'))
+        for name, value in equals.items():
+            mask &= cols[name] == int(value)
+        return {name: arr[mask] for name, arr in cols.items()}, dims
+
+    # ------------------------------------------------------------------
+    # analytics equivalents
+    # ------------------------------------------------------------------
+    def monthly_revenue(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        sel, _ = self._select(start_date, end_date)
+        months, _, (revenue,) = group_sums(sel['invoice_date'].astype('datetime64[M]'), sel['extended_price'])
+        return pd.DataFrame({'month': months_to_dates(months), 'revenue': revenue})
+
+    def monthly_cogs(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        sel, dims = self._select(start_date, end_date)
+        item_ids, item_index = np.unique(sel['stock_item_id'], return_inverse=True)
+        cost = np.array([dims['item_cost'].get(int(i), 0.0) for i in item_ids], dtype=np.float64)
+        unit_cost = cost[item_index]
+        months, _, (cogs,) = group_sums(sel['invoice_date'].astype('datetime64[M]'), sel['quantity'] * unit_cost)
+        return pd.DataFrame({'month': months_to_dates(months), 'cogs': cogs})
+
+    def top_customers(self, start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> pd.DataFrame:
+        sel, dims = self._select(start_date, end_date)
+        ids, inverse, (revenue, profit, lines) = group_sums(
+            sel['customer_id'], sel['extended_price'], sel['line_profit'], np.ones(len(sel['customer_id'])))
+        invoices = distinct_per_group(inverse, sel['invoice_id'], len(ids))
+        return top_customers_frame(dims, ids, revenue, profit, lines, invoices, limit)
+
+    def top_products(self, start_date: str = '2023-01-01', end_date: str = None, limit: int = 10) -> pd.DataFrame:
+        sel, dims = self._select(start_date, end_date)
+        ids, _, (units, revenue, profit) = group_sums(
+            sel['stock_item_id'], sel['quantity'], sel['extended_price'], sel['line_profit'])
+        return top_products_frame(dims, ids, units, revenue, profit, limit)
+
+    def salesperson_performance(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        sel, dims = self._select(start_date, end_date)
+        ids, inverse, (revenue, profit, lines) = group_sums(
+            sel['salesperson_id'], sel['extended_price'], sel['line_profit'], np.ones(len(sel['salesperson_id'])))
+        invoices = distinct_per_group(inverse, sel['invoice_id'], len(ids))
+        return salesperson_frame(dims, ids, revenue, profit, lines, invoices)
+
+    def customer_segmentation(self, start_date: str = '2023-01-01', end_date: str = None) -> pd.DataFrame:
+        sel, dims = self._select(start_date, end_date)
+        ids, inverse, (spent, lines) = group_sums(
+            sel['customer_id'], sel['extended_price'], np.ones(len(sel['customer_id'])))
+        purchases = distinct_per_group(inverse, sel['invoice_id'], len(ids))
+        return segmentation_frame(dims, ids, spent, lines, purchases)
+
+    def product_monthly_units(self, stock_item_id: int, start_date: str, end_date: str) -> pd.DataFrame:
+        sel, dims = self._select(start_date, end_date, stock_item_id=stock_item_id)
+        months, _, (units,) = group_sums(sel['invoice_date'].astype('datetime64[M]'), sel['quantity'])
+        return product_monthly_units_frame(dims, stock_item_id, months, units)
+
+    def customer_metrics(self, customer_id: int, start_date: str, end_date: str) -> dict:
+        sel, _ = self._select(start_date, end_date, customer_id=customer_id)
+        if len(sel['line_id']) == 0:
+            return empty_customer_metrics()
+        orders = sel['order_id'][sel['order_id'] >= 0]
+        return {
+            'revenue': float(sel['extended_price'].sum()),
+            'profit': float(sel['line_profit'].sum()),
+            'invoices': int(len(np.unique(sel['invoice_id']))),
+            'orders': int(len(np.unique(orders))),
+            'avg_line_value': float(sel['extended_price'].mean()),
+            'first_purchase': pd.Timestamp(sel['invoice_date'].min()).date(),
+            'last_purchase': pd.Timestamp(sel['invoice_date'].max()).date(),
+        }
+
+    def customer_monthly_sales(self, customer_id: int, start_date: str, end_date: str) -> pd.DataFrame:
+        sel, _ = self._select(start_date, end_date, customer_id=customer_id)
+        months, _, (revenue, profit) = group_sums(
+            sel['invoice_date'].astype('datetime64[M]'), sel['extended_price'], sel['line_profit'])
+        return pd.DataFrame({'month': months_to_dates(months), 'revenue': revenue, 'profit': profit})
+
+    def customer_top_products(self, customer_id: int, start_date: str, end_date: str, limit: int = 5) -> pd.DataFrame:
+        sel, dims = self._select(start_date, end_date, customer_id=customer_id)
+        item_ids, _, (units, revenue, profit) = group_sums(
+            sel['stock_item_id'], sel['quantity'], sel['extended_price'], sel['line_profit'])
+        return customer_top_products_frame(dims, item_ids, units, revenue, profit, limit)
+
+    def customer_profile(self, customer_id: int, start_date: str, end_date: str, limit: int = 5) -> tuple:
+        return (
+            self.customer_metrics(customer_id, start_date, end_date),
+            self.customer_monthly_sales(customer_id, start_date, end_date),
+            self.customer_top_products(customer_id, start_date, end_date, limit),
+        )
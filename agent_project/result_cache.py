@@ -0,0 +1,341 @@
+"""In-process TTL + LRU memoization for analytics queries.
+
+The dashboard re-requests the same date ranges over historical data that does
+not change, so identical calls are answered from memory.  Entries are keyed on
+the function name plus its normalized arguments, expire after a per-function
+TTL and are evicted least-recently-used once the cache is full.
+"""
+import copy
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+class TTLCache:
+    """Size-bounded LRU where every entry carries its own expiry."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self.evictions = 0
+
+    def _count(self, namespace: str, field: str):
+        counters = self._counters.setdefault(namespace, {'hits': 0, 'misses': 0})
+        counters[field] += 1
+
+    def get(self, key: tuple):
+        """Return ``(True, value)`` on a fresh hit, ``(False, None)`` otherwise."""
+        namespace = key[0]
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._count(namespace, 'hits')
+                    return True, value
+                del self._data[key]
+            self._count(namespace, 'misses')
+            return False, None
+
+    def set(self, key: tuple, value, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, namespace: str = None) -> int:
+        """Drop every entry, or only those of one function. Returns the number removed."""
+        with self._lock:
+            if namespace is None:
+                removed = len(self._data)
+                self._data.clear()
+                return removed
+            keys = [k for k in self._data if k[0] == namespace]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            functions = {}
+            for name, counters in self._counters.items():
+                total = counters['hits'] + counters['misses']
+                functions[name] = {
+                    **counters,
+                    'hit_rate': round(counters['hits'] / total, 4) if total else 0.0,
+                }
+            for key in self._data:
+                functions.setdefault(key[0], {'hits': 0, 'misses': 0, 'hit_rate': 0.0})
+                functions[key[0]]['entries'] = functions[key[0]].get('entries', 0) + 1
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'evictions': self.evictions,
+                'functions': functions,
+            }
+
+
+CACHE_ENABLED = os.getenv('ANALYTICS_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+DEFAULT_TTL = float(os.getenv('ANALYTICS_CACHE_TTL', '900'))
+
+_cache = TTLCache(maxsize=int(os.getenv('ANALYTICS_CACHE_MAXSIZE', '256')))
+
+
+def _normalize(name: str, value):
+    if isinstance(value, str):
+        value = value.strip()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None and name.endswith('_date'):
+        # Analytics functions treat a missing end date as "today".
+        value = datetime.utcnow().strftime('%Y-%m-%d')
+    if isinstance(value, (list, tuple)):
+        value = tuple(_normalize(name, v) for v in value)
+    return value
+
+
+def make_key(fn, args: tuple, kwargs: dict) -> tuple:
+    bound = inspect.signature(fn).bind(*args, **kwargs)
+    bound.apply_defaults()
+    normalized = tuple((name, _normalize(name, value)) for name, value in bound.arguments.items())
+    return (fn.__name__, normalized)
+
+
+def _copy_value(value):
+    """Hand out copies so callers mutating a result cannot corrupt the cache."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy_value(v) for v in value)
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+def cached(ttl: float = None):
+    """Memoize a function's results in the shared analytics cache for ``ttl`` seconds."""
+    def decorator(fn):
+        entry_ttl = DEFAULT_TTL if ttl is None else ttl
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not CACHE_ENABLED:
+                return fn(*args, **kwargs)
+            key = make_key(fn, args, kwargs)
+            found, value = _cache.get(key)
+            if found:
+                return _copy_value(value)
+            value = fn(*args, **kwargs)
+            _cache.set(key, _copy_value(value), entry_ttl)
+            return value
+
+        wrapper.cache_ttl = entry_ttl
+        return wrapper
+    return decorator
+
+
+class MonthlySeriesCache:
+    """Month-grained series stored per (function, entity), answering sub-ranges locally.
+
+    A request is split into whole calendar months inside the range and partial
+    months at its edges.  Whole months already held (and not expired) are sliced
+    from memory; missing whole months are fetched as contiguous spans and kept;
+    partial edge months are always fetched because a month-level row cannot be
+    cut down to a few days.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self.months_served = 0
+        self.months_fetched = 0
+
+    @staticmethod
+    def _plan(start_date, end_date):
+        start = pd.Timestamp(start_date).normalize()
+        end = pd.Timestamp(end_date or datetime.utcnow().strftime('%Y-%m-%d')).normalize()
+        full, partial = [], []
+        if start > end:
+            return full, partial, start, end
+        for month in pd.period_range(start.to_period('M'), end.to_period('M'), freq='M'):
+            month_start = month.start_time.normalize()
+            month_end = month.end_time.normalize()
+            if start <= month_start and end >= month_end:
+                full.append(month)
+            else:
+                partial.append((max(start, month_start), min(end, month_end)))
+        return full, partial, start, end
+
+    @staticmethod
+    def _month_periods(frame: pd.DataFrame) -> pd.Series:
+        return pd.to_datetime(frame['month']).dt.to_period('M')
+
+    def resolve(self, requests: list, fetch, ttl: float) -> list:
+        """Answer several ``(key, start_date, end_date)`` requests at once.
+
+        ``fetch`` receives a list of ``(request_index, span_start, span_end)``
+        tuples for everything that must come from the database and returns one
+        DataFrame per span, in order; it is not called when nothing is missing.
+        Returns one DataFrame per request, sorted by month.
+        """
+        now = time.monotonic()
+        plans = []
+        spans = []
+        for index, (key, start_date, end_date) in enumerate(requests):
+            full, partial, start, end = self._plan(start_date, end_date)
+            if start > end:
+                spans.append((index, start, end, None))
+                plans.append((key, []))
+                continue
+            with self._lock:
+                entry = self._series.get(key)
+                covered = entry['covered'] if entry else {}
+                missing = [m for m in full if covered.get(m, 0) <= now]
+                if entry is not None:
+                    self._series.move_to_end(key)
+                self.months_served += len(full) - len(missing)
+                self.months_fetched += len(missing)
+            run = []
+            for month in missing + [None]:
+                if run and (month is None or month != run[-1] + 1):
+                    spans.append((index, run[0].start_time.normalize(), run[-1].end_time.normalize(), list(run)))
+                    run = []
+                if month is not None:
+                    run.append(month)
+            for span_start, span_end in partial:
+                spans.append((index, span_start, span_end, None))
+            plans.append((key, full))
+
+        fetched = fetch([(index, s.strftime('%Y-%m-%d'), e.strftime('%Y-%m-%d')) for index, s, e, _ in spans]) if spans else []
+
+        extras = {index: [] for index in range(len(requests))}
+        columns = {}
+        with self._lock:
+            for (index, _, _, months), frame in zip(spans, fetched):
+                columns.setdefault(index, list(frame.columns))
+                if months is None:
+                    extras[index].append(frame)
+                    continue
+                key = plans[index][0]
+                entry = self._series.get(key)
+                if entry is None:
+                    entry = {'frame': frame.iloc[0:0], 'covered': {}}
+                    self._series[key] = entry
+                stored = entry['frame']
+                if not stored.empty:
+                    stored = stored[~self._month_periods(stored).isin(months)]
+                entry['frame'] = pd.concat([stored, frame], ignore_index=True) if not stored.empty else frame.copy()
+                expires_at = time.monotonic() + ttl
+                for month in months:
+                    entry['covered'][month] = expires_at
+                self._series.move_to_end(key)
+            while len(self._series) > self.maxsize:
+                self._series.popitem(last=False)
+
+            results = []
+            for index, (key, full) in enumerate(plans):
+                parts = []
+                entry = self._series.get(key)
+                if entry is not None and full and not entry['frame'].empty:
+                    stored = entry['frame']
+                    parts.append(stored[self._month_periods(stored).isin(full)])
+                    columns.setdefault(index, list(stored.columns))
+                elif entry is not None:
+                    columns.setdefault(index, list(entry['frame'].columns))
+                parts.extend(extras[index])
+                parts = [p for p in parts if not p.empty]
+                if not parts:
+                    results.append(pd.DataFrame(columns=columns.get(index, ['month'])))
+                    continue
+                frame = pd.concat(parts, ignore_index=True)
+                order = self._month_periods(frame).argsort(kind='stable')
+                results.append(frame.iloc[order].reset_index(drop=True))
+        return results
+
+    def invalidate(self, namespace: str = None) -> int:
+        with self._lock:
+            keys = [k for k in self._series if namespace is None or k[0] == namespace]
+            for k in keys:
+                del self._series[k]
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'series': len(self._series),
+                'maxsize': self.maxsize,
+                'months_served': self.months_served,
+                'months_fetched': self.months_fetched,
+            }
+
+
+_series_cache = MonthlySeriesCache(maxsize=int(os.getenv('ANALYTICS_SERIES_CACHE_MAXSIZE', '1024')))
+
+SERIES_RANGE_ARGS = ('start_date', 'end_date')
+
+
+def series_key(fn, args: tuple, kwargs: dict) -> tuple:
+    """Series cache key: function name plus every argument except the date range."""
+    bound = inspect.signature(fn).bind(*args, **kwargs)
+    bound.apply_defaults()
+    entity = tuple((name, _normalize(name, value)) for name, value in bound.arguments.items()
+                   if name not in SERIES_RANGE_ARGS)
+    return (fn.__name__, entity), bound
+
+
+def resolve_series(requests: list, fetch, ttl: float = None) -> list:
+    """Resolve several month-series requests against the series cache (see ``MonthlySeriesCache.resolve``)."""
+    ttl = DEFAULT_TTL if ttl is None else ttl
+    if not CACHE_ENABLED:
+        spans = [(index, start_date, end_date) for index, (_, start_date, end_date) in enumerate(requests)]
+        return fetch(spans)
+    return _series_cache.resolve(requests, fetch, ttl)
+
+
+def cached_monthly_series(ttl: float = None):
+    """Cache a month-grained series per entity so any sub-range is sliced locally.
+
+    The wrapped function must take ``start_date``/``end_date`` and return a
+    DataFrame with a ``month`` column holding the first day of each month.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key, bound = series_key(fn, args, kwargs)
+            params = dict(bound.arguments)
+
+            def fetch(spans):
+                frames = []
+                for _, span_start, span_end in spans:
+                    frames.append(fn(**{**params, 'start_date': span_start, 'end_date': span_end}))
+                return frames
+
+            return resolve_series([(key, params['start_date'], params['end_date'])], fetch, ttl)[0]
+
+        return wrapper
+    return decorator
+
+
+def invalidate(function: str = None) -> int:
+    """Clear cached results for one function name, or everything when omitted."""
+    return _cache.invalidate(function) + _series_cache.invalidate(function)
+
+
+def cache_stats() -> dict:
+    stats = _cache.stats()
+    stats['series'] = _series_cache.stats()
+    stats['enabled'] = CACHE_ENABLED
+    return stats
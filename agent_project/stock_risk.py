@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Stock-out risk: when does forecast demand use up what is on hand?
+
+Monthly forecasts for the whole catalog (one ``forecasting`` pass) are joined
+to ``Warehouse.StockItemHoldings`` by stock item id.  Cumulative forecast
+demand gives, for every item at once, the day stock falls to the reorder level
+and the day it runs out (demand is spread evenly within each month).  Items
+are ranked by slack: days to stock-out minus the supplier lead time, so the
+ones that will run dry before a new order could arrive come first.
+
+Usage:
+    python stock_risk.py --start 2015-01-01 --end 2016-05-31 --months-ahead 6 --top 25
+"""
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from forecasting import MODELS, item_month_matrix, resolve_model
+
+
+DAYS_PER_MONTH = 365.25 / 12
+
+
+def days_until(levels: np.ndarray, forecast: np.ndarray) -> np.ndarray:
+    """Days until cumulative ``forecast`` demand reaches ``levels`` (0 if already there, NaN past the horizon)."""
+    cumulative = np.cumsum(forecast, axis=1)
+    before = cumulative - forecast
+    reached = (cumulative >= levels[:, None]) & (forecast > 0)
+    month = np.argmax(reached, axis=1)
+    rows = np.arange(len(levels))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        months = month + (levels - before[rows, month]) / forecast[rows, month]
+    months = np.where(reached.any(axis=1), months, np.nan)
+    return np.where(levels <= 0, 0.0, months) * DAYS_PER_MONTH
+
+
+def _dates(as_of: pd.Timestamp, days: np.ndarray) -> list:
+    return [(as_of + pd.Timedelta(days=int(d))).date() if np.isfinite(d) else None for d in days]
+
+
+def project_stockouts(holdings: pd.DataFrame, ids: np.ndarray, forecast: np.ndarray,
+                      as_of: pd.Timestamp) -> pd.DataFrame:
+    """Stock-out and reorder dates for every row of ``holdings``, most urgent first.
+
+    ``forecast`` holds monthly units per item in ``ids`` (sorted) starting at
+    ``as_of``; items without a forecast are treated as having no demand.
+    """
+    item_ids = holdings['StockItemID'].to_numpy(dtype=np.int64)
+    position = np.clip(np.searchsorted(ids, item_ids), 0, max(len(ids) - 1, 0))
+    matched = ids[position] == item_ids if len(ids) else np.zeros(len(item_ids), dtype=bool)
+    demand = np.zeros((len(item_ids), forecast.shape[1]))
+    demand[matched] = np.maximum(np.nan_to_num(forecast[position[matched]]), 0.0)
+
+    on_hand = holdings['QuantityOnHand'].to_numpy(dtype=float)
+    reorder_level = holdings['ReorderLevel'].to_numpy(dtype=float)
+    lead_time = holdings['LeadTimeDays'].fillna(0).to_numpy(dtype=float)
+    to_stockout = days_until(on_hand, demand)
+    to_reorder = days_until(on_hand - reorder_level, demand)
+    slack = to_stockout - lead_time
+
+    status = np.select(
+        [on_hand <= 0, slack <= 0, on_hand <= reorder_level, np.isfinite(to_stockout)],
+        ['out_of_stock', 'stockout_before_resupply', 'reorder_now', 'stockout_within_horizon'],
+        'ok')
+    frame = pd.DataFrame({
+        'StockItemID': item_ids,
+        'StockItemName': holdings['StockItemName'].to_numpy(),
+        'quantity_on_hand': on_hand,
+        'reorder_level': reorder_level,
+        'target_stock_level': holdings['TargetStockLevel'].to_numpy(dtype=float),
+        'lead_time_days': lead_time,
+        'monthly_demand': demand[:, 0] if demand.shape[1] else 0.0,
+        'days_to_reorder': np.round(to_reorder, 1),
+        'reorder_date': _dates(as_of, to_reorder),
+        'days_to_stockout': np.round(to_stockout, 1),
+        'stockout_date': _dates(as_of, to_stockout),
+        'slack_days': np.round(slack, 1),
+        'status': status,
+    })
+    order = np.lexsort((np.nan_to_num(to_reorder, nan=np.inf), np.nan_to_num(slack, nan=np.inf)))
+    return frame.iloc[order].reset_index(drop=True)
+
+
+def stockout_risk(start_date: str = '2015-01-01', end_date: str = None, months_ahead: int = 6,
+                  model: str = None):
+    """Project stock-outs from ``model`` forecasts over ``start_date``..``end_date`` sales.
+
+    Returns ``(frame, as_of)``; the projection starts the month after the latest sales.
+    """
+    from analytics import item_monthly_units, stock_item_holdings
+
+    forecaster = MODELS[resolve_model(model)]
+    end_date = end_date or datetime.utcnow().strftime('%Y-%m-%d')
+    matrix = item_month_matrix(item_monthly_units(start_date, end_date))
+    holdings = stock_item_holdings()
+    if matrix['units'].size:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            forecast = forecaster(matrix['units'], months_ahead)
+        as_of = matrix['months'][-1] + pd.offsets.MonthBegin(1)
+    else:
+        forecast = np.zeros((0, months_ahead))
+        as_of = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+    return project_stockouts(holdings, matrix['ids'], forecast, as_of), as_of
+
+
+def risk_records(frame: pd.DataFrame) -> list:
+    """JSON-ready rows: dates as ISO strings and missing values as ``None``."""
+    records = frame.astype(object).where(frame.notna(), None).to_dict(orient='records')
+    for row in records:
+        for key in ('reorder_date', 'stockout_date'):
+            if row[key] is not None:
+                row[key] = row[key].isoformat()
+    return records
+
+
+def main():
+    p = argparse.ArgumentParser(description='Project stock-out dates from demand forecasts and holdings.')
+    p.add_argument('--start', default='2015-01-01')
+    p.add_argument('--end', default=None, help='Last day of sales history (default: today).')
+    p.add_argument('--months-ahead', type=int, default=6)
+    p.add_argument('--model', default=None, help=f"Forecast model: {', '.join(MODELS)}.")
+    p.add_argument('--top', type=int, default=25, help='Rows to print.')
+    p.add_argument('--output', default=None, help='Also write every item to this CSV file.')
+    args = p.parse_args()
+
+    frame, as_of = stockout_risk(args.start, args.end, args.months_ahead, args.model)
+    at_risk = int((frame['status'] != 'ok').sum())
+    print(f"{len(frame)} stock items, {at_risk} at risk within {args.months_ahead} months from {as_of.date()}")
+    print(frame.head(args.top).to_string(index=False))
+    if args.output:
+        frame.to_csv(args.output, index=False)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+"""Shared setup for the DB-free unit tests.
+
+The modules live flat in ``agent_project``; ``pyodbc`` is replaced by a stub
+when the ODBC driver is missing, so nothing here needs a database.
+"""
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LLM_CACHE_ENABLED', '0')
+
+try:
+    import pyodbc  # noqa: F401
+except Exception:
+    stub = types.ModuleType('pyodbc')
+    stub.Error = Exception
+    stub.connect = None
+    sys.modules['pyodbc'] = stub
@@ -0,0 +1,88 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+import agent
+
+
+class FakeGateway:
+    def __init__(self, reply=None, error=None):
+        self.reply, self.error, self.requests = reply, error, []
+
+    def complete(self, **request):
+        self.requests.append(request)
+        if self.error:
+            raise self.error
+        return self.reply
+
+    async def acomplete(self, **request):
+        return self.complete(**request)
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    def install(reply=None, error=None):
+        fake = FakeGateway(reply, error)
+        monkeypatch.setattr(agent, 'llm_configured', lambda: True)
+        monkeypatch.setattr(agent, 'get_gateway', lambda: fake)
+        return fake
+    return install
+
+
+def both(sync_fn, async_fn, *args):
+    return sync_fn(*args), asyncio.run(async_fn(*args))
+
+
+FRAME = pd.DataFrame({'month': pd.date_range('2015-01-01', periods=3, freq='MS'), 'revenue': [1.0, 2.0, 3.0]})
+HISTORY = [{'month': '2016-01', 'units': 5}]
+
+
+def test_summary_variants_agree(gateway):
+    fake = gateway(reply='LLM summary')
+    assert both(agent.summarize_dataframe, agent.summarize_dataframe_async, FRAME, 'q') == ('LLM summary',) * 2
+    assert [r['route'] for r in fake.requests] == ['summary', 'summary']
+
+
+def test_summary_falls_back_on_error(gateway):
+    gateway(error=TimeoutError('slow'))
+    sync, async_ = both(agent.summarize_dataframe, agent.summarize_dataframe_async, FRAME, 'q')
+    assert sync == async_ == agent.analyze_patterns(FRAME, 'q')
+
+
+@pytest.mark.parametrize('reply, error, source', [
+    ('LLM summary', None, 'llm'),
+    ('   ', None, 'fallback'),
+    (None, RuntimeError('circuit open'), 'fallback'),
+])
+def test_summary_reports_its_source(gateway, reply, error, source):
+    gateway(reply=reply, error=error)
+    sync, async_ = (agent.summarize_dataframe(FRAME, 'q', with_source=True),
+                    asyncio.run(agent.summarize_dataframe_async(FRAME, 'q', with_source=True)))
+    assert sync == async_
+    assert sync[1] == source
+    if source == 'fallback':
+        assert sync[0] == agent.analyze_patterns(FRAME, 'q')
+
+
+def test_forecast_variants_agree(gateway):
+    gateway(reply='{"forecast":[{"month":"2016-02","units":7}],"explanation":"e"}')
+    sync, async_ = both(agent.forecast_with_llm, agent.forecast_with_llm_async, HISTORY, 1, 'x')
+    assert sync == async_ == {'forecast': [{'month': '2016-02', 'units': 7.0}], 'explanation': 'e'}
+
+
+def test_forecast_bad_reply_raises_in_both(gateway):
+    gateway(reply='not json')
+    with pytest.raises(RuntimeError):
+        agent.forecast_with_llm(HISTORY, 1)
+    with pytest.raises(RuntimeError):
+        asyncio.run(agent.forecast_with_llm_async(HISTORY, 1))
+
+
+def test_insight_and_email_fallbacks_agree(gateway):
+    gateway(error=RuntimeError('down'))
+    args = ('Acme', {'revenue': 100, 'profit': 10}, [], [])
+    sync, async_ = both(agent.customer_insight_with_llm, agent.customer_insight_with_llm_async, *args)
+    assert sync == async_ == agent._fallback_customer_insight(*args)
+    sync, async_ = both(agent.generate_email_draft, agent.generate_email_draft_async, 'welcome', 'Bob')
+    assert sync == async_ == agent.generate_fallback_email('welcome', 'Bob')
@@ -0,0 +1,131 @@
+import pytest
+
+import llm_gateway
+from llm_gateway import CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_gateway.time, 'monotonic', clock)
+    return clock
+
+
+def call(breaker: CircuitBreaker, outcome: str):
+    breaker.record(outcome, breaker.allow())
+
+
+def tripped(clock) -> CircuitBreaker:
+    breaker = CircuitBreaker(failures=3, cooldown=30)
+    for _ in range(3):
+        call(breaker, 'failure')
+    return breaker
+
+
+def test_opens_after_three_consecutive_failures(clock):
+    breaker = CircuitBreaker(failures=3, cooldown=30)
+    call(breaker, 'failure')
+    call(breaker, 'failure')
+    assert breaker.state == 'closed'
+    call(breaker, 'failure')
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    assert breaker.stats()['trips'] == 1
+    assert breaker.stats()['short_circuited'] == 1
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failures=3, cooldown=30)
+    for outcome in ('failure', 'failure', 'success', 'failure', 'failure'):
+        call(breaker, outcome)
+    assert breaker.state == 'closed'
+
+
+def test_half_open_after_the_cooldown(clock):
+    breaker = tripped(clock)
+    clock.now += 29.9
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    clock.now += 0.1
+    assert breaker.state == 'half_open'
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = tripped(clock)
+    clock.now += 30
+    assert breaker.allow() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    assert breaker.stats()['probes'] == 1
+    breaker.record('success', probe=True)
+    assert breaker.state == 'closed'
+    assert breaker.allow() is False
+
+
+def test_failed_probe_reopens_for_another_cooldown(clock):
+    breaker = tripped(clock)
+    clock.now += 30
+    call(breaker, 'failure')
+    assert breaker.state == 'open'
+    assert breaker.stats()['trips'] == 2
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    clock.now += 1
+    breaker.allow()
+
+
+@pytest.mark.parametrize('setup', ['closed', 'open', 'half_open'])
+def test_record_none_leaves_the_state_unchanged(clock, setup):
+    if setup == 'closed':
+        breaker = CircuitBreaker(failures=3, cooldown=30)
+        call(breaker, 'failure')
+    else:
+        breaker = tripped(clock)
+    probe = False
+    if setup == 'half_open':
+        clock.now += 30
+        probe = breaker.allow()
+    before = breaker.stats()
+    breaker.record(None, probe)
+    after = breaker.stats()
+    assert after['state'] == before['state'] == setup
+    assert after['consecutive_failures'] == before['consecutive_failures']
+    assert after['trips'] == before['trips']
+
+
+def test_record_none_frees_the_probe_slot(clock):
+    breaker = tripped(clock)
+    clock.now += 30
+    breaker.record(None, breaker.allow())
+    breaker.allow()
+    assert breaker.stats()['probes'] == 2
+
+
+@pytest.mark.parametrize('late', ['success', 'failure'])
+def test_late_outcome_of_a_pre_open_call_does_not_decide(clock, late):
+    breaker = CircuitBreaker(failures=3, cooldown=30)
+    slow = breaker.allow()
+    for _ in range(3):
+        call(breaker, 'failure')
+    breaker.record(late, slow)
+    assert breaker.state == 'open'
+    clock.now += 30
+    probe = breaker.allow()
+    breaker.record(late, slow)
+    assert breaker.state == 'half_open'
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record('success', probe)
+    assert breaker.state == 'closed'
+    assert breaker.stats()['trips'] == 1
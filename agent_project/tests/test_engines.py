@@ -0,0 +1,314 @@
+"""The in-process engines against a pandas groupby over the same invoice lines."""
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analytics
+import cube
+import engine_frames
+import prefix_index
+import replica
+import result_cache
+from change_capture import ChangeTracker
+from cube import CubeMiss, SalesCube
+from prefix_index import DailyPrefixIndex
+from replica import InvoiceLineReplica
+
+ALL = '1 = 1'
+
+
+def make_lines(seed: int = 0, invoices: int = 200) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    days = pd.date_range('2015-01-01', '2015-06-30', freq='D')
+    rows, line_id = [], 0
+    for invoice_id in range(1, invoices + 1):
+        day, customer, salesperson = rng.choice(days), int(rng.integers(1, 9)), int(rng.integers(1, 4))
+        for _ in range(int(rng.integers(1, 6))):
+            line_id += 1
+            quantity = int(rng.integers(1, 20))
+            price = round(float(rng.uniform(1, 50)), 2)
+            rows.append({
+                'line_id': line_id, 'invoice_id': invoice_id, 'order_id': 1000 + invoice_id,
+                'invoice_date': pd.Timestamp(day), 'customer_id': customer,
+                'stock_item_id': int(rng.integers(1, 11)), 'salesperson_id': salesperson,
+                'quantity': quantity, 'extended_price': round(quantity * price, 2),
+                'line_profit': round(quantity * price * 0.3, 2),
+            })
+    return pd.DataFrame(rows)
+
+
+def _where(lines: pd.DataFrame, where: str) -> pd.DataFrame:
+    """Apply the WHERE clauses the engines generate: everything, invoice ids, day lists or month ranges."""
+    ids = re.search(r'InvoiceID IN \(([\d,]+)\)', where)
+    if ids:
+        return lines[lines['invoice_id'].isin([int(i) for i in ids.group(1).split(',')])]
+    days = re.search(r'InvoiceDate IN \(([^)]*)\)', where)
+    if days:
+        return lines[lines['invoice_date'].isin(pd.to_datetime(re.findall(r"'([\d-]+)'", days.group(1))))]
+    ranges = re.findall(r"InvoiceDate >= '([\d-]+)' AND i.InvoiceDate < '([\d-]+)'", where)
+    if ranges:
+        keep = np.zeros(len(lines), dtype=bool)
+        for start, end in ranges:
+            keep |= ((lines['invoice_date'] >= start) & (lines['invoice_date'] < end)).to_numpy()
+        return lines[keep]
+    assert where == ALL, where
+    return lines
+
+
+class FakeDatabase:
+    """``run_sql`` answering the engines' queries from a frame of invoice lines, like the SQL would."""
+
+    def __init__(self, lines: pd.DataFrame):
+        self.lines = lines
+        self.cost = pd.Series(2.5, index=range(1, 11))
+
+    def __call__(self, query: str) -> pd.DataFrame:
+        fixed = {
+            engine_frames.CUSTOMERS_SQL: lambda: pd.DataFrame({
+                'CustomerID': range(1, 9), 'CustomerName': [f'Customer {i}' for i in range(1, 9)]}),
+            engine_frames.ITEMS_SQL: lambda: pd.DataFrame({
+                'StockItemID': range(1, 11), 'StockItemName': [f'Item {i}' for i in range(1, 11)],
+                'Brand': None, 'unit_cost': self.cost.to_numpy()}),
+            engine_frames.PEOPLE_SQL: lambda: pd.DataFrame({
+                'PersonID': range(1, 4), 'FullName': [f'Person {i}' for i in range(1, 4)]}),
+        }
+        if query in fixed:
+            return fixed[query]()
+        templates = {
+            replica.LINES_SQL: self._lines,
+            cube.CELLS_SQL: self._cube_cells,
+            cube.INVOICE_CELLS_SQL: self._cube_invoices,
+            cube.INVOICE_MONTHS_SQL: self._invoice_months,
+            prefix_index.DAILY_SQL: self._daily,
+            prefix_index.ITEM_DAILY_SQL: self._item_daily,
+            prefix_index.INVOICE_DAYS_SQL: self._invoice_days,
+        }
+        for template, answer in templates.items():
+            head, tail = template.split('{where}')
+            if query.startswith(head) and query.endswith(tail):
+                return answer(self._frame(query[len(head):len(query) - len(tail)]))
+        raise AssertionError(f'unexpected query: {query}')
+
+    def _frame(self, where: str) -> pd.DataFrame:
+        lines = _where(self.lines, where)
+        return lines.assign(
+            month=lines['invoice_date'].dt.to_period('M').dt.start_time,
+            day=lines['invoice_date'],
+            cogs=lines['quantity'] * lines['stock_item_id'].map(self.cost),
+            revenue=lines['extended_price'], profit=lines['line_profit'], units=lines['quantity'])
+
+    @staticmethod
+    def _lines(lines):
+        return lines[list(replica.FACT_COLUMNS)].sort_values('line_id')
+
+    @staticmethod
+    def _cube_cells(lines):
+        return lines.groupby(['month', 'customer_id', 'stock_item_id', 'salesperson_id'], as_index=False).agg(
+            revenue=('revenue', 'sum'), profit=('profit', 'sum'), quantity=('quantity', 'sum'),
+            line_count=('line_id', 'count'))
+
+    @staticmethod
+    def _cube_invoices(lines):
+        return lines.groupby(['month', 'customer_id', 'salesperson_id'], as_index=False).agg(
+            invoices=('invoice_id', 'nunique'), orders=('order_id', 'nunique'),
+            first_day=('day', 'min'), last_day=('day', 'max'))
+
+    @staticmethod
+    def _invoice_months(lines):
+        return lines.drop_duplicates('invoice_id')[['invoice_id', 'month']]
+
+    @staticmethod
+    def _daily(lines):
+        return lines.groupby(['day', 'customer_id', 'salesperson_id'], as_index=False).agg(
+            revenue=('revenue', 'sum'), profit=('profit', 'sum'), units=('units', 'sum'), cogs=('cogs', 'sum'),
+            lines=('line_id', 'count'), invoices=('invoice_id', 'nunique'), orders=('order_id', 'nunique'))
+
+    @staticmethod
+    def _item_daily(lines):
+        return lines.groupby(['day', 'stock_item_id'], as_index=False).agg(
+            revenue=('revenue', 'sum'), profit=('profit', 'sum'), units=('units', 'sum'), cogs=('cogs', 'sum'),
+            lines=('line_id', 'count'))
+
+    @staticmethod
+    def _invoice_days(lines):
+        return lines.drop_duplicates('invoice_id')[['invoice_id', 'day']]
+
+
+@pytest.fixture(scope='module')
+def lines():
+    return make_lines()
+
+
+@pytest.fixture(scope='module')
+def engines(lines):
+    run_sql = FakeDatabase(lines)
+    built = {'replica': InvoiceLineReplica(run_sql), 'cube': SalesCube(run_sql), 'prefix': DailyPrefixIndex(run_sql)}
+    for engine in built.values():
+        engine.load()
+    return built
+
+
+def window(lines: pd.DataFrame, start: str, end: str) -> pd.DataFrame:
+    return lines[(lines['invoice_date'] >= start) & (lines['invoice_date'] <= end)]
+
+
+def by_month(frame: pd.DataFrame) -> pd.Series:
+    return frame['invoice_date'].dt.to_period('M').dt.start_time.dt.date
+
+
+WHOLE_MONTHS = [('2015-01-01', '2015-06-30'), ('2015-02-01', '2015-04-30'), ('2014-11-01', '2015-03-31')]
+MID_MONTH = [('2015-02-10', '2015-05-20'), ('2015-03-01', '2015-03-15'), ('2015-01-20', '2015-06-30')]
+ALL_ENGINES = ['replica', 'cube', 'prefix']
+DAY_ENGINES = ['replica', 'prefix']
+
+
+def cases():
+    return ([(name, r) for name in ALL_ENGINES for r in WHOLE_MONTHS]
+            + [(name, r) for name in DAY_ENGINES for r in MID_MONTH])
+
+
+@pytest.mark.parametrize('name, dates', cases())
+def test_monthly_revenue_matches_groupby(engines, lines, name, dates):
+    sel = window(lines, *dates)
+    expected = sel.groupby(by_month(sel))['extended_price'].sum()
+    result = engines[name].monthly_revenue(*dates)
+    assert list(result['month']) == list(expected.index)
+    np.testing.assert_allclose(result['revenue'], expected.to_numpy())
+
+
+@pytest.mark.parametrize('name, dates', cases())
+def test_top_products_match_groupby(engines, lines, name, dates):
+    expected = window(lines, *dates).groupby('stock_item_id').agg(
+        units=('quantity', 'sum'), revenue=('extended_price', 'sum'), profit=('line_profit', 'sum'))
+    result = engines[name].top_products(*dates, limit=100).set_index('StockItemID').sort_index()
+    assert list(result.index) == list(expected.index)
+    np.testing.assert_allclose(result['total_units'], expected['units'])
+    np.testing.assert_allclose(result['total_revenue'], expected['revenue'].round(2))
+    np.testing.assert_allclose(result['total_profit'], expected['profit'].round(2))
+
+
+@pytest.mark.parametrize('name, dates', cases())
+def test_top_customers_match_groupby(engines, lines, name, dates):
+    expected = window(lines, *dates).groupby('customer_id').agg(
+        revenue=('extended_price', 'sum'), invoices=('invoice_id', 'nunique'))
+    result = engines[name].top_customers(*dates, limit=100).set_index('CustomerID').sort_index()
+    assert list(result.index) == list(expected.index)
+    np.testing.assert_allclose(result['total_revenue'], expected['revenue'])
+    assert list(result['order_count']) == list(expected['invoices'])
+
+
+@pytest.mark.parametrize('name, dates', cases())
+def test_salesperson_performance_matches_groupby(engines, lines, name, dates):
+    expected = window(lines, *dates).groupby('salesperson_id').agg(
+        revenue=('extended_price', 'sum'), invoices=('invoice_id', 'nunique'))
+    result = engines[name].salesperson_performance(*dates).set_index('salesperson').sort_index()
+    assert list(result.index) == [f'Person {i}' for i in expected.index]
+    np.testing.assert_allclose(result['total_revenue'], expected['revenue'].round(2))
+    assert list(result['total_invoices']) == list(expected['invoices'])
+
+
+@pytest.mark.parametrize('name, dates', cases())
+def test_customer_monthly_sales_and_metrics_match_groupby(engines, lines, name, dates):
+    sel = window(lines, *dates)
+    sel = sel[sel['customer_id'] == 3]
+    expected = sel.groupby(by_month(sel)).agg(revenue=('extended_price', 'sum'), profit=('line_profit', 'sum'))
+    monthly = engines[name].customer_monthly_sales(3, *dates)
+    assert list(monthly['month']) == list(expected.index)
+    np.testing.assert_allclose(monthly['revenue'], expected['revenue'])
+    np.testing.assert_allclose(monthly['profit'], expected['profit'])
+
+    metrics = engines[name].customer_metrics(3, *dates)
+    assert metrics['revenue'] == pytest.approx(sel['extended_price'].sum())
+    assert metrics['invoices'] == sel['invoice_id'].nunique()
+    assert metrics['first_purchase'] == sel['invoice_date'].min().date()
+    assert metrics['last_purchase'] == sel['invoice_date'].max().date()
+
+
+@pytest.mark.parametrize('dates', MID_MONTH)
+def test_cube_refuses_ranges_cutting_through_a_month(engines, dates):
+    with pytest.raises(CubeMiss):
+        engines['cube'].monthly_revenue(*dates)
+
+
+def test_local_result_falls_back_past_a_cube_miss(engines, lines, monkeypatch):
+    monkeypatch.setattr(analytics, 'get_local_engines', lambda: [engines['cube'], engines['prefix']])
+    found, result = analytics._local_result('top_products', '2015-02-10', '2015-05-20', limit=100)
+    assert found
+    pd.testing.assert_frame_equal(result, engines['prefix'].top_products('2015-02-10', '2015-05-20', limit=100))
+    sel = window(lines, '2015-02-10', '2015-05-20')
+    assert result['total_units'].sum() == sel['quantity'].sum()
+
+
+def test_unloaded_engines_fall_back_to_sql(lines, monkeypatch):
+    run_sql = FakeDatabase(lines)
+    cold = [SalesCube(run_sql), DailyPrefixIndex(run_sql), InvoiceLineReplica(run_sql)]
+    monkeypatch.setattr(analytics, 'get_local_engines', lambda: cold)
+    assert analytics._local_result('monthly_revenue', '2015-01-01', '2015-06-30') == (False, None)
+
+    @analytics.served_locally
+    def monthly_revenue(start_date, end_date=None):
+        return 'sql'
+
+    assert monthly_revenue('2015-01-01', '2015-06-30') == 'sql'
+
+
+@pytest.mark.parametrize('name', ALL_ENGINES)
+def test_apply_changes_refreshes_the_period_a_redated_invoice_left(lines, name):
+    database = FakeDatabase(lines.copy())
+    engine = {'replica': InvoiceLineReplica, 'cube': SalesCube, 'prefix': DailyPrefixIndex}[name](database)
+    engine.load()
+    moved = int(lines.loc[lines['invoice_date'].dt.month == 2, 'invoice_id'].iloc[0])
+    dropped = int(lines.loc[lines['invoice_date'].dt.month == 3, 'invoice_id'].iloc[0])
+    edited = database.lines.copy()
+    edited.loc[edited['invoice_id'] == moved, 'invoice_date'] = pd.Timestamp('2015-05-15')
+    database.lines = edited[edited['invoice_id'] != dropped]
+    engine.apply_changes({'Sales.Invoices': pd.DataFrame({'InvoiceID': [moved, dropped]})})
+
+    expected = database.lines.groupby(by_month(database.lines))['extended_price'].sum()
+    result = engine.monthly_revenue('2015-01-01', '2015-06-30')
+    assert list(result['month']) == list(expected.index)
+    np.testing.assert_allclose(result['revenue'], expected.to_numpy())
+
+
+class RacingEngine:
+    """An engine whose delta lands while a request reads it: the request runs just before the apply."""
+
+    def __init__(self, engine, request):
+        self.engine, self.request = engine, request
+
+    def apply_changes(self, changes):
+        self.request()
+        return self.engine.apply_changes(changes)
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+
+def test_tick_leaves_no_pre_delta_result_in_the_series_cache(lines, monkeypatch):
+    monkeypatch.setattr(result_cache, 'CACHE_ENABLED', True)
+    monkeypatch.setattr(result_cache, '_cache', result_cache.TTLCache())
+    monkeypatch.setattr(result_cache, '_series_cache', result_cache.MonthlySeriesCache())
+    database = FakeDatabase(lines.copy())
+    engine = InvoiceLineReplica(database)
+    engine.load()
+    racing = RacingEngine(engine, lambda: analytics.monthly_revenue('2015-01-01', '2015-06-30'))
+    monkeypatch.setattr(analytics, 'get_local_engines', lambda: [racing])
+
+    before = analytics.monthly_revenue('2015-01-01', '2015-06-30')
+    moved = int(lines.loc[lines['invoice_date'].dt.month == 2, 'invoice_id'].iloc[0])
+    edited = database.lines.copy()
+    edited.loc[edited['invoice_id'] == moved, 'invoice_date'] = pd.Timestamp('2015-05-15')
+    database.lines = edited
+
+    tracker = ChangeTracker(database, tables=['Sales.Invoices'])
+    tracker._marks = {'Sales.Invoices': (0, '')}
+    monkeypatch.setattr(tracker, '_delta', lambda table: pd.DataFrame({'InvoiceID': [moved]}))
+    analytics._register_change_consumers(tracker, [racing])
+    tracker.tick()
+
+    expected = edited.groupby(by_month(edited))['extended_price'].sum()
+    after = analytics.monthly_revenue('2015-01-01', '2015-06-30')
+    assert not np.allclose(before['revenue'], expected.to_numpy())
+    np.testing.assert_allclose(after['revenue'], expected.to_numpy())
@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+import analytics
+from analytics import FanOutBusy, fan_out, fanout_stats
+
+
+@pytest.fixture
+def two_workers(monkeypatch):
+    monkeypatch.setattr(analytics, 'FANOUT_WORKERS', 2)
+    monkeypatch.setattr(analytics, '_fanout_executor', None)
+    monkeypatch.setattr(analytics, '_fanout_stats', {'in_flight': 0, 'submitted': 0, 'rejected': 0, 'timed_out': 0})
+    yield
+    analytics._fanout_executor.shutdown(wait=True)
+
+
+def test_results_errors_and_order():
+    def fail():
+        raise ValueError('boom')
+
+    results = fan_out({'a': lambda: 1, 'b': fail, 'c': lambda: 3})
+    assert list(results) == ['a', 'b', 'c']
+    assert results['a'] == 1 and results['c'] == 3
+    assert isinstance(results['b'], ValueError)
+
+
+def test_slow_call_times_out_and_is_counted(two_workers):
+    release = threading.Event()
+    started = time.monotonic()
+    results = fan_out({'slow': release.wait, 'fast': lambda: 'ok'}, timeout=0.05)
+    assert time.monotonic() - started < 1
+    assert isinstance(results['slow'], TimeoutError) and results['fast'] == 'ok'
+    assert fanout_stats()['timed_out'] == 1
+    assert fanout_stats()['in_flight'] == 1
+    release.set()
+    analytics._fanout_executor.shutdown(wait=True)
+    assert fanout_stats()['in_flight'] == 0
+
+
+def test_busy_workers_reject_instead_of_queueing(two_workers):
+    release = threading.Event()
+    fan_out({'a': release.wait, 'b': release.wait}, timeout=0)
+    results = fan_out({'c': lambda: 'late'}, timeout=1)
+    assert isinstance(results['c'], FanOutBusy)
+    assert fanout_stats()['rejected'] == 1
+    release.set()
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecasting import SEASON_LENGTH, forecast_matrix, holt_winters, item_month_matrix, linear_blend, seasonal_naive
+
+
+def polyfit_forecast(history: pd.DataFrame, months_ahead: int) -> list:
+    """The original per-item forecast: np.polyfit over months with sales, blended with the recent mean."""
+    history = history.sort_values('month')
+    x = np.arange(len(history))
+    y = history['total_units'].to_numpy(dtype=float)
+    slope, intercept = np.polyfit(x, y, 1) if len(x) >= 2 else (0.0, y[0])
+    recent = history['total_units'].tail(min(6, len(history))).mean()
+    last = history['month'].iloc[-1]
+    out = []
+    for step in range(1, months_ahead + 1):
+        index = len(history) + step - 1
+        out.append(((last + pd.offsets.MonthBegin(step)).normalize(),
+                    max(recent * 0.6, 0.7 * (slope * index + intercept) + 0.3 * recent)))
+    return out
+
+
+def sales(rows) -> pd.DataFrame:
+    """``(item_id, 'YYYY-MM', units)`` tuples as query rows."""
+    return pd.DataFrame([{'month': pd.Timestamp(month + '-01'), 'StockItemID': item,
+                          'StockItemName': f'Item {item}', 'total_units': units}
+                         for item, month, units in rows])
+
+
+def gapped_sales(seed: int = 0, items: int = 40, months: int = 30) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    calendar = pd.date_range('2013-01-01', periods=months, freq='MS').strftime('%Y-%m')
+    rows = []
+    for item in range(1, items + 1):
+        sold = rng.random(months) < rng.uniform(0.2, 0.9)
+        sold[rng.integers(months)] = True
+        base, slope = rng.uniform(5, 200), rng.uniform(-3, 3)
+        rows += [(item, calendar[col], max(1, round(base + slope * col + rng.normal(0, 10))))
+                 for col in np.flatnonzero(sold)]
+    return sales(rows)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('months_ahead', [1, 3, 6])
+def test_linear_blend_matches_polyfit_on_gapped_histories(seed, months_ahead):
+    df = gapped_sales(seed)
+    results = forecast_matrix(item_month_matrix(df), months_ahead, 'linear_blend')
+    assert len(results) == df['StockItemID'].nunique()
+    for result in results:
+        expected = polyfit_forecast(df[df['StockItemID'] == result['stock_item']['id']], months_ahead)
+        assert [entry['month'] for entry in result['forecast']] == [month for month, _ in expected]
+        np.testing.assert_allclose([entry['units'] for entry in result['forecast']],
+                                   [units for _, units in expected], rtol=1e-9, atol=1e-9)
+
+
+def test_single_observation_is_flat_at_its_value():
+    df = sales([(7, '2015-03', 40)])
+    matrix = item_month_matrix(df)
+    assert matrix['units'].shape == (1, 1)
+    [result] = forecast_matrix(matrix, 3, 'linear_blend')
+    assert result['last_month'] == pd.Timestamp('2015-03-01')
+    assert [entry['units'] for entry in result['forecast']] == [40.0, 40.0, 40.0]
+    assert [entry['units'] for entry in result['forecast']] == [u for _, u in polyfit_forecast(df, 3)]
+
+
+def test_item_month_matrix_fills_missing_months_with_nan_and_sums_duplicates():
+    matrix = item_month_matrix(sales([(2, '2015-01', 5), (1, '2015-03', 4), (1, '2015-03', 6), (2, '2015-04', 1)]))
+    assert list(matrix['ids']) == [1, 2]
+    assert matrix['names'] == ['Item 1', 'Item 2']
+    assert list(matrix['months']) == list(pd.date_range('2015-01-01', '2015-04-01', freq='MS'))
+    np.testing.assert_array_equal(matrix['units'], [[np.nan, np.nan, 10, np.nan], [5, np.nan, np.nan, 1]])
+
+
+def test_item_month_matrix_of_no_rows_is_empty():
+    matrix = item_month_matrix(sales([]).reindex(columns=['month', 'StockItemID', 'StockItemName', 'total_units']))
+    assert matrix['units'].shape == (0, 0)
+    assert forecast_matrix(matrix, 3, 'linear_blend') == []
+
+
+def test_all_nan_row_is_skipped():
+    matrix = item_month_matrix(sales([(1, '2015-01', 5), (1, '2015-02', 7), (2, '2015-02', 3)]))
+    matrix['units'][1] = np.nan
+    with np.errstate(invalid='ignore'):
+        assert np.isnan(linear_blend(matrix['units'], 2)[1]).all()
+    results = forecast_matrix(matrix, 2, 'linear_blend')
+    assert [result['stock_item']['id'] for result in results] == [1]
+
+
+def test_months_ahead_one_starts_the_month_after_each_items_last_sale():
+    df = sales([(1, '2015-01', 5), (1, '2015-02', 7), (2, '2015-01', 3), (2, '2015-06', 9)])
+    results = forecast_matrix(item_month_matrix(df), 1, 'linear_blend')
+    assert [[entry['month'] for entry in r['forecast']] for r in results] == [
+        [pd.Timestamp('2015-03-01')], [pd.Timestamp('2015-07-01')]]
+
+
+def seasonal_units(months: int, items: int = 5, seed: int = 0) -> np.ndarray:
+    """Rows of trend plus a yearly cycle plus a little noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(months)
+    level = rng.uniform(50, 150, (items, 1))
+    cycle = rng.uniform(20, 40, (items, 1)) * np.sin(2 * np.pi * t / SEASON_LENGTH + rng.uniform(0, 6, (items, 1)))
+    return level + 0.5 * t + cycle + rng.normal(0, 2, (items, months))
+
+
+def test_holt_winters_beats_linear_blend_on_a_seasonal_series():
+    units = seasonal_units(48)
+    history, actual = units[:, :36], units[:, 36:]
+    hw_error = np.abs(holt_winters(history, 12) - actual).mean()
+    blend_error = np.abs(linear_blend(history, 12) - actual).mean()
+    assert hw_error < 0.5 * blend_error
+
+
+def test_seasonal_naive_repeats_last_year():
+    units = seasonal_units(30)
+    np.testing.assert_array_equal(seasonal_naive(units, 14), units[:, [*range(18, 30), 18, 19]])
+
+
+@pytest.mark.parametrize('months', [1, 6, 11])
+def test_under_a_year_of_history_falls_back_to_linear_blend(months):
+    units = seasonal_units(months)
+    np.testing.assert_array_equal(seasonal_naive(units, 4), linear_blend(units, 4))
+    np.testing.assert_array_equal(holt_winters(units, 4), linear_blend(units, 4))
+
+
+@pytest.mark.parametrize('months', [12, 18, 23])
+def test_under_two_years_of_history_falls_back_to_seasonal_naive(months):
+    units = seasonal_units(months)
+    np.testing.assert_array_equal(holt_winters(units, 4), seasonal_naive(units, 4))
+    assert not np.array_equal(holt_winters(units, 4), linear_blend(units, 4))
+
+
+def test_fallback_is_decided_per_row_by_span_of_sales():
+    units = seasonal_units(36, items=3)
+    units[1, :20] = np.nan   # 16 months of sales: seasonal naive
+    units[2, :30] = np.nan   # 6 months of sales: linear blend
+    with np.errstate(divide='ignore', invalid='ignore'):
+        forecast = holt_winters(units, 6)
+        np.testing.assert_array_equal(forecast[1], seasonal_naive(units[1:2], 6)[0])
+        np.testing.assert_array_equal(forecast[2], linear_blend(units[2:3], 6)[0])
+        np.testing.assert_array_equal(forecast[0], holt_winters(units[:1], 6)[0])
+
+
+@pytest.mark.parametrize('model', [holt_winters, seasonal_naive, linear_blend])
+def test_forecasts_are_never_negative(model):
+    t = np.arange(36)
+    units = np.maximum(0.0, 400 - 15 * t + 60 * np.sin(2 * np.pi * t / SEASON_LENGTH))[None, :]
+    units = np.vstack([units, seasonal_units(36, items=4)])
+    units[units == 0] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        forecast = model(units, 18)
+    assert np.isfinite(forecast).all()
+    assert (forecast >= 0).all()
@@ -0,0 +1,56 @@
+import pytest
+
+from question_cache import QuestionCache, cosine, normalize_question, question_vector
+
+SCOPE = ('2015-01-01', '2016-12-31', 'png')
+
+
+def similarity(a: str, b: str) -> float:
+    return cosine(question_vector(normalize_question(a)), question_vector(normalize_question(b)))
+
+
+def cache_with(question: str) -> QuestionCache:
+    cache = QuestionCache()
+    cache.store(question, SCOPE, {'summary': question})
+    return cache
+
+
+@pytest.mark.parametrize('stored, asked', [
+    ('how did ROI trend', 'ROI trend over the period?'),
+    ('Show revenue and profit trends', 'revenue and profit trend'),
+    ('How is ROI trending?', 'what is the ROI trend'),
+])
+def test_rephrased_question_hits(stored, asked):
+    hit = cache_with(stored).lookup(asked, SCOPE)
+    assert hit is not None and hit[1] == stored
+
+
+@pytest.mark.parametrize('stored, asked', [
+    ('which customers churned', 'which customers did not churn'),
+    ('which customers churned', "which customers didn't churn"),
+    ('top 10 customers', 'top 5 customers'),
+    ('top customers by revenue', 'bottom customers by revenue'),
+    ('best selling products', 'worst selling products'),
+    ('customers with orders', 'customers without orders'),
+    ('products sold most', 'products sold least'),
+])
+def test_number_or_polarity_change_misses(stored, asked):
+    assert cache_with(stored).lookup(asked, SCOPE) is None
+
+
+def test_negation_pair_is_textually_close():
+    # The pair would pass on similarity alone; only the polarity check rejects it.
+    assert similarity('which customers churned', 'which customers did not churn') > 0.85
+
+
+def test_other_scope_misses():
+    assert cache_with('revenue trend').lookup('revenue trend', ('2014-01-01', '2014-12-31', 'png')) is None
+
+
+def test_expired_answer_misses(monkeypatch):
+    cache = QuestionCache(ttl=10)
+    cache.store('revenue trend', SCOPE, {'summary': 'x'})
+    import question_cache
+    now = question_cache.time.monotonic()
+    monkeypatch.setattr(question_cache.time, 'monotonic', lambda: now + 11)
+    assert cache.lookup('revenue trend', SCOPE) is None
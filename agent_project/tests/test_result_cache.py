@@ -0,0 +1,138 @@
+import pandas as pd
+import pytest
+
+import result_cache
+from result_cache import MonthlySeriesCache, TTLCache, cached
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, 'monotonic', clock)
+    return clock
+
+
+def test_ttl_cache_entry_expires(clock):
+    cache = TTLCache()
+    cache.set(('fn', 1), 'value', ttl=10)
+    clock.now += 9.9
+    assert cache.get(('fn', 1)) == (True, 'value')
+    clock.now += 0.2
+    assert cache.get(('fn', 1)) == (False, None)
+    assert cache.stats()['size'] == 0
+    assert cache.stats()['functions']['fn'] == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+
+def test_ttl_cache_evicts_least_recently_used(clock):
+    cache = TTLCache(maxsize=2)
+    cache.set(('fn', 'a'), 1, ttl=60)
+    cache.set(('fn', 'b'), 2, ttl=60)
+    assert cache.get(('fn', 'a')) == (True, 1)
+    cache.set(('fn', 'c'), 3, ttl=60)
+    assert cache.get(('fn', 'b')) == (False, None)
+    assert cache.get(('fn', 'a')) == (True, 1)
+    assert cache.get(('fn', 'c')) == (True, 3)
+    assert cache.evictions == 1
+
+
+def test_ttl_cache_invalidates_one_function():
+    cache = TTLCache()
+    cache.set(('f', 1), 1, ttl=60)
+    cache.set(('g', 1), 2, ttl=60)
+    assert cache.invalidate('f') == 1
+    assert cache.get(('g', 1)) == (True, 2)
+
+
+@pytest.fixture
+def shared_cache(monkeypatch):
+    monkeypatch.setattr(result_cache, 'CACHE_ENABLED', True)
+    monkeypatch.setattr(result_cache, '_cache', TTLCache())
+
+
+def test_cached_dataframes_are_isolated_from_callers(shared_cache):
+    calls = []
+
+    @cached(ttl=60)
+    def revenue(start_date, end_date=None):
+        calls.append((start_date, end_date))
+        return pd.DataFrame({'month': ['2015-01-01'], 'revenue': [100.0]}), {'rows': [1]}
+
+    frame, meta = revenue('2015-01-01', '2015-01-31')
+    frame.loc[0, 'revenue'] = -1
+    meta['rows'].append(2)
+    again, meta_again = revenue(' 2015-01-01', end_date='2015-01-31')
+    assert len(calls) == 1
+    assert again.loc[0, 'revenue'] == 100.0 and meta_again == {'rows': [1]}
+    again.loc[0, 'revenue'] = -2
+    assert revenue('2015-01-01', '2015-01-31')[0].loc[0, 'revenue'] == 100.0
+
+
+def monthly(start, end, value=1.0):
+    months = pd.period_range(pd.Timestamp(start).to_period('M'), pd.Timestamp(end).to_period('M'), freq='M')
+    return pd.DataFrame({'month': [m.start_time for m in months], 'value': value})
+
+
+class Fetcher:
+    def __init__(self):
+        self.spans = []
+
+    def __call__(self, spans):
+        self.spans.append([(start, end) for _, start, end in spans])
+        return [monthly(start, end) for _, start, end in spans]
+
+
+def test_series_cache_fetches_whole_months_once_and_edges_every_time():
+    cache, fetch = MonthlySeriesCache(), Fetcher()
+    first = cache.resolve([('key', '2015-01-01', '2015-04-30')], fetch, ttl=60)[0]
+    assert fetch.spans == [[('2015-01-01', '2015-04-30')]]
+    assert list(first['month']) == list(pd.date_range('2015-01-01', '2015-04-01', freq='MS'))
+
+    second = cache.resolve([('key', '2015-02-01', '2015-03-31')], fetch, ttl=60)[0]
+    assert len(fetch.spans) == 1
+    assert list(second['month']) == [pd.Timestamp('2015-02-01'), pd.Timestamp('2015-03-01')]
+
+    cache.resolve([('key', '2015-01-15', '2015-05-10')], fetch, ttl=60)
+    assert fetch.spans[-1] == [('2015-01-15', '2015-01-31'), ('2015-05-01', '2015-05-10')]
+    assert cache.stats()['months_served'] == 2 + 3
+
+
+def test_series_cache_fetches_only_missing_contiguous_spans():
+    cache, fetch = MonthlySeriesCache(), Fetcher()
+    cache.resolve([('key', '2015-02-01', '2015-02-28'), ('key', '2015-04-01', '2015-04-30')], fetch, ttl=60)
+    cache.resolve([('key', '2015-01-01', '2015-06-30')], fetch, ttl=60)
+    assert fetch.spans[-1] == [('2015-01-01', '2015-01-31'), ('2015-03-01', '2015-03-31'),
+                               ('2015-05-01', '2015-06-30')]
+
+
+def test_series_cache_refetches_expired_months(clock):
+    cache, fetch = MonthlySeriesCache(), Fetcher()
+    cache.resolve([('key', '2015-01-01', '2015-02-28')], fetch, ttl=60)
+    clock.now += 61
+    cache.resolve([('key', '2015-01-01', '2015-02-28')], fetch, ttl=60)
+    assert fetch.spans == [[('2015-01-01', '2015-02-28')]] * 2
+
+
+def test_series_cache_does_not_fetch_when_everything_is_held():
+    cache = MonthlySeriesCache()
+    cache.resolve([('key', '2015-01-01', '2015-03-31')], Fetcher(), ttl=60)
+
+    def fail(spans):
+        raise AssertionError(spans)
+
+    assert len(cache.resolve([('key', '2015-01-01', '2015-03-31')], fail, ttl=60)[0]) == 3
+
+
+def test_series_cache_results_are_copies():
+    cache = MonthlySeriesCache()
+    first = cache.resolve([('key', '2015-01-01', '2015-03-31')], Fetcher(), ttl=60)[0]
+    first.loc[:, 'value'] = -1
+    again = cache.resolve([('key', '2015-01-01', '2015-03-31')], Fetcher(), ttl=60)[0]
+    assert (again['value'] == 1.0).all()
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 """Extract schema metadata from SQL Server and produce DBML and PlantUML files."""
 import argparse
-import pyodbc
 from collections import defaultdict
+from contextlib import contextmanager
+
+import pyodbc
+
+try:
+    from agent_project.db_pool import get_pool, close_all
+except ImportError:
+    get_pool = None
 
 
 TABLES_Q = """
@@ -46,8 +53,19 @@ ORDER BY parent.name;
 """
 
 
+@contextmanager
 def connect(conn_str):
-    return pyodbc.connect(conn_str, autocommit=True)
+    """Yield an autocommit connection, borrowed from the shared pool when available."""
+    if get_pool is None:
+        conn = pyodbc.connect(conn_str, autocommit=True)
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+    pool = get_pool(conn_str, min_size=1, max_size=2, reap_interval=0, autocommit=True)
+    with pool.connection() as conn:
+        yield conn
 
 
 def fetchall_dict(cursor, query):
@@ -123,13 +141,16 @@ def main():
         f"Encrypt={args.encrypt};TrustServerCertificate={args.trust_server_certificate};"
     )
     print('Connecting to database...')
-    conn = connect(conn_str)
-    cur = conn.cursor()
-
-    tables = fetchall_dict(cur, TABLES_Q)
-    cols = fetchall_dict(cur, COLUMNS_Q)
-    pks = fetchall_dict(cur, PK_Q)
-    fks = fetchall_dict(cur, FK_Q)
+    try:
+        with connect(conn_str) as conn:
+            cur = conn.cursor()
+            tables = fetchall_dict(cur, TABLES_Q)
+            cols = fetchall_dict(cur, COLUMNS_Q)
+            pks = fetchall_dict(cur, PK_Q)
+            fks = fetchall_dict(cur, FK_Q)
+    finally:
+        if get_pool is not None:
+            close_all()
 
     pk_map = defaultdict(list)
     for r in pks: